@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Serve /api/generate/ with the non-blocking streaming view under ASGI.
+os.environ.setdefault('DOCGEN_ASYNC_GENERATE', '1')
 
 application = get_asgi_application()
+
+# load the allowed models into Ollama before the first request needs them
+from generator import warmup
+
+warmup.start()
@@ -1,3 +1,5 @@
+import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -29,6 +31,7 @@ INSTALLED_APPS = [
 # ---------------- MIDDLEWARE ----------------
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    "generator.timing.server_timing_middleware",
 
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -38,6 +41,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    "generator.timing.profile_middleware",
 ]
 
 
@@ -64,12 +68,52 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 
 # ---------------- DATABASE ----------------
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (default) or postgres (needs psycopg installed).
+# Connections are kept for DB_CONN_MAX_AGE seconds instead of one per
+# request; health checks drop ones the server closed in the meantime.
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", "60"))
+
+# SQLite: WAL lets readers run while a generation saves; writers take
+# the lock up front (IMMEDIATE) and wait up to SQLITE_BUSY_TIMEOUT
+# seconds for it instead of failing with "database is locked".
+SQLITE_PATH = os.environ.get("SQLITE_PATH", str(BASE_DIR / 'db.sqlite3'))
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", "20"))
+
+if DB_ENGINE == "postgres":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get("POSTGRES_DB", "docgen"),
+            'USER': os.environ.get("POSTGRES_USER", "docgen"),
+            'PASSWORD': os.environ.get("POSTGRES_PASSWORD", ""),
+            'HOST': os.environ.get("POSTGRES_HOST", "localhost"),
+            'PORT': os.environ.get("POSTGRES_PORT", "5432"),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': SQLITE_BUSY_TIMEOUT,
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE};"
+                    f"PRAGMA synchronous={SQLITE_SYNCHRONOUS};"
+                ),
+            },
+            # file-backed test DB so concurrency tests see real locking
+            'TEST': {'NAME': str(BASE_DIR / 'test_db.sqlite3')},
+        }
     }
-}
 
 
 # ---------------- PASSWORD VALIDATION ----------------
@@ -111,7 +155,7 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 CORS_ALLOW_HEADERS = ["*"]
-CORS_EXPOSE_HEADERS = ["X-AI-Warning"]
+CORS_EXPOSE_HEADERS = ["X-AI-Warning", "X-Generation-Cache", "Server-Timing", "X-Profile-Id"]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -124,3 +168,130 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
+
+
+# ---------------- GENERATION ----------------
+# backend/asgi.py switches this on so /api/generate/ uses the async view;
+# under WSGI (runserver, gunicorn) the sync view keeps serving it.
+ASYNC_GENERATION = os.environ.get("DOCGEN_ASYNC_GENERATE", "0") == "1"
+
+# Streaming output is checkpointed to DocHistory.content whenever this much
+# new text has arrived or this many seconds have passed, whichever is first.
+STREAM_CHECKPOINT_CHARS = int(os.environ.get("STREAM_CHECKPOINT_CHARS", "4096"))
+STREAM_CHECKPOINT_SECONDS = float(os.environ.get("STREAM_CHECKPOINT_SECONDS", "5"))
+# After the last client disconnects, a generation keeps running this long
+# so it can be resumed via /generate/<id>/resume/ before it is cancelled.
+STREAM_RESUME_GRACE_SECONDS = float(os.environ.get("STREAM_RESUME_GRACE_SECONDS", "30"))
+
+# ---------------- OLLAMA ----------------
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
+# comma separated Ollama servers (base or /api/generate URLs) to spread
+# generations over; see generator/nodes.py. Defaults to OLLAMA_URL alone.
+OLLAMA_URLS = [url.strip() for url in os.environ.get("OLLAMA_URLS", OLLAMA_URL).split(",") if url.strip()]
+OLLAMA_HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "10"))
+OLLAMA_HEALTH_TIMEOUT = float(os.environ.get("OLLAMA_HEALTH_TIMEOUT", "2"))
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "600"))
+# models a request may ask for; anything else gets OLLAMA_DEFAULT_MODEL
+OLLAMA_ALLOWED_MODELS = [
+    "phi3:latest",
+    "qwen2.5-coder:3b",
+    "qwen2.5-coder:7b",
+]
+OLLAMA_DEFAULT_MODEL = "qwen2.5-coder:3b"
+# keep-alive connections shared by all requests
+OLLAMA_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "16"))
+# generations running per model and node; extra requests wait in a bounded queue
+# (503 "busy" once it is full) and their stream ends with the busy message
+# if OLLAMA_QUEUE_TIMEOUT runs out first
+OLLAMA_MAX_CONCURRENT_PER_MODEL = int(os.environ.get("OLLAMA_MAX_CONCURRENT_PER_MODEL", "4"))
+OLLAMA_MAX_QUEUED_PER_MODEL = int(os.environ.get("OLLAMA_MAX_QUEUED_PER_MODEL", "8"))
+OLLAMA_QUEUE_TIMEOUT = float(os.environ.get("OLLAMA_QUEUE_TIMEOUT", "15"))
+# fair share: queued generations are admitted round-robin across users;
+# one user runs at most this many at once and may queue this many more
+OLLAMA_MAX_RUNNING_PER_USER = int(os.environ.get("OLLAMA_MAX_RUNNING_PER_USER", "2"))
+OLLAMA_MAX_QUEUED_PER_USER = int(os.environ.get("OLLAMA_MAX_QUEUED_PER_USER", "4"))
+
+# ---------------- MODEL WARM-UP ----------------
+# Ollama unloads a model after `keep_alive` without requests and the next
+# request pays the load (seconds for a 7B model). Every generation asks
+# to stay loaded for OLLAMA_KEEP_ALIVE (Ollama durations: "30m", "2h",
+# "-1" = forever), or a per-model value from "model=duration,..." in
+# OLLAMA_KEEP_ALIVE_PER_MODEL. With OLLAMA_WARMUP=1 (off by default) the
+# WSGI/ASGI process loads OLLAMA_WARMUP_MODELS (default: just
+# OLLAMA_DEFAULT_MODEL) on every node at startup and again every
+# OLLAMA_WARMUP_INTERVAL seconds during OLLAMA_WARMUP_HOURS ("8-20",
+# local time; empty = always). Each model warmed takes memory on every
+# node, so list only the ones in regular use.
+# Loads longer than OLLAMA_COLD_START_SECONDS count as cold starts.
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_KEEP_ALIVE_PER_MODEL = dict(
+    item.strip().rsplit("=", 1)
+    for item in os.environ.get("OLLAMA_KEEP_ALIVE_PER_MODEL", "").split(",") if "=" in item
+)
+OLLAMA_WARMUP = os.environ.get("OLLAMA_WARMUP", "0") == "1"
+OLLAMA_WARMUP_MODELS = [m.strip() for m in os.environ.get("OLLAMA_WARMUP_MODELS", "").split(",") if m.strip()]
+OLLAMA_WARMUP_INTERVAL = float(os.environ.get("OLLAMA_WARMUP_INTERVAL", "600"))
+OLLAMA_WARMUP_HOURS = os.environ.get("OLLAMA_WARMUP_HOURS", "")
+OLLAMA_COLD_START_SECONDS = float(os.environ.get("OLLAMA_COLD_START_SECONDS", "1"))
+
+# ---------------- CONNECTIVITY ----------------
+# A background thread re-checks this TCP target every INTERVAL seconds;
+# /generate/ and /status/ only read the cached result.
+CONNECTIVITY_PROBE_HOST = os.environ.get("CONNECTIVITY_PROBE_HOST", "8.8.8.8")
+CONNECTIVITY_PROBE_PORT = int(os.environ.get("CONNECTIVITY_PROBE_PORT", "53"))
+CONNECTIVITY_PROBE_INTERVAL = float(os.environ.get("CONNECTIVITY_PROBE_INTERVAL", "30"))
+CONNECTIVITY_PROBE_TIMEOUT = float(os.environ.get("CONNECTIVITY_PROBE_TIMEOUT", "2"))
+
+# ---------------- WIKIPEDIA CACHE ----------------
+# Lookups are stored in the DB; entries older than the TTL are refetched
+# when online and still served when offline. Least recently used entries
+# are evicted past MAX_ENTRIES.
+WIKIPEDIA_CACHE_TTL = int(os.environ.get("WIKIPEDIA_CACHE_TTL", str(7 * 24 * 3600)))
+# topics without an article (or a failed lookup) are cached this long
+WIKIPEDIA_CACHE_NEGATIVE_TTL = int(os.environ.get("WIKIPEDIA_CACHE_NEGATIVE_TTL", "3600"))
+WIKIPEDIA_CACHE_MAX_ENTRIES = int(os.environ.get("WIKIPEDIA_CACHE_MAX_ENTRIES", "2000"))
+
+# ---------------- GENERATION CACHE ----------------
+# Opt-in replay of earlier answers for the same (model, full prompt).
+# Clients can still send "cache": "bypass" or "refresh" per request.
+GENERATION_CACHE_ENABLED = os.environ.get("GENERATION_CACHE_ENABLED", "0") == "1"
+GENERATION_CACHE_TTL = int(os.environ.get("GENERATION_CACHE_TTL", str(24 * 3600)))
+GENERATION_CACHE_MAX_ENTRIES = int(os.environ.get("GENERATION_CACHE_MAX_ENTRIES", "5000"))
+# replayed answers are re-chunked to roughly this many characters
+GENERATION_CACHE_REPLAY_CHUNK = int(os.environ.get("GENERATION_CACHE_REPLAY_CHUNK", "24"))
+
+# ---------------- HISTORY ----------------
+# history/ pages; list rows carry this many characters of content
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", "200"))
+HISTORY_PREVIEW_CHARS = int(os.environ.get("HISTORY_PREVIEW_CHARS", "160"))
+
+# ---------------- EXPORTS ----------------
+# rendered PDF/DOCX bytes kept in memory per process, keyed by content hash
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# exports are rendered into spooled temp files: in memory up to this size,
+# on disk past it (and then not kept in the render cache)
+EXPORT_SPOOL_MAX_BYTES = int(os.environ.get("EXPORT_SPOOL_MAX_BYTES", str(1024 * 1024)))
+# renders above this many characters go to the export job pool instead
+# of running inside the request; /pdf/ and /docx/ then answer 202 + job
+EXPORT_SYNC_MAX_CHARS = int(os.environ.get("EXPORT_SYNC_MAX_CHARS", "100000"))
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "2"))
+EXPORT_MAX_PENDING = int(os.environ.get("EXPORT_MAX_PENDING", "32"))
+EXPORT_RESULT_TTL = int(os.environ.get("EXPORT_RESULT_TTL", "3600"))
+EXPORT_JOB_DIR = os.environ.get("EXPORT_JOB_DIR", os.path.join(tempfile.gettempdir(), "docgen-exports"))
+# history/export/: most ids per request and documents per merged PDF;
+# ZIPs take any selection and read it from the database this many at a time
+BULK_EXPORT_MAX_DOCS = int(os.environ.get("BULK_EXPORT_MAX_DOCS", "200"))
+
+# ---------------- METRICS ----------------
+# /api/metrics/ serves Prometheus text; set a token to require
+# "Authorization: Bearer <token>" on scrapes.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# ---------------- TIMING ----------------
+# Server-Timing header with the phases of each request (generator/timing.py)
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+# staff requests with ?profile=1 are run under cProfile; the newest
+# PROFILE_KEEP results are kept here for /api/profiles/<id>/
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "docgen-profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
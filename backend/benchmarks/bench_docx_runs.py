@@ -0,0 +1,78 @@
+"""DOCX inline engine: run count, file size and render time of a large
+sample document with the old per-character engine and the current one.
+
+    cd backend && python benchmarks/bench_docx_runs.py [sections]
+"""
+import io
+import os
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django
+
+django.setup()
+
+from generator import docx_generator
+from generator.tests import legacy_apply_inline_format
+
+SECTION = """## Section {n}
+Binary search finds a target in a **sorted** array in `O(log n)` time. It keeps two
+indices and halves the range on every step, so even a million elements need only
+about twenty comparisons. See the [reference](https://example.com/{n}) for details.
+
+- Set `lo = 0` and `hi = n - 1` before the loop starts
+- Compare the *middle* element with the target and move one of the bounds
+- Stop when the range is empty and return -1 to signal a miss
+
+| Case | Time | Notes |
+|------|------|-------|
+| Best | O(1) | target sits exactly in the middle of the array |
+| Worst | O(log n) | target is missing or at one of the ends |
+
+```cpp
+int search(vector<int>& a, int x) {{
+    int lo = 0, hi = a.size() - 1;
+    return -1;
+}}
+```
+"""
+
+
+def sample(sections):
+    return "# Sample\n\n" + "\n".join(SECTION.format(n=n) for n in range(sections))
+
+
+def measure(text):
+    start = time.perf_counter()
+    data = docx_generator.create_docx(text).getvalue()
+    elapsed = time.perf_counter() - start
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        runs = z.read("word/document.xml").count(b"<w:r>")
+    return runs, len(data), elapsed
+
+
+def main():
+    sections = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    text = sample(sections)
+    print(f"sample: {sections} sections, {len(text)} chars")
+
+    current = docx_generator.apply_inline_format
+    results = {}
+    for name, engine in (("before", legacy_apply_inline_format), ("after", current)):
+        docx_generator.apply_inline_format = engine
+        measure(text)  # warm up
+        results[name] = measure(text)
+        runs, size, elapsed = results[name]
+        print(f"{name:7} runs={runs:8d}  size={size / 1024:9.1f} KB  time={elapsed:7.3f}s")
+    docx_generator.apply_inline_format = current
+
+    (b_runs, b_size, b_time), (a_runs, a_size, a_time) = results["before"], results["after"]
+    print(f"ratio   runs={b_runs / a_runs:.1f}x  size={b_size / a_size:.1f}x  time={b_time / a_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
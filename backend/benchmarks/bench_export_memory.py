@@ -0,0 +1,104 @@
+"""Peak memory of concurrent large exports: the old in-memory path
+(BytesIO -> bytes -> render cache -> FileResponse) against the current
+spooled path (render_cache.render_file -> chunked FileResponse).
+
+Each mode runs in its own process so peak RSS is not shared. Every
+worker renders a distinct document, then all responses are held open
+and drained together, like slow clients downloading at the same time.
+
+    cd backend && python benchmarks/bench_export_memory.py [workers] [sections] [pdf|docx]
+
+With DOCGEN_ASYNC_GENERATE=1 the responses are drained the way the ASGI
+server does it (async iteration), which is the default deployment.
+"""
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+MODES = ("buffered", "spooled")
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def drain(resp):
+    if not resp.is_async:
+        return sum(len(chunk) for chunk in resp.streaming_content)
+
+    async def consume():
+        return sum([len(chunk) async for chunk in resp.streaming_content])
+
+    return asyncio.run(consume())
+
+
+def run_mode(mode, workers, sections, fmt):
+    import django
+
+    django.setup()
+
+    from benchmarks.bench_docx_runs import sample
+    from generator import render_cache
+    from generator.views import export_response
+
+    def buffered(text):
+        data = render_cache.RENDERERS[fmt](text).getvalue()
+        render_cache.get_cache().put((render_cache.content_hash(text), fmt), data)
+        return export_response(BytesIO(data), fmt)
+
+    def spooled(text):
+        return export_response(render_cache.render_file(text, fmt), fmt)
+
+    respond = buffered if mode == "buffered" else spooled
+
+    render_cache.RENDERERS[fmt](sample(1))  # import / font warm-up
+    baseline = peak_rss_mb()
+
+    barrier = threading.Barrier(workers)
+    sizes = []
+
+    def worker(n):
+        resp = respond(sample(sections) + f"\n\nCopy {n}")
+        barrier.wait()  # every response is alive at once
+        size = drain(resp)
+        resp.close()
+        sizes.append(size)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{mode:9} peak RSS +{peak_rss_mb() - baseline:7.1f} MB  "
+          f"file {sum(sizes) / len(sizes) / 1024:8.1f} KB  time {elapsed:6.2f}s")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--mode":
+        run_mode(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), sys.argv[5])
+        return
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    sections = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    fmt = sys.argv[3] if len(sys.argv) > 3 else "pdf"
+    print(f"{workers} concurrent {fmt} exports of {sections} sections")
+    for mode in MODES:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode, str(workers), str(sections), fmt],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
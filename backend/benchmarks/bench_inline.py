@@ -0,0 +1,29 @@
+"""Micro-benchmark: single-pass md_inline vs the old multi-pass version.
+
+    cd backend && python benchmarks/bench_inline.py [rounds]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django
+
+django.setup()
+
+from generator.pdf_generator import md_inline
+from generator.tests import INLINE_CORPUS, legacy_md_inline
+
+rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+lines = [line for line in INLINE_CORPUS if line]
+
+results = {}
+for name, fn in (("legacy", legacy_md_inline), ("single-pass", md_inline)):
+    seconds = min(timeit.repeat(lambda: [fn(line) for line in lines], number=rounds, repeat=5))
+    results[name] = seconds
+    per_line = seconds / (rounds * len(lines)) * 1e6
+    print(f"{name:12} {seconds:8.3f}s  {per_line:6.2f} us/line")
+
+print(f"speedup      {results['legacy'] / results['single-pass']:.2f}x")
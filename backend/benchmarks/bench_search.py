@@ -0,0 +1,81 @@
+"""History search latency on a large table.
+
+Builds a throwaway test database (never db.sqlite3), fills it with
+`rows` documents spread over `users` users, and times one user's
+searches through the FTS5 index and through the icontains fallback.
+
+    cd backend && python benchmarks/bench_search.py [rows] [users]
+"""
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+# a few real terms plus a long tail of synthetic ones, drawn with Zipf
+# weights so queries can hit common, rare and missing words
+WORDS = (
+    "array binary search sort heap queue stack pointer vector map hash tree graph "
+    "node edge cache thread mutex lock socket buffer stream parser token lexer "
+    "compiler runtime memory allocator iterator template class struct function"
+).split() + [f"term{n}" for n in range(20000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(WORDS))))
+
+QUERIES = ["binary", "binary search", "mutex lexer", "term900", "term15000", "nosuchword"]
+
+
+def document(rng):
+    words = rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=rng.randint(100, 600))
+    return "\n".join(" ".join(words[i:i + 15]) for i in range(0, len(words), 15))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    import django
+
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment
+
+    from generator.models import DocHistory
+    from generator.search import _fallback_search, has_fts, search_history, search_words
+
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        rng = random.Random(1)
+        owners = User.objects.bulk_create([User(username=f"user{n}") for n in range(users)])
+        start = time.perf_counter()
+        batch = []
+        for n in range(rows):
+            batch.append(DocHistory(user=rng.choice(owners), topic=" ".join(rng.sample(WORDS[:40], 3)), content=document(rng)))
+            if len(batch) == 5000:
+                DocHistory.objects.bulk_create(batch)
+                batch = []
+        DocHistory.objects.bulk_create(batch)
+        print(f"{rows} rows for {users} users loaded in {time.perf_counter() - start:.1f}s (fts: {has_fts()})")
+
+        user = owners[0]
+        for name, fn in (("search", lambda q: search_history(user, q, 20)),
+                         ("icontains", lambda q: _fallback_search(user, search_words(q), 20))):
+            for q in QUERIES:
+                fn(q)
+                start = time.perf_counter()
+                for _ in range(5):
+                    hits = fn(q)
+                ms = (time.perf_counter() - start) / 5 * 1000
+                print(f"{name:10} {q!r:28} {len(hits):3d} hits  {ms:8.2f} ms")
+    finally:
+        runner.teardown_databases(old_config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Deterministic generator of LLM-style Markdown for the benchmarks.
+
+    from benchmarks.corpus import generate
+    text = generate(100 * 1024, "tables")
+
+Profiles weight the block mix the renderers see in real answers:
+"mixed" (default), "tables", "code", "bullets", and "prose" (one line of
+plain sentences, the worst case for detect_input_type).
+"""
+import random
+
+PROFILES = {
+    # heading, paragraph, bullets, table, code
+    "mixed": (2, 4, 3, 2, 2),
+    "tables": (1, 1, 1, 6, 1),
+    "code": (1, 2, 1, 1, 6),
+    "bullets": (1, 1, 6, 1, 1),
+}
+
+TERMS = [
+    "binary search", "hash map", "linked list", "priority queue", "dynamic programming",
+    "two pointers", "sliding window", "adjacency list", "memoization", "recursion",
+    "time complexity", "space complexity", "edge case", "invariant", "iterator",
+]
+TYPES = ["int", "long long", "size_t", "double", "float", "char", "bool", "long"]
+WORDS = (
+    "the algorithm keeps a running value and updates it on every step so that "
+    "each element is visited once while the loop maintains its invariant and "
+    "returns the answer when the range becomes empty for any valid input"
+).split()
+
+
+def sentence(rng):
+    words = rng.sample(WORDS, rng.randint(8, 16))
+    # inline markup at roughly the density LLM answers use
+    r = rng.random()
+    if r < 0.2:
+        words.insert(rng.randrange(len(words)), f"**{rng.choice(TERMS)}**")
+    elif r < 0.35:
+        words.insert(rng.randrange(len(words)), f"`{rng.choice(TYPES)} x`")
+    elif r < 0.45:
+        words.insert(rng.randrange(len(words)), f"*{rng.choice(TERMS)}*")
+    elif r < 0.5:
+        words.insert(rng.randrange(len(words)), f"[{rng.choice(TERMS)}](https://example.com/{rng.randrange(999)})")
+    return " ".join(words).capitalize() + "."
+
+
+def heading(rng, n):
+    return f"{rng.choice(['##', '##', '###'])} {n}. {rng.choice(TERMS).title()}"
+
+
+def paragraph(rng, n):
+    return " ".join(sentence(rng) for _ in range(rng.randint(2, 5)))
+
+
+def bullets(rng, n):
+    return "\n".join(f"- {sentence(rng)}" for _ in range(rng.randint(3, 8)))
+
+
+def table(rng, n):
+    cols = rng.randint(3, 5)
+    head = ["Case"] + [f"Column {c}" for c in range(1, cols)]
+    lines = ["| " + " | ".join(head) + " |", "|" + "---|" * cols]
+    for r in range(rng.randint(4, 12)):
+        cells = [f"`{rng.choice(TYPES)}`"] + [" ".join(rng.sample(WORDS, 4)) for _ in range(cols - 1)]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def code(rng, n):
+    body = [f"{rng.choice(TYPES)} solve_{n}(vector<int>& a, int target) {{"]
+    for i in range(rng.randint(5, 25)):
+        indent = "    " * rng.randint(1, 3)
+        stmt = " ".join(rng.sample(WORDS, rng.randint(3, 12))).replace(" ", "_")
+        body.append(f"{indent}{rng.choice(TYPES)} v{i} = {stmt}(a[{i}], target);")
+    body.append("    return -1;\n}")
+    return "```cpp\n" + "\n".join(body) + "\n```"
+
+
+BLOCKS = (heading, paragraph, bullets, table, code)
+
+
+def generate(size, profile="mixed", seed=0):
+    """About `size` characters of Markdown (never less)."""
+    rng = random.Random(f"{profile}-{size}-{seed}")
+    if profile == "prose":
+        out = []
+        length = 0
+        while length < size:
+            s = sentence(rng).replace("`", "").replace("*", "")
+            out.append(s)
+            length += len(s) + 1
+        return " ".join(out)
+
+    weights = PROFILES[profile]
+    parts = [f"# {rng.choice(TERMS).title()} Documentation"]
+    length = len(parts[0])
+    n = 0
+    while length < size:
+        n += 1
+        block = rng.choices(BLOCKS, weights=weights)[0](rng, n)
+        parts.append(block)
+        length += len(block) + 2
+    return "\n\n".join(parts)
@@ -0,0 +1,201 @@
+"""Stand-in for Ollama's HTTP API, for load tests without a GPU.
+
+POST /api/generate streams NDJSON like the real server: one
+{"response": ...} line per token at --rate tokens/s after --latency
+seconds, then a {"done": true, ...} line with Ollama's timing fields.
+GET /api/tags lists --models (default: the models the backend allows),
+GET /api/ps the ones currently "loaded"; other models are answered with
+404 like Ollama. A request for a model that is not loaded first waits
+--load-time seconds (reported as load_duration), then the model stays
+loaded for the request's keep_alive (default --keep-alive). A request
+without a prompt only loads the model, like Ollama's warm-up call.
+
+    cd backend && python benchmarks/fake_ollama.py --port 11434 --rate 40 --latency 0.3
+
+Run several on different ports to try OLLAMA_URLS routing; tests start
+them in-process with make_server().
+
+Every token is one word ("tok17 "), so a client can count tokens by
+splitting on whitespace. A request's "options.num_predict" overrides
+--tokens.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODELS = ["phi3:latest", "qwen2.5-coder:3b", "qwen2.5-coder:7b"]
+
+
+def duration(value, default):
+    """Seconds from an Ollama keep_alive: a number or "500ms"/"30s"/"5m"/"1h"."""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    for unit, scale in (("ms", 0.001), ("h", 3600), ("m", 60), ("s", 1)):
+        if value.endswith(unit):
+            return float(value[: -len(unit)]) * scale
+    return float(value)
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # chunked bodies, keep-alive like Ollama
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, *args):
+        if self.config.verbose:
+            super().log_message(*args)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def load_model(self, model, keep_alive):
+        """Sleeps --load-time unless `model` is loaded; the seconds spent."""
+        cold = self.server.loaded.get(model, 0) <= time.time()
+        if cold:
+            time.sleep(self.config.load_time)
+        seconds = duration(keep_alive, self.config.keep_alive)
+        self.server.loaded[model] = float("inf") if seconds < 0 else time.time() + seconds
+        return self.config.load_time if cold else 0.0
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json(200, {"models": [{"name": m, "model": m} for m in self.config.models]})
+        elif self.path == "/api/ps":
+            now = time.time()
+            loaded = [m for m, expires in list(self.server.loaded.items()) if expires > now]
+            self.send_json(200, {"models": [{"name": m, "model": m} for m in loaded]})
+        else:
+            self.send_json(200, {"status": "Ollama is running"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": "invalid JSON"})
+            return
+        if self.path != "/api/generate":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        cfg = self.config
+        if random.random() < cfg.error_rate:
+            self.send_json(500, {"error": "simulated failure"})
+            return
+        model = payload.get("model")
+        if model not in cfg.models:
+            self.send_json(404, {"error": f"model '{model}' not found"})
+            return
+
+        start = time.perf_counter()
+        load = self.load_model(model, payload.get("keep_alive"))
+        if not payload.get("prompt"):
+            self.send_json(200, {
+                "model": model,
+                "response": "",
+                "done": True,
+                "done_reason": "load",
+                "total_duration": int((time.perf_counter() - start) * 1e9),
+                "load_duration": int(load * 1e9),
+            })
+            return
+
+        tokens = int((payload.get("options") or {}).get("num_predict") or cfg.tokens)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        try:
+            time.sleep(cfg.latency)
+            first_at = time.perf_counter()
+            interval = 1 / cfg.rate
+            next_at = first_at
+            for i in range(tokens):
+                next_at += interval * random.uniform(1 - cfg.jitter, 1 + cfg.jitter)
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                line = {"model": payload.get("model"), "response": f"tok{i} ", "done": False}
+                self.write_chunk(json.dumps(line).encode() + b"\n")
+            end = time.perf_counter()
+            self.write_chunk(json.dumps({
+                "model": payload.get("model"),
+                "response": "",
+                "done": True,
+                # nanoseconds, like Ollama
+                "total_duration": int((end - start) * 1e9),
+                "load_duration": int(load * 1e9),
+                "eval_count": tokens,
+                "eval_duration": int((end - first_at) * 1e9),
+            }).encode() + b"\n")
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the backend hung up (client went away)
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients dropping keep-alive connections is not worth a traceback
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--rate", type=float, default=30.0, help="tokens per second per stream")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per answer")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative jitter of the token interval")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--models", type=lambda v: v.split(","), default=MODELS, help="comma separated models this server has")
+    parser.add_argument("--load-time", type=float, default=0.0, help="seconds to load a model that is not loaded")
+    parser.add_argument("--keep-alive", type=float, default=300.0, help="seconds a model stays loaded without keep_alive")
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+def make_server(**options):
+    """A server with the command line defaults overridden by `options`
+    (port=0 picks a free port); call serve_forever() in a thread."""
+    config = build_parser().parse_args([])
+    for name, value in options.items():
+        setattr(config, name, value)
+    server = Server((config.host, config.port), FakeOllama)
+    server.config = config
+    server.loaded = {}  # model -> time it drops out of /api/ps
+    return server
+
+
+def main():
+    server = make_server(**vars(build_parser().parse_args()))
+    host, port = server.server_address[:2]
+    print(f"fake Ollama on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
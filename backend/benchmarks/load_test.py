@@ -0,0 +1,206 @@
+"""Load driver for /api/generate/.
+
+Ramps concurrent authenticated users against a running backend and
+reports, per stage, time to first byte (the {"id": ...} head line), time
+to first token (first byte after the head and any {"queue": n} lines, so
+it includes time spent in the scheduler queue), tokens/s per stream and the
+error rate at p50/p95/p99. Point the backend at benchmarks/fake_ollama.py
+to load the Django side without a GPU:
+
+    python benchmarks/fake_ollama.py --port 11500 --rate 40 --latency 0.3
+    OLLAMA_URL=http://127.0.0.1:11500/api/generate uvicorn backend.asgi:application --port 8000
+    python benchmarks/load_test.py --stages 1,4,16,32 --stage-seconds 20
+
+Users loadtest-0..N are registered on first use. Every request sends a
+distinct code snippet (long and free of needs_real_data keywords, so no
+Wikipedia lookup) and "cache": "bypass"; --same-prompt sends one snippet
+to measure single-flight coalescing instead. Tokens are counted as
+whitespace-separated words, which is exact against fake_ollama.
+Errors are non-200 responses (503 busy included), transport failures,
+empty streams and streams that end with the backend's "Model not
+responding" message.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import re
+import time
+
+import httpx
+
+MODEL_ERROR_MARKER = "Model not responding"
+# the {"id": n} head and {"queue": n} lines sent while waiting for a slot
+CONTROL_LINE = re.compile(rb'^\{"(id|queue)": \d+\}\n')
+CONTROL_PREFIX = re.compile(rb'^(\{("([iq][^\n]*)?)?)?$')
+PROMPT = """def merge_sorted_{n}(left, right):
+    out = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if left[i] <= right[j]:
+            out.append(left[i]); i += 1
+        else:
+            out.append(right[j]); j += 1
+    return out + left[i:] + right[j:]
+# run {run} request {n}
+"""
+
+
+def percentile(values, p):
+    """Nearest-rank percentile; None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)), 1) - 1]
+
+
+async def login(client, username, password):
+    # "User exists" on later runs is fine
+    await client.post("register/", json={"username": username, "password": password})
+    r = await client.post("login/", json={"username": username, "password": password})
+    r.raise_for_status()
+    return r.json()["access"]
+
+
+async def one_request(client, token, code, model):
+    result = {"ok": False, "status": None, "ttfb": None, "ttft": None, "tokens": 0, "seconds": None}
+    start = time.perf_counter()
+    try:
+        async with client.stream(
+            "POST", "generate/",
+            json={"code": code, "model": model, "cache": "bypass"},
+            headers={"Authorization": f"Bearer {token}"},
+        ) as r:
+            result["status"] = r.status_code
+            if r.status_code != 200:
+                await r.aread()
+                return result
+            head, body, in_head = b"", b"", True
+            async for chunk in r.aiter_bytes():
+                now = time.perf_counter()
+                if result["ttfb"] is None:
+                    result["ttfb"] = now - start
+                if in_head:
+                    head += chunk
+                    while CONTROL_LINE.match(head):
+                        head = CONTROL_LINE.sub(b"", head, count=1)
+                    if CONTROL_PREFIX.match(head):
+                        continue
+                    chunk, in_head = head, False
+                if chunk and result["ttft"] is None:
+                    result["ttft"] = now - start
+                body += chunk
+        result["seconds"] = time.perf_counter() - start
+        text = body.decode("utf-8", "replace")
+        result["tokens"] = len(text.split())
+        result["ok"] = bool(text.strip()) and MODEL_ERROR_MARKER not in text
+        if not result["ok"]:
+            result["error"] = "model error" if text.strip() else "empty"
+    except httpx.HTTPError as e:
+        result["error"] = type(e).__name__
+    return result
+
+
+async def virtual_user(client, token, prompts, model, deadline, results):
+    while time.perf_counter() < deadline:
+        results.append(await one_request(client, token, next(prompts), model))
+
+
+def summarize(users, results, seconds):
+    ok = [r for r in results if r["ok"]]
+    rates = [
+        r["tokens"] / (r["seconds"] - r["ttft"])
+        for r in ok if r["ttft"] is not None and r["seconds"] > r["ttft"]
+    ]
+    statuses = {}
+    for r in results:
+        if not r["ok"]:
+            key = r.get("error") or str(r["status"])
+            statuses[key] = statuses.get(key, 0) + 1
+    return {
+        "users": users,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+        "error_kinds": statuses,
+        "tokens_per_second_total": sum(r["tokens"] for r in ok) / seconds,
+        **{
+            f"{name}_p{p}": percentile(values, p)
+            for name, values in (
+                ("ttfb", [r["ttfb"] for r in ok]),
+                ("ttft", [r["ttft"] for r in ok if r["ttft"] is not None]),
+                ("tokens_per_second", rates),
+            )
+            for p in (50, 95, 99)
+        },
+    }
+
+
+def fmt(value, scale=1000, unit="ms"):
+    return "-" if value is None else f"{value * scale:.0f}{unit}"
+
+
+def print_stage(s):
+    print(
+        f"{s['users']:>5} {s['requests']:>6} {s['error_rate']:>6.1%}  "
+        + "  ".join(fmt(s[f"ttfb_p{p}"]) for p in (50, 95, 99)).ljust(24)
+        + "  ".join(fmt(s[f"ttft_p{p}"]) for p in (50, 95, 99)).ljust(24)
+        + "  ".join(fmt(s[f"tokens_per_second_p{p}"], 1, "") for p in (50, 95, 99)).ljust(16)
+        + f"{s['tokens_per_second_total']:8.0f}"
+        + ("  " + json.dumps(s["error_kinds"]) if s["error_kinds"] else "")
+    )
+
+
+async def run(args):
+    stages = [int(n) for n in args.stages.split(",")]
+    run_id = int(time.time())
+    counter = itertools.count()
+    if args.same_prompt:
+        prompts = itertools.repeat(PROMPT.format(n=0, run=run_id))
+    else:
+        prompts = (PROMPT.format(n=n, run=run_id) for n in counter)
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=max(stages))
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+        tokens = await asyncio.gather(*(
+            login(client, f"{args.user_prefix}-{i}", args.password) for i in range(max(stages))
+        ))
+
+        print(f"{'users':>5} {'reqs':>6} {'errors':>6}  {'ttfb p50/95/99':24}{'ttft p50/95/99':24}{'tok/s p50/95/99':16}{'tok/s all':>8}")
+        summaries = []
+        for users in stages:
+            results = []
+            started = time.perf_counter()
+            deadline = started + args.stage_seconds
+            await asyncio.gather(*(
+                virtual_user(client, tokens[i], prompts, args.model, deadline, results)
+                for i in range(users)
+            ))
+            summary = summarize(users, results, time.perf_counter() - started)
+            summaries.append(summary)
+            print_stage(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "stages": summaries}, f, indent=2)
+        print(f"wrote {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000/api/", help="API root of the backend")
+    parser.add_argument("--stages", default="1,2,4,8,16", help="comma separated concurrent users per stage")
+    parser.add_argument("--stage-seconds", type=float, default=20.0, help="new requests start until this runs out")
+    parser.add_argument("--model", default="qwen2.5-coder:3b")
+    parser.add_argument("--same-prompt", action="store_true", help="every request sends the same code")
+    parser.add_argument("--user-prefix", default="loadtest")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--timeout", type=float, default=120.0, help="read timeout per request, seconds")
+    parser.add_argument("--json", help="also write the stage summaries to this file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Benchmark suite for the rendering pipeline.
+
+Times create_pdf, create_docx, md_inline, wrap_code_lines and
+detect_input_type on generated LLM Markdown (benchmarks/corpus.py) from
+1 KB to 1 MB, and records the peak Python heap of one call
+(tracemalloc; libxml2 memory inside python-docx is not included).
+
+    cd backend
+    python benchmarks/run_suite.py --save            # record a baseline
+    python benchmarks/run_suite.py                   # compare against it
+    python benchmarks/run_suite.py --sizes 1k,10k --only pdf --threshold 0.1
+
+Baselines are machine specific and live in benchmarks/baselines/
+(<name>.json, --baseline to choose). A case regresses when its time or
+peak memory grows by more than --threshold (default 20%) and by more
+than --min-delta-ms; the exit status is 1 if any case regressed.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django
+
+django.setup()
+
+from benchmarks.corpus import generate
+from generator import docx_generator, pdf_generator
+from generator import markdown_blocks as md
+from generator.views import detect_input_type
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+SIZES = {"1k": 1024, "10k": 10 * 1024, "100k": 100 * 1024, "1m": 1024 * 1024}
+
+
+def fresh(render):
+    # drop the per-document parse cache so every call pays for parsing
+    def run(text):
+        md._cache.clear()
+        return render(text)
+    return run
+
+
+def inline_lines(text):
+    # every string the PDF renderer passes through md_inline
+    lines = []
+    for b in md.iter_blocks(text.split("\n")):
+        if isinstance(b, (md.Heading, md.Paragraph)):
+            lines.append(b.text)
+        elif isinstance(b, md.Bullets):
+            lines.extend(b.items)
+        elif isinstance(b, md.Table):
+            lines.extend(cell for row in b.rows for cell in row)
+    return lines
+
+
+def code_text(text):
+    return "\n".join(b.text for b in md.iter_blocks(text.split("\n")) if isinstance(b, md.Code))
+
+
+# name -> (corpus profile, prepare(text) -> argument, function(argument))
+CASES = {
+    "create_pdf[mixed]": ("mixed", None, fresh(pdf_generator.create_pdf)),
+    "create_pdf[tables]": ("tables", None, fresh(pdf_generator.create_pdf)),
+    "create_docx[mixed]": ("mixed", None, fresh(docx_generator.create_docx)),
+    "create_docx[tables]": ("tables", None, fresh(docx_generator.create_docx)),
+    "md_inline[mixed]": ("mixed", inline_lines, lambda lines: [pdf_generator.md_inline(line) for line in lines]),
+    "wrap_code_lines[pdf]": ("code", code_text, pdf_generator.wrap_code_lines),
+    "wrap_code_lines[docx]": ("code", code_text, docx_generator.wrap_code_lines),
+    "detect_input_type[prose]": ("prose", None, detect_input_type),
+    "detect_input_type[mixed]": ("mixed", None, detect_input_type),
+}
+
+
+def measure(fn, arg, repeat):
+    timer = timeit.Timer(lambda: fn(arg))
+    number, _ = timer.autorange()
+    # big documents already take seconds per call
+    runs = repeat if number > 1 else max(1, min(repeat, 3))
+    seconds = min(timer.repeat(repeat=runs, number=number)) / number
+
+    tracemalloc.start()
+    fn(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def compare(result, base, threshold, min_delta):
+    """Relative changes in time and memory, and whether either regressed."""
+    flags = []
+    changes = {}
+    for field, floor in (("seconds", min_delta), ("peak_bytes", 64 * 1024)):
+        old, new = base[field], result[field]
+        change = (new - old) / old if old else 0.0
+        changes[field] = change
+        if change > threshold and new - old > floor:
+            flags.append(field)
+    return changes, flags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="1k,10k,100k,1m", help="comma separated: " + ",".join(SIZES))
+    parser.add_argument("--only", default="", help="run cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default="local", help="baseline name under benchmarks/baselines/")
+    parser.add_argument("--save", action="store_true", help="write the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative growth (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore time changes smaller than this")
+    args = parser.parse_args()
+
+    baseline_path = os.path.join(BASELINE_DIR, f"{args.baseline}.json")
+    baseline = {}
+    if not args.save and os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    regressions = []
+    print(f"{'case':28} {'size':>5} {'time/call':>12} {'peak mem':>10}  vs baseline")
+    for size_name in args.sizes.split(","):
+        size = SIZES[size_name]
+        texts = {}
+        for name, (profile, prepare, fn) in CASES.items():
+            if args.only not in name:
+                continue
+            text = texts.setdefault(profile, generate(size, profile))
+            arg = prepare(text) if prepare else text
+            key = f"{name}@{size_name}"
+            result = results[key] = measure(fn, arg, args.repeat)
+
+            note = ""
+            if key in baseline:
+                changes, flags = compare(result, baseline[key], args.threshold, args.min_delta_ms / 1000)
+                note = f"time {changes['seconds']:+6.1%}  mem {changes['peak_bytes']:+6.1%}"
+                if flags:
+                    regressions.append((key, flags))
+                    note += "  REGRESSION (" + ", ".join(flags) + ")"
+            print(f"{name:28} {size_name:>5} {result['seconds'] * 1000:10.3f}ms {result['peak_bytes'] / 1024:8.0f}KB  {note}")
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump({
+                "meta": {
+                    "created": datetime.now(timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "machine": platform.platform(),
+                    "repeat": args.repeat,
+                },
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+        print(f"saved baseline {baseline_path}")
+    elif not baseline:
+        print(f"no baseline at {baseline_path}; run with --save to record one")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
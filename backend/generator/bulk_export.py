@@ -0,0 +1,162 @@
+import os
+import tempfile
+import time
+import zipfile
+from collections import deque
+
+from django.conf import settings
+from django.utils.text import slugify
+
+from . import export_jobs
+
+
+# =========================================================
+# BULK EXPORT
+# =========================================================
+# Many saved documents in one download, either as a ZIP of per-document
+# files or as one merged PDF. Rendering runs in the export process pool
+# and the result is streamed to the client as it is produced, so neither
+# the request worker's CPU nor its memory scales with the selection.
+BLOCK_SIZE = 64 * 1024
+# how long a stream that has nothing in flight waits before asking the
+# full export pool again
+BUSY_RETRY_SECONDS = 0.2
+
+
+def archive_name(n, doc, fmt):
+    return f"{n:03d}-{slugify(doc.topic)[:60] or 'document'}.{fmt}"
+
+
+def _discard(future):
+    # result of a render nobody will read any more
+    if not future.cancelled() and future.exception() is None:
+        try:
+            os.remove(future.result()[0])
+        except OSError:
+            pass
+
+
+def iter_rendered(docs, fmt):
+    """Yield (doc, path) in order while the pool renders ahead, at most
+    two documents per worker in flight. Each file is removed once the
+    consumer moves on.
+
+    Renders count against EXPORT_MAX_PENDING. If the pool is full before
+    the first document, ExportBusy is raised; later on the stream renders
+    less far ahead, or waits for other exports to finish."""
+    directory = export_jobs.job_dir()
+    window = settings.EXPORT_WORKERS * 2
+    docs = iter(docs)
+    next_doc = next(docs, None)
+    started = False
+    pending = deque()
+    try:
+        while True:
+            while next_doc is not None and len(pending) < window:
+                try:
+                    future = export_jobs.run(export_jobs.render_to_file, next_doc.content, fmt, directory)
+                except export_jobs.ExportBusy:
+                    if pending:
+                        break
+                    if not started:
+                        raise
+                    time.sleep(BUSY_RETRY_SECONDS)
+                    continue
+                pending.append((next_doc, future))
+                next_doc = next(docs, None)
+            if not pending:
+                return
+            started = True
+            doc, future = pending.popleft()
+            path, _ = future.result()
+            try:
+                yield doc, path
+            finally:
+                os.remove(path)
+    finally:
+        for _, future in pending:
+            if not future.cancel():
+                future.add_done_callback(_discard)
+
+
+def iter_file(path):
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+class ZipSink:
+    """Write-only file for ZipFile; the bytes written so far are handed
+    out by drain() so the archive never exists as a whole."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_zip(docs, fmt):
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for n, (doc, path) in enumerate(iter_rendered(docs, fmt), 1):
+            with zf.open(archive_name(n, doc, fmt), "w", force_zip64=True) as dest:
+                for block in iter_file(path):
+                    dest.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+    yield sink.drain()
+
+
+def render_merged_to_file(sections, directory):
+    """Runs in a pool worker, like export_jobs.render_to_file."""
+    from .pdf_generator import create_merged_pdf
+
+    fd, path = tempfile.mkstemp(prefix="bulk-", suffix=".pdf", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            create_merged_pdf(sections, f)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def iter_merged_pdf(docs):
+    # one ReportLab document, so one worker: bookmarks and page flow
+    # need a single build
+    sections = [(doc.topic, doc.content) for doc in docs]
+    future = export_jobs.run(render_merged_to_file, sections, export_jobs.job_dir())
+    path = future.result()
+    try:
+        yield from iter_file(path)
+    finally:
+        os.remove(path)
+
+
+def started(body):
+    """Run `body` up to its first block, so ExportBusy (or a failing first
+    render) reaches the view as an error response, not a cut-off download."""
+    first = next(body)
+    return _resume(first, body)
+
+
+def _resume(first, body):
+    try:
+        yield first
+        yield from body
+    finally:
+        body.close()
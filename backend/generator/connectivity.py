@@ -0,0 +1,89 @@
+import asyncio
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+
+# =========================================================
+# BACKGROUND CONNECTIVITY PROBE
+# =========================================================
+class ConnectivityProbe:
+    """One online/offline flag per process, refreshed by a daemon thread
+    every `interval` seconds so request handlers only read an attribute."""
+
+    def __init__(self, host, port, interval, timeout):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.timeout = timeout
+        self.online = False
+        self.checked_at = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def probe(self):
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.timeout):
+                online = True
+        except OSError:
+            online = False
+        self.online = online
+        self.checked_at = time.time()
+        self._ready.set()
+        return online
+
+    def _run(self):
+        while True:
+            self.probe()
+            time.sleep(self.interval)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="connectivity-probe", daemon=True)
+                self._thread.start()
+
+    def is_online(self):
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        # Only the very first caller in a process waits for a result.
+        if not self._ready.is_set():
+            self._ready.wait(self.timeout + 1)
+        return self.online
+
+    async def ais_online(self):
+        # is_online() for the event loop: the first result is waited for
+        # in a worker thread
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        if not self._ready.is_set():
+            await asyncio.to_thread(self._ready.wait, self.timeout + 1)
+        return self.online
+
+
+_probe = None
+_probe_lock = threading.Lock()
+
+
+def get_probe():
+    global _probe
+    with _probe_lock:
+        if _probe is None:
+            _probe = ConnectivityProbe(
+                settings.CONNECTIVITY_PROBE_HOST,
+                settings.CONNECTIVITY_PROBE_PORT,
+                settings.CONNECTIVITY_PROBE_INTERVAL,
+                settings.CONNECTIVITY_PROBE_TIMEOUT,
+            )
+        return _probe
+
+
+def is_online():
+    return get_probe().is_online()
+
+
+async def ais_online():
+    return await get_probe().ais_online()
@@ -5,9 +5,18 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
 import re
+import time
+
+from . import markdown_blocks as md
+from . import metrics
 
 
 # ---------- INLINE FORMAT ----------
+# characters that may start a styled span; everything between them is
+# plain text and goes into a single run
+INLINE_MARKERS = re.compile(r"[*`\[]")
+
+
 def apply_inline_format(paragraph, text):
 
     text = text.replace("** ", "**").replace(" **", "**")
@@ -19,6 +28,12 @@ def apply_inline_format(paragraph, text):
 
     i = 0
     n = len(text)
+    plain = []
+
+    def flush():
+        if plain:
+            paragraph.add_run("".join(plain))
+            plain.clear()
 
     while i < n:
 
@@ -26,6 +41,7 @@ def apply_inline_format(paragraph, text):
         if text[i:i+2] == "**":
             end = text.find("**", i+2)
             if end != -1:
+                flush()
                 run = paragraph.add_run(text[i+2:end])
                 run.bold = True
                 i = end + 2
@@ -35,6 +51,7 @@ def apply_inline_format(paragraph, text):
         if text[i] == "*" and (i+1 < n and text[i+1] != "*"):
             end = text.find("*", i+1)
             if end != -1:
+                flush()
                 run = paragraph.add_run(text[i+1:end])
                 run.italic = True
                 i = end + 1
@@ -44,6 +61,7 @@ def apply_inline_format(paragraph, text):
         if text[i] == "`":
             end = text.find("`", i+1)
             if end != -1:
+                flush()
                 run = paragraph.add_run(text[i+1:end])
                 run.font.name = "Consolas"
                 run.font.size = Pt(10)
@@ -57,6 +75,7 @@ def apply_inline_format(paragraph, text):
             if close != -1 and text[close+1:close+2] == "(":
                 end = text.find(")", close)
                 if end != -1:
+                    flush()
                     label = text[i+1:close]
                     run = paragraph.add_run(label)
                     run.font.color.rgb = RGBColor(0,102,204)
@@ -64,8 +83,13 @@ def apply_inline_format(paragraph, text):
                     i = end + 1
                     continue
 
-        paragraph.add_run(text[i])
-        i += 1
+        # plain text up to the next possible marker
+        m = INLINE_MARKERS.search(text, i + 1)
+        j = m.start() if m else n
+        plain.append(text[i:j])
+        i = j
+
+    flush()
 
 
 # ---------- CODE WRAP ----------
@@ -108,17 +132,7 @@ def add_code_block(doc, code_text):
 
 
 # ---------- TABLE ----------
-def add_table(doc, table_lines):
-
-    rows=[]
-    for row in table_lines:
-        cols=[c.strip() for c in row.strip("|").split("|")]
-        if all(set(c)<=set("-:") for c in cols):
-            continue
-        rows.append(cols)
-
-    if not rows:
-        return
+def add_table(doc, rows):
 
     table=doc.add_table(rows=len(rows), cols=len(rows[0]))
 
@@ -128,80 +142,51 @@ def add_table(doc, table_lines):
             apply_inline_format(p,c)
 
 
-# ---------- DOCX CREATOR ----------
-def create_docx(text):
+# ---------- DOCUMENT ----------
+HEADING_COLORS = {
+    1: RGBColor(11,61,145),
+    2: RGBColor(31,122,140),
+    3: RGBColor(138,90,68),
+}
+
+
+def build_document(text):
 
     doc = Document()
 
-    lines = [l for l in text.split("\n") if l.strip().lower() not in [
-        "end of documentation",
-        "end of document",
-        "documentation ends here",
-        "end."
-    ]]
-
-    in_code=False
-    code_buffer=[]
-    table_buffer=[]
-
-    for line in lines:
-        stripped=line.rstrip()
-
-        if stripped.strip()=="---":
-            continue
-
-        # code block
-        if stripped.strip().startswith("```"):
-            if in_code:
-                add_code_block(doc, "\n".join(code_buffer))
-                code_buffer=[]
-                in_code=False
-            else:
-                in_code=True
-            continue
-
-        if in_code:
-            code_buffer.append(line)
-            continue
-
-        # table
-        if "|" in stripped and stripped.count("|")>=2:
-            table_buffer.append(stripped)
-            continue
+    for block in md.parse_blocks(text):
+
+        if isinstance(block, md.Heading):
+            p=doc.add_paragraph(block.text, style=f"Heading {block.level}")
+            for r in p.runs: r.font.color.rgb=HEADING_COLORS[block.level]
+
+        elif isinstance(block, md.Bullets):
+            for item in block.items:
+                p=doc.add_paragraph(style="List Bullet")
+                apply_inline_format(p, item)
+
+        elif isinstance(block, md.Table):
+            add_table(doc, block.rows)
+
+        elif isinstance(block, md.Code):
+            add_code_block(doc, block.text)
+
         else:
-            if table_buffer:
-                add_table(doc, table_buffer)
-                table_buffer=[]
-
-        # headings
-        if stripped.startswith("# "):
-            p=doc.add_paragraph(stripped[2:], style="Heading 1")
-            for r in p.runs: r.font.color.rgb=RGBColor(11,61,145)
-            continue
-
-        if stripped.startswith("## "):
-            p=doc.add_paragraph(stripped[3:], style="Heading 2")
-            for r in p.runs: r.font.color.rgb=RGBColor(31,122,140)
-            continue
-
-        if stripped.startswith("### "):
-            p=doc.add_paragraph(stripped[4:], style="Heading 3")
-            for r in p.runs: r.font.color.rgb=RGBColor(138,90,68)
-            continue
-
-        # bullets
-        if stripped.startswith("- "):
-            p=doc.add_paragraph(style="List Bullet")
-            apply_inline_format(p, stripped[2:])
-            continue
-
-        # paragraph
-        if stripped.strip():
             p=doc.add_paragraph()
             p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-            apply_inline_format(p, stripped)
+            apply_inline_format(p, block.text)
+
+    return doc
+
+
+# ---------- DOCX CREATOR ----------
+def create_docx(text, output=None):
+    start = time.perf_counter()
+
+    doc = build_document(text)
 
-    buffer = BytesIO()
+    buffer = output if output is not None else BytesIO()
     doc.save(buffer)
+    metrics.record_render("docx", start, buffer)
     buffer.seek(0)
     return buffer
@@ -0,0 +1,214 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+
+# =========================================================
+# EXPORT JOBS
+# =========================================================
+# Large PDF/DOCX exports are rendered in a bounded process pool so the
+# CPU-bound ReportLab / python-docx work neither blocks a request worker
+# nor holds its GIL. Results are written to EXPORT_JOB_DIR and removed
+# after EXPORT_RESULT_TTL. Like flights, jobs live in the process that
+# accepted them.
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ExportBusy(Exception):
+    """Too many export jobs pending."""
+
+
+def render_to_file(text, fmt, directory):
+    """Runs in a pool worker: render and write the file, return (path, size)."""
+    from .pdf_generator import create_pdf
+    from .docx_generator import create_docx
+
+    fd, path = tempfile.mkstemp(prefix="export-", suffix=f".{fmt}", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            (create_pdf if fmt == "pdf" else create_docx)(text, f)
+            size = f.seek(0, os.SEEK_END)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, size
+
+
+class ExportJob:
+
+    def __init__(self, fmt, owner=None):
+        self.id = uuid.uuid4().hex
+        self.fmt = fmt
+        self.owner = owner
+        self.status = QUEUED
+        self.future = None
+        self.path = None
+        self.size = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def expired(self, now=None):
+        if self.finished_at is None:
+            return False
+        return (now or time.time()) - self.finished_at >= settings.EXPORT_RESULT_TTL
+
+    def state(self):
+        if self.status == QUEUED and self.future is not None and self.future.running():
+            return RUNNING
+        return self.status
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "format": self.fmt,
+            "status": self.state(),
+            "size": self.size,
+            "error": self.error,
+            "expires_at": self.finished_at + settings.EXPORT_RESULT_TTL if self.finished_at else None,
+        }
+
+
+_pool = None
+_jobs = {}
+_jobs_lock = threading.Lock()
+# renders submitted through run() rather than as jobs (bulk exports)
+_running = 0
+
+
+def get_pool():
+    global _pool
+    with _jobs_lock:
+        if _pool is None:
+            # spawn: the request process has threads (prober, flights)
+            # that fork would copy in a half-held state
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.EXPORT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    # a worker died (OOM kill, segfault): the executor is unusable, let
+    # the next submit start a fresh one
+    global _pool
+    with _jobs_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def job_dir():
+    directory = settings.EXPORT_JOB_DIR
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _remove(job):
+    if job.path:
+        try:
+            os.remove(job.path)
+        except OSError:
+            pass
+
+
+def sweep():
+    """Drop finished jobs past their TTL along with their files."""
+    now = time.time()
+    with _jobs_lock:
+        expired = [job for job in _jobs.values() if job.expired(now)]
+        for job in expired:
+            del _jobs[job.id]
+    for job in expired:
+        _remove(job)
+
+
+def _pending():
+    return _running + sum(1 for job in _jobs.values() if job.finished_at is None)
+
+
+def submit(text, fmt, owner=None):
+    sweep()
+    job = ExportJob(fmt, owner)
+    with _jobs_lock:
+        if _pending() >= settings.EXPORT_MAX_PENDING:
+            raise ExportBusy()
+        _jobs[job.id] = job
+
+    pool = get_pool()
+    try:
+        job.future = pool.submit(render_to_file, text, fmt, job_dir())
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            _discard_pool(pool)
+        with _jobs_lock:
+            del _jobs[job.id]
+        raise
+    job.future.add_done_callback(lambda f: _finish(job, f, pool))
+    return job
+
+
+def run(fn, *args):
+    """Submit fn(*args) to the pool as pending work without a job, under the
+    same EXPORT_MAX_PENDING admission and broken-pool recovery as submit().
+    Returns the future; raises ExportBusy when the pool is full."""
+    global _running
+    with _jobs_lock:
+        if _pending() >= settings.EXPORT_MAX_PENDING:
+            raise ExportBusy()
+        _running += 1
+
+    pool = get_pool()
+    try:
+        future = pool.submit(fn, *args)
+    except Exception as e:
+        _done_running(None, pool)
+        if isinstance(e, BrokenProcessPool):
+            _discard_pool(pool)
+        raise
+    future.add_done_callback(lambda f: _done_running(f, pool))
+    return future
+
+
+def _done_running(future, pool):
+    global _running
+    with _jobs_lock:
+        _running -= 1
+    if future is not None and not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        _discard_pool(pool)
+
+
+def _finish(job, future, pool):
+    try:
+        job.path, job.size = future.result()
+        job.status = DONE
+    except BrokenProcessPool as e:
+        _discard_pool(pool)
+        job.error = str(e)
+        job.status = FAILED
+    except Exception as e:
+        job.error = str(e) or e.__class__.__name__
+        job.status = FAILED
+    job.finished_at = time.time()
+    job.future = None
+
+
+def get_job(job_id, owner=None):
+    """The job if it exists, has not expired and belongs to `owner`."""
+    sweep()
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None or job.owner != owner:
+        return None
+    return job
@@ -0,0 +1,452 @@
+import asyncio
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+from .scheduler import OllamaBusy
+
+
+# =========================================================
+# SINGLE-FLIGHT GENERATIONS
+# =========================================================
+# Identical requests (same model + prompt) share one upstream Ollama
+# stream. The upstream is driven by a background thread (WSGI) or task
+# (ASGI), never by a client connection, so every subscriber can join,
+# replay what was already produced and then follow the live tail.
+class Flight:
+
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []
+        self.size = 0
+        self.done = False
+        self.failed = False
+        # gave up waiting for a model slot
+        self.busy = False
+        # place in the scheduler's line while waiting, 0 once admitted
+        self.queue_position = None
+        self.doc_ids = []
+        self.subscribers = 0
+        self.orphaned_at = None
+        self.task = None
+        self._cond = threading.Condition()
+        self._async_waiters = []
+
+    # ---------- producer side ----------
+    def _notify(self):
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # subscriber's loop is gone
+
+    def append(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self.size += len(chunk)
+            self._notify()
+
+    def set_queue_position(self, position):
+        with self._cond:
+            self.queue_position = position
+            self._notify()
+
+    def finish(self, failed=False):
+        with self._cond:
+            self.done = True
+            self.failed = failed
+            ids = list(self.doc_ids)
+            self._notify()
+        return ids
+
+    def text(self):
+        with self._cond:
+            return "".join(self.chunks)
+
+    # ---------- subscriber side ----------
+    def attach(self, doc_id=None):
+        """Register a subscriber and, for new requests, its DocHistory row.
+        Returns False if the flight finished in the meantime; the caller
+        then saves its own row from text() and failed."""
+        with self._cond:
+            self.subscribers += 1
+            self.orphaned_at = None
+            if self.done:
+                return False
+            if doc_id is not None:
+                self.doc_ids.append(doc_id)
+                _index_doc(doc_id, self)
+            return True
+
+    def detach(self):
+        with self._cond:
+            self.subscribers -= 1
+            if self.subscribers <= 0:
+                self.orphaned_at = time.monotonic()
+
+    def abandoned(self):
+        # nobody reconnected within the grace period
+        orphaned_at = self.orphaned_at
+        return (
+            orphaned_at is not None
+            and time.monotonic() - orphaned_at >= settings.STREAM_RESUME_GRACE_SECONDS
+        )
+
+    def iter_queue(self):
+        """Queue positions while the flight waits for a model slot, ending
+        with 0 on admission; nothing if it was admitted straight away."""
+        last = None
+        while True:
+            with self._cond:
+                while self.queue_position == last and not self.chunks and not self.done:
+                    self._cond.wait()
+                position = self.queue_position
+                started = bool(self.chunks) or self.done
+            if position is not None and position != last:
+                yield position
+                last = position
+            if started or position == 0:
+                return
+
+    async def aiter_queue(self):
+        loop = asyncio.get_running_loop()
+        last = None
+        while True:
+            event = asyncio.Event()
+            with self._cond:
+                position = self.queue_position
+                started = bool(self.chunks) or self.done
+                idle = position == last and not started
+                if idle:
+                    self._async_waiters.append((loop, event))
+            if idle:
+                await event.wait()
+                continue
+            if position is not None and position != last:
+                yield position
+                last = position
+            if started or position == 0:
+                return
+
+    def iter_chunks(self, start=0):
+        i = start
+        while True:
+            with self._cond:
+                while i >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                new = self.chunks[i:]
+                done = self.done
+            i += len(new)
+            yield from new
+            if done and i >= len(self.chunks):
+                return
+
+    async def aiter_chunks(self, start=0):
+        loop = asyncio.get_running_loop()
+        i = start
+        while True:
+            event = asyncio.Event()
+            with self._cond:
+                new = self.chunks[i:]
+                done = self.done
+                if not new and not done:
+                    self._async_waiters.append((loop, event))
+            i += len(new)
+            for chunk in new:
+                yield chunk
+            if new:
+                continue
+            if done:
+                return
+            await event.wait()
+
+
+_flights = {}
+_flights_by_doc = {}
+_flights_lock = threading.Lock()
+
+
+def _index_doc(doc_id, flight):
+    with _flights_lock:
+        _flights_by_doc[doc_id] = flight
+
+
+def flight_for_doc(doc_id):
+    """The live (or just finished) flight feeding a DocHistory row, if it
+    runs in this process."""
+    with _flights_lock:
+        return _flights_by_doc.get(doc_id)
+
+
+def get_flight(key):
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None and not flight.done:
+            return flight
+        return None
+
+
+def get_or_create_flight(key):
+    """Returns (flight, created)."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None and not flight.done:
+            return flight, False
+        flight = Flight(key)
+        _flights[key] = flight
+        return flight, True
+
+
+def _retire(flight):
+    with _flights_lock:
+        if _flights.get(flight.key) is flight:
+            del _flights[flight.key]
+        for doc_id in flight.doc_ids:
+            if _flights_by_doc.get(doc_id) is flight:
+                del _flights_by_doc[doc_id]
+
+
+@metrics.collector
+def _flight_metrics():
+    with _flights_lock:
+        active = len(_flights)
+    return [("docgen_active_flights", "Ollama generations in progress in this process.", "gauge", {}, active)]
+
+
+def abort_flight(flight):
+    """Used when the creator could not get the flight off the ground."""
+    _retire(flight)
+    return flight.finish(failed=True)
+
+
+# =========================================================
+# DRIVERS
+# =========================================================
+# `persist(doc_ids, text, status)` writes the text so far to every
+# subscribed DocHistory row: with status "streaming" on the checkpoint
+# schedule, then once more with "complete", "failed", or "busy" if the
+# flight timed out in the queue. `ticket` is the flight's place in the
+# scheduler: the driver waits for it (publishing the queue position to
+# subscribers) and releases it when the stream ends.
+class _Abandoned(Exception):
+    """Everyone left while the flight was still queued."""
+
+
+class Checkpoint:
+    """Due every STREAM_CHECKPOINT_CHARS of new text or STREAM_CHECKPOINT_SECONDS."""
+
+    def __init__(self):
+        self.size = 0
+        self.at = time.monotonic()
+
+    def due(self, size):
+        return (
+            size - self.size >= settings.STREAM_CHECKPOINT_CHARS
+            or time.monotonic() - self.at >= settings.STREAM_CHECKPOINT_SECONDS
+        )
+
+    def mark(self, size):
+        self.size = size
+        self.at = time.monotonic()
+
+
+def final_status(flight):
+    if flight.busy:
+        return "busy"
+    return "failed" if flight.failed else "complete"
+
+
+def run_flight(flight, chunks, persist, ticket):
+    failed = False
+    checkpoint = Checkpoint()
+    try:
+        if not ticket.wait(flight.set_queue_position, flight.abandoned):
+            raise _Abandoned()
+        for chunk in chunks:
+            flight.append(chunk)
+            if flight.abandoned():
+                # everyone hung up and nobody resumed: stop paying for
+                # tokens nobody reads
+                failed = True
+                break
+            if checkpoint.due(flight.size):
+                persist(list(flight.doc_ids), flight.text(), "streaming")
+                checkpoint.mark(flight.size)
+    except OllamaBusy:
+        failed = flight.busy = True
+    except Exception:
+        failed = True
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+        ticket.release()
+
+    doc_ids = flight.finish(failed=failed)
+    try:
+        persist(doc_ids, flight.text(), final_status(flight))
+    finally:
+        _retire(flight)
+
+
+def _run_flight_thread(flight, chunks, persist, ticket):
+    try:
+        run_flight(flight, chunks, persist, ticket)
+    finally:
+        # the thread ends here; don't leave its DB connection to the GC
+        connections.close_all()
+
+
+def start_flight_thread(flight, chunks, persist, ticket):
+    thread = threading.Thread(
+        target=_run_flight_thread,
+        args=(flight, chunks, persist, ticket),
+        name=f"flight-{flight.key[:8]}",
+        daemon=True,
+    )
+    flight.task = thread
+    thread.start()
+    return thread
+
+
+async def arun_flight(flight, chunks, persist, ticket):
+    apersist = sync_to_async(persist, thread_sensitive=False)
+    failed = False
+    checkpoint = Checkpoint()
+    try:
+        try:
+            if not await ticket.await_admission(flight.set_queue_position, flight.abandoned):
+                raise _Abandoned()
+            async for chunk in chunks:
+                flight.append(chunk)
+                if flight.abandoned():
+                    failed = True
+                    break
+                if checkpoint.due(flight.size):
+                    await apersist(list(flight.doc_ids), flight.text(), "streaming")
+                    checkpoint.mark(flight.size)
+        except OllamaBusy:
+            failed = flight.busy = True
+        except asyncio.CancelledError:
+            # the task was cancelled (e.g. the loop is shutting down):
+            # subscribers still get their tail and the rows their text
+            failed = True
+            raise
+        except Exception:
+            failed = True
+        finally:
+            await chunks.aclose()
+            ticket.release()
+    finally:
+        doc_ids = flight.finish(failed=failed)
+        try:
+            await apersist(doc_ids, flight.text(), final_status(flight))
+        finally:
+            _retire(flight)
+
+
+def start_flight_task(flight, chunks, persist, ticket):
+    flight.task = asyncio.get_running_loop().create_task(
+        arun_flight(flight, chunks, persist, ticket)
+    )
+    return flight.task
+
+
+# =========================================================
+# RESPONSE BODIES
+# =========================================================
+def skip_bytes(chunk, offset):
+    """Drop the first `offset` UTF-8 bytes across a run of chunks.
+    Returns (what is left of this chunk or None, offset still to skip)."""
+    data = chunk.encode("utf-8")
+    if offset >= len(data):
+        return None, offset - len(data)
+    # may split a character: the client already holds its first bytes
+    return data[offset:], 0
+
+
+def queue_line(position):
+    return json.dumps({"queue": position}) + "\n"
+
+
+class FlightStream:
+    """One subscriber's view of a flight: the head line, {"queue": n}
+    lines while the flight waits for a model slot, then the text replayed
+    from a byte offset and the live tail."""
+
+    def __init__(self, flight, head, error_message, offset=0, busy_message=None):
+        self._flight = flight
+        self._head = head
+        self._error_message = error_message
+        self._busy_message = busy_message or error_message
+        self._offset = offset
+        self._closed = False
+        metrics.ACTIVE_STREAMS.inc()
+
+    def __iter__(self):
+        try:
+            yield self._head
+            for position in self._flight.iter_queue():
+                yield queue_line(position)
+            offset = self._offset
+            for chunk in self._flight.iter_chunks():
+                if offset:
+                    chunk, offset = skip_bytes(chunk, offset)
+                    if chunk is None:
+                        continue
+                yield chunk
+            if self._flight.failed:
+                yield self._busy_message if self._flight.busy else self._error_message
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._flight.detach()
+            metrics.ACTIVE_STREAMS.dec()
+
+
+class AsyncFlightStream:
+
+    def __init__(self, flight, head, error_message, offset=0, busy_message=None):
+        self._flight = flight
+        self._head = head
+        self._error_message = error_message
+        self._busy_message = busy_message or error_message
+        self._offset = offset
+        self._closed = False
+        metrics.ACTIVE_STREAMS.inc()
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        try:
+            yield self._head
+            async for position in self._flight.aiter_queue():
+                yield queue_line(position)
+            offset = self._offset
+            async for chunk in self._flight.aiter_chunks():
+                if offset:
+                    chunk, offset = skip_bytes(chunk, offset)
+                    if chunk is None:
+                        continue
+                yield chunk
+            if self._flight.failed:
+                yield self._busy_message if self._flight.busy else self._error_message
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._flight.detach()
+            metrics.ACTIVE_STREAMS.dec()
@@ -0,0 +1,78 @@
+import hashlib
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import GenerationCache
+
+
+# =========================================================
+# GENERATION CACHE
+# =========================================================
+# Per-request "cache" field on /generate/:
+#   "use"     (default) replay a stored answer, store new ones
+#   "bypass"  neither read nor write the cache
+#   "refresh" ignore the stored answer and overwrite it
+CACHE_MODES = ("use", "bypass", "refresh")
+
+# token-ish pieces: a word with its leading whitespace
+_PIECE = re.compile(r"\s*\S+|\s+")
+
+
+def enabled():
+    return settings.GENERATION_CACHE_ENABLED
+
+
+def request_mode(value):
+    if not enabled():
+        return "bypass"
+    return value if value in CACHE_MODES else "use"
+
+
+def generation_key(model, prompt):
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def lookup(key):
+    now = timezone.now()
+    oldest = now - timedelta(seconds=settings.GENERATION_CACHE_TTL)
+    entry = GenerationCache.objects.filter(key=key, created_at__gte=oldest).first()
+    if entry is None:
+        return None
+    GenerationCache.objects.filter(pk=entry.pk).update(hits=F("hits") + 1, last_used=now)
+    return entry.content
+
+
+def store(key, model, content):
+    now = timezone.now()
+    GenerationCache.objects.update_or_create(
+        key=key,
+        defaults={"model": model, "content": content, "created_at": now, "last_used": now},
+    )
+    limit = settings.GENERATION_CACHE_MAX_ENTRIES
+    stale_ids = list(
+        GenerationCache.objects.order_by("-last_used").values_list("id", flat=True)[limit:]
+    )
+    if stale_ids:
+        GenerationCache.objects.filter(id__in=stale_ids).delete()
+
+
+def replay_chunks(text, size=None):
+    """Split stored output back into small word-aligned chunks so the
+    client renders it the same way it renders a live stream."""
+    size = size or settings.GENERATION_CACHE_REPLAY_CHUNK
+    chunk = ""
+    for piece in _PIECE.findall(text):
+        chunk += piece
+        if len(chunk) >= size:
+            yield chunk
+            chunk = ""
+    if chunk:
+        yield chunk
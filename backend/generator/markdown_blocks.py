@@ -0,0 +1,156 @@
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+
+# =========================================================
+# BLOCK IR
+# =========================================================
+# LLM Markdown is parsed once into a tuple of these blocks; pdf_generator
+# and docx_generator only decide how each block looks.
+Heading = namedtuple("Heading", "level text")
+Bullets = namedtuple("Bullets", "items")
+Table = namedtuple("Table", "rows")
+Code = namedtuple("Code", "text")
+Paragraph = namedtuple("Paragraph", "text")
+
+# closing lines LLMs like to add
+END_MARKERS = {
+    "end of documentation",
+    "end of document",
+    "documentation ends here",
+    "end.",
+}
+
+HEADINGS = (("### ", 3), ("## ", 2), ("# ", 1))
+
+
+def is_table_line(line):
+    return "|" in line and line.count("|") >= 2
+
+
+def split_row(line):
+    return [c.strip() for c in line.strip("|").split("|")]
+
+
+def is_separator_row(cells):
+    return all(set(c) <= set("-:") for c in cells)
+
+
+def table_block(lines):
+    rows = [cells for cells in map(split_row, lines) if not is_separator_row(cells)]
+    if not rows:
+        return None
+    # LLM tables are often ragged; pad so every renderer gets a grid
+    width = max(len(r) for r in rows)
+    return Table(tuple(tuple(r + [""] * (width - len(r))) for r in rows))
+
+
+# =========================================================
+# PARSER
+# =========================================================
+def iter_blocks(lines):
+    """Single pass over Markdown lines, yielding blocks as they complete."""
+    bullets = []
+    table = []
+    code = []
+    in_code = False
+
+    for line in lines:
+        stripped = line.rstrip()
+
+        if stripped.strip().lower() in END_MARKERS:
+            continue
+
+        # code
+        if stripped.strip().startswith("```"):
+            if in_code:
+                yield Code("\n".join(code))
+                code = []
+                in_code = False
+            else:
+                if bullets:
+                    yield Bullets(tuple(bullets))
+                    bullets = []
+                if table:
+                    block = table_block(table)
+                    if block:
+                        yield block
+                    table = []
+                in_code = True
+            continue
+
+        if in_code:
+            code.append(line)
+            continue
+
+        if stripped.strip() == "---":
+            continue
+
+        # table
+        if is_table_line(stripped):
+            if bullets:
+                yield Bullets(tuple(bullets))
+                bullets = []
+            table.append(stripped)
+            continue
+        if table:
+            block = table_block(table)
+            if block:
+                yield block
+            table = []
+
+        # bullets
+        if stripped.startswith("- "):
+            bullets.append(stripped[2:])
+            continue
+        if bullets:
+            yield Bullets(tuple(bullets))
+            bullets = []
+
+        # headings
+        for prefix, level in HEADINGS:
+            if stripped.startswith(prefix):
+                yield Heading(level, stripped[len(prefix):])
+                break
+        else:
+            # paragraph
+            if stripped.strip():
+                yield Paragraph(stripped)
+
+    # a stream cut off mid-block still keeps what it produced
+    if in_code and code:
+        yield Code("\n".join(code))
+    if table:
+        block = table_block(table)
+        if block:
+            yield block
+    if bullets:
+        yield Bullets(tuple(bullets))
+
+
+# =========================================================
+# PER-DOCUMENT CACHE
+# =========================================================
+_CACHE_SIZE = 64
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def parse_blocks(text):
+    """Blocks for `text`, memoized by content hash so exporting the same
+    document to both formats (or repeatedly) parses it once."""
+    key = hashlib.sha256(text.encode("utf-8")).digest()
+    with _cache_lock:
+        blocks = _cache.get(key)
+        if blocks is not None:
+            _cache.move_to_end(key)
+            return blocks
+
+    blocks = tuple(iter_blocks(text.split("\n")))
+
+    with _cache_lock:
+        _cache[key] = blocks
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return blocks
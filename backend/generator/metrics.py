@@ -0,0 +1,253 @@
+import bisect
+import threading
+import time
+
+
+# =========================================================
+# METRICS (Prometheus text format)
+# =========================================================
+# In-process counters and histograms, served by /metrics/. Recording is
+# a dict lookup and an add under a per-metric lock, about a microsecond.
+# Values are per process: with several workers, scrape each one. Renders
+# done inside the export pool's worker processes are not counted.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250)
+SIZE_BUCKETS = (4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_registry = []
+_collectors = []
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def label_text(names, values, extra=""):
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        if not self.labels:
+            self._values[()] = 0
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{label_text(self.labels, key)} {number(v)}" for key, v in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Timer:
+    """`with histogram.time(*labels):` observes the block's duration."""
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # per-bucket counts (last slot is +Inf), sum
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def count(self, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            return sum(series[0]) if series else 0
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, (list(s[0]), s[1])) for key, s in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in values:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = f'le="{number(bound)}"'
+                lines.append(f"{self.name}_bucket{label_text(self.labels, key, le)} {running}")
+            lines.append(f"{self.name}_sum{label_text(self.labels, key)} {number(total)}")
+            lines.append(f"{self.name}_count{label_text(self.labels, key)} {running}")
+        return lines
+
+
+def collector(fn):
+    """Register `fn() -> [(name, help, kind, labels dict, value)]`, read at
+    scrape time, for state other modules already keep."""
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    families = {}
+    for fn in _collectors:
+        for name, help, kind, labels, value in fn():
+            family = families.setdefault(name, [f"# HELP {name} {help}", f"# TYPE {name} {kind}"])
+            family.append(f"{name}{label_text(labels.keys(), labels.values())} {number(value)}")
+    for family in families.values():
+        lines.extend(family)
+    return "\n".join(lines) + "\n"
+
+
+# ---------- generation ----------
+OLLAMA_TTFT = Histogram(
+    "docgen_ollama_time_to_first_token_seconds",
+    "Time from sending a generate request to Ollama until the first token.",
+    ["model"],
+)
+OLLAMA_TOKEN_RATE = Histogram(
+    "docgen_ollama_tokens_per_second",
+    "Tokens per second of one Ollama stream, after its first token.",
+    ["model"], buckets=TOKEN_RATE_BUCKETS,
+)
+OLLAMA_TOKENS = Counter("docgen_ollama_tokens_total", "Tokens received from Ollama.", ["model"])
+OLLAMA_REQUESTS = Counter(
+    "docgen_ollama_requests_total", "Ollama generate requests by outcome.", ["model", "outcome"]
+)
+OLLAMA_LOAD_SECONDS = Histogram(
+    "docgen_ollama_load_seconds", "Model load time reported by Ollama (load_duration).", ["model", "source"]
+)
+OLLAMA_COLD_STARTS = Counter(
+    "docgen_ollama_cold_starts_total", "Generations that waited for Ollama to load the model.", ["model"]
+)
+OLLAMA_TTFT_BY_START = Histogram(
+    "docgen_ollama_time_to_first_token_by_start_seconds",
+    "Time to first token, split by whether Ollama had to load the model (cold) or not (warm).",
+    ["model", "start"],
+)
+OLLAMA_WARMUPS = Counter("docgen_ollama_warmups_total", "Model warm-up requests by outcome.", ["model", "outcome"])
+ACTIVE_STREAMS = Gauge("docgen_active_streams", "Generation responses currently streaming to clients.")
+
+# ---------- lookups ----------
+WIKIPEDIA_SECONDS = Histogram("docgen_wikipedia_fetch_seconds", "fetch_wikipedia latency.")
+WIKIPEDIA_FAILURES = Counter("docgen_wikipedia_fetch_failures_total", "fetch_wikipedia calls that raised.")
+INTERNET_CHECKS = Counter("docgen_internet_checks_total", "internet_available results.", ["result"])
+
+# ---------- rendering ----------
+RENDER_SECONDS = Histogram("docgen_render_seconds", "create_pdf/create_docx time.", ["format"])
+RENDER_BYTES = Histogram("docgen_render_bytes", "create_pdf/create_docx output size.", ["format"], buckets=SIZE_BUCKETS)
+
+# ---------- history ----------
+HISTORY_QUERY_SECONDS = Histogram(
+    "docgen_history_query_seconds", "History list, detail and search query time.", ["view"]
+)
+
+
+class StreamMeter:
+    """Times one Ollama stream: call token() per token, done() with the
+    final line, then finish(). A load of at least `cold_after` seconds
+    makes it a cold start."""
+
+    __slots__ = ("model", "start", "first", "tokens", "load", "cold_after")
+
+    def __init__(self, model, cold_after=1.0):
+        self.model = model
+        self.start = time.perf_counter()
+        self.first = None
+        self.tokens = 0
+        self.load = None
+        self.cold_after = cold_after
+
+    def token(self):
+        if self.first is None:
+            self.first = time.perf_counter()
+            OLLAMA_TTFT.observe(self.first - self.start, self.model)
+        self.tokens += 1
+
+    def done(self, data):
+        # Ollama's durations are in nanoseconds
+        self.load = data.get("load_duration", 0) / 1e9
+
+    def finish(self, outcome):
+        """outcome: "ok", "error" or "cancelled" (the reader stopped early)."""
+        OLLAMA_REQUESTS.inc(self.model, outcome)
+        if self.load is not None:
+            cold = self.load >= self.cold_after
+            OLLAMA_LOAD_SECONDS.observe(self.load, self.model, "generate")
+            if cold:
+                OLLAMA_COLD_STARTS.inc(self.model)
+            if self.first is not None:
+                OLLAMA_TTFT_BY_START.observe(self.first - self.start, self.model, "cold" if cold else "warm")
+        if not self.tokens:
+            return
+        OLLAMA_TOKENS.inc(self.model, amount=self.tokens)
+        elapsed = time.perf_counter() - self.first
+        if outcome == "ok" and elapsed > 0:
+            OLLAMA_TOKEN_RATE.observe(self.tokens / elapsed, self.model)
+
+
+def record_render(fmt, start, buffer):
+    RENDER_SECONDS.observe(time.perf_counter() - start, fmt)
+    RENDER_BYTES.observe(buffer.tell(), fmt)
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-18 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0003_dochistory_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WikipediaCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('query', models.TextField()),
+                ('content', models.TextField()),
+                ('fetched_at', models.DateTimeField()),
+                ('last_used', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
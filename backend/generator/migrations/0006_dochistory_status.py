@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 02:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0005_generationcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dochistory',
+            name='status',
+            field=models.CharField(choices=[('streaming', 'Streaming'), ('complete', 'Complete'), ('failed', 'Failed')], default='complete', max_length=16),
+        ),
+    ]
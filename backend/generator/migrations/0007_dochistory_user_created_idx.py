@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-18 02:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0006_dochistory_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dochistory',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='dochistory_user_created_idx'),
+        ),
+    ]
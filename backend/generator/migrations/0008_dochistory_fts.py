@@ -0,0 +1,84 @@
+# Generated by Django 6.0.2 on 2026-10-18 02:33
+
+from django.db import migrations
+
+
+# FTS5 index over DocHistory topic/content for history search (SQLite
+# only; other backends fall back to icontains, see generator/search.py).
+# The index reads text through a view so it can also index the owner as
+# a token ("u<user_id>"), which lets a search stay within one user's
+# rows. Rows are indexed once they leave "streaming", so stream
+# checkpoints do not re-index the whole text every few KB.
+# A later migration that makes SQLite remake generator_dochistory (most
+# field alterations do) drops these triggers and must create them again.
+FORWARD = [
+    """
+    CREATE VIEW generator_dochistory_fts_src AS
+    SELECT id, topic, content, 'u' || user_id AS owner FROM generator_dochistory
+    """,
+    """
+    CREATE VIRTUAL TABLE generator_dochistory_fts USING fts5(
+        topic, content, owner,
+        content='generator_dochistory_fts_src', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER generator_dochistory_fts_ai AFTER INSERT ON generator_dochistory
+    WHEN new.status != 'streaming' BEGIN
+        INSERT INTO generator_dochistory_fts(rowid, topic, content, owner)
+        VALUES (new.id, new.topic, new.content, 'u' || new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER generator_dochistory_fts_ad AFTER DELETE ON generator_dochistory
+    WHEN old.status != 'streaming' BEGIN
+        INSERT INTO generator_dochistory_fts(generator_dochistory_fts, rowid, topic, content, owner)
+        VALUES ('delete', old.id, old.topic, old.content, 'u' || old.user_id);
+    END
+    """,
+    # one trigger, so the old row is removed before the new one is added
+    """
+    CREATE TRIGGER generator_dochistory_fts_au AFTER UPDATE OF topic, content, status, user_id ON generator_dochistory
+    BEGIN
+        INSERT INTO generator_dochistory_fts(generator_dochistory_fts, rowid, topic, content, owner)
+        SELECT 'delete', old.id, old.topic, old.content, 'u' || old.user_id
+        WHERE old.status != 'streaming';
+        INSERT INTO generator_dochistory_fts(rowid, topic, content, owner)
+        SELECT new.id, new.topic, new.content, 'u' || new.user_id
+        WHERE new.status != 'streaming';
+    END
+    """,
+    """
+    INSERT INTO generator_dochistory_fts(rowid, topic, content, owner)
+    SELECT id, topic, content, 'u' || user_id FROM generator_dochistory WHERE status != 'streaming'
+    """,
+]
+
+BACKWARD = [
+    "DROP TRIGGER IF EXISTS generator_dochistory_fts_au",
+    "DROP TRIGGER IF EXISTS generator_dochistory_fts_ad",
+    "DROP TRIGGER IF EXISTS generator_dochistory_fts_ai",
+    "DROP TABLE IF EXISTS generator_dochistory_fts",
+    "DROP VIEW IF EXISTS generator_dochistory_fts_src",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0007_dochistory_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FORWARD), run(BACKWARD)),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0008_dochistory_fts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dochistory',
+            name='status',
+            field=models.CharField(choices=[('streaming', 'Streaming'), ('complete', 'Complete'), ('failed', 'Failed'), ('busy', 'Busy')], default='complete', max_length=16),
+        ),
+    ]
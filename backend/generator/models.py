@@ -2,11 +2,53 @@ from django.db import models
 from django.contrib.auth.models import User
 
 class DocHistory(models.Model):
+    STREAMING = "streaming"
+    COMPLETE = "complete"
+    FAILED = "failed"
+    # timed out waiting for a model slot, never started
+    BUSY = "busy"
+    STATUS_CHOICES = [
+        (STREAMING, "Streaming"),
+        (COMPLETE, "Complete"),
+        (FAILED, "Failed"),
+        (BUSY, "Busy"),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="history")
     topic = models.CharField(max_length=255)
     content = models.TextField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=COMPLETE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # history list: one user's rows newest first, id breaks ties
+            models.Index(fields=["user", "created_at", "id"], name="dochistory_user_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.topic}"
+
+
+class WikipediaCache(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    query = models.TextField()
+    content = models.TextField()
+    fetched_at = models.DateTimeField()
+    last_used = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.query[:50]
+
+
+class GenerationCache(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    content = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(db_index=True)
+
     def __str__(self):
-        return f"{self.user.username} - {self.topic}"
\ No newline at end of file
+        return f"{self.model} - {self.key[:12]}"
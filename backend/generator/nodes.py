@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+
+import requests
+
+from . import metrics
+from .scheduler import OllamaBusy
+
+
+# =========================================================
+# OLLAMA NODES
+# =========================================================
+# OLLAMA_URLS lists one or more Ollama servers. A daemon thread asks each
+# one every `interval` seconds which models it has in memory (/api/ps) and
+# pulled (/api/tags). A generation goes to the node that is, in order:
+# healthy, already holding the model in memory, known to have it pulled,
+# and least loaded. A node never runs more than `per_node` requests for
+# one model: when every node is full for it the request waits for a
+# slot, up to `wait_timeout` seconds (then OllamaBusy).
+# A node that fails a request is marked down until its next good check;
+# OllamaClient moves the request on if no token was sent yet.
+GENERATE_PATH = "/api/generate"
+FULL = "full"
+
+failovers = metrics.Counter(
+    "docgen_ollama_failovers_total", "Generations moved off a node that failed before the first token.", ["node"]
+)
+
+
+class Node:
+
+    def __init__(self, url):
+        url = url.rstrip("/")
+        self.base = url[: -len(GENERATE_PATH)] if url.endswith(GENERATE_PATH) else url
+        self.url = self.base + GENERATE_PATH
+        self.healthy = True   # until a check or a request says otherwise
+        self.loaded = set()   # models in memory
+        self.pulled = None    # models on disk; None until the first check
+        self.active = 0
+        self.running = {}     # model -> requests in progress
+        self.requests = 0
+        self.failures = 0
+        self.checked_at = None
+        self.error = None
+
+    def rank(self, model):
+        return (
+            not self.healthy,
+            model not in self.loaded,
+            self.pulled is not None and model not in self.pulled,
+            self.active,
+        )
+
+    def stats(self):
+        return {
+            "url": self.base,
+            "healthy": self.healthy,
+            "active": self.active,
+            "requests": self.requests,
+            "failures": self.failures,
+            "loaded": sorted(self.loaded),
+            "pulled": None if self.pulled is None else sorted(self.pulled),
+            "checked_at": self.checked_at,
+            "error": self.error,
+        }
+
+
+def model_names(response):
+    response.raise_for_status()
+    return {m.get("name") or m.get("model") for m in response.json().get("models", [])}
+
+
+class NodePool:
+
+    poll_interval = 0.05
+
+    def __init__(self, urls, per_node=4, interval=10.0, timeout=2.0, wait_timeout=15.0):
+        self.nodes = [Node(url) for url in urls]
+        self.per_node = per_node
+        self.interval = interval
+        self.timeout = timeout
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._thread = None
+        self._session = requests.Session()
+
+    # ---------- routing ----------
+    def _take(self, model, exclude):
+        """Called with the lock held: the best node with a free slot for
+        `model`, FULL if every candidate is busy, None if none is left."""
+        candidates = [n for n in self.nodes if n not in exclude]
+        if not candidates:
+            return None
+        free = [n for n in candidates if n.running.get(model, 0) < self.per_node]
+        if not free:
+            return FULL
+        node = min(free, key=lambda n: n.rank(model))
+        self._count(node, model, 1)
+        node.requests += 1
+        return node
+
+    def _count(self, node, model, n):
+        node.active += n
+        node.running[model] = node.running.get(model, 0) + n
+        if not node.running[model]:
+            del node.running[model]
+
+    def acquire(self, model, exclude=()):
+        """The best node not in `exclude`, counted as running one more
+        generation of `model` until release(); None when every node was tried.
+        Waits while every node is full; raises OllamaBusy on timeout."""
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            while True:
+                node = self._take(model, exclude)
+                if node is not FULL:
+                    return node
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise OllamaBusy()
+                self._cond.wait(remaining)
+
+    async def aacquire(self, model, exclude=()):
+        # polls, like Ticket.await_admission
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._cond:
+                node = self._take(model, exclude)
+            if node is not FULL:
+                return node
+            if time.monotonic() >= deadline:
+                raise OllamaBusy()
+            await asyncio.sleep(self.poll_interval)
+
+    def hold(self, node, model):
+        """Count a request pinned to `node` (a warm-up) like acquire() does;
+        False, and nothing counted, if the node is full for `model`."""
+        with self._cond:
+            if node.running.get(model, 0) >= self.per_node:
+                return False
+            self._count(node, model, 1)
+            node.requests += 1
+            return True
+
+    def release(self, node, model):
+        with self._cond:
+            self._count(node, model, -1)
+            self._cond.notify_all()
+
+    def succeeded(self, node, model):
+        # Ollama keeps a model in memory after serving it
+        with self._cond:
+            node.loaded.add(model)
+
+    def failed(self, node, model, error):
+        with self._cond:
+            node.failures += 1
+            node.error = str(error)
+            status = getattr(getattr(error, "response", None), "status_code", None)
+            if status == 404:
+                # the server is fine, it just doesn't have this model
+                node.loaded.discard(model)
+                if node.pulled is not None:
+                    node.pulled.discard(model)
+            else:
+                node.healthy = False
+
+    # ---------- health checks ----------
+    def check(self, node):
+        try:
+            loaded = model_names(self._session.get(node.base + "/api/ps", timeout=self.timeout))
+            pulled = model_names(self._session.get(node.base + "/api/tags", timeout=self.timeout))
+        except (requests.RequestException, ValueError) as e:
+            with self._cond:
+                node.healthy = False
+                node.error = str(e)
+                node.checked_at = time.time()
+            return False
+        with self._cond:
+            node.healthy = True
+            node.loaded = loaded
+            node.pulled = pulled
+            node.error = None
+            node.checked_at = time.time()
+        return True
+
+    def check_all(self):
+        for node in self.nodes:
+            self.check(node)
+
+    def _run(self):
+        while True:
+            self.check_all()
+            time.sleep(self.interval)
+
+    def start(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        with self._cond:
+            return [node.stats() for node in self.nodes]
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import threading
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import metrics
+from .nodes import NodePool, failovers
+from .scheduler import FairScheduler, OllamaBusy
+
+
+# =========================================================
+# CLIENT
+# =========================================================
+class OllamaClient:
+    """Keep-alive connection pools (requests for WSGI, httpx for ASGI), the
+    fair-share scheduler and the pool of Ollama nodes (see nodes.py)."""
+
+    def __init__(self, urls, pool_size=16, max_concurrent=4, max_waiting=8,
+                 queue_timeout=15.0, timeout=600, max_running_per_user=2, max_queued_per_user=4,
+                 health_interval=10.0, health_timeout=2.0, cold_start_seconds=1.0):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.cold_start_seconds = cold_start_seconds
+        self.nodes = NodePool(urls, max_concurrent, health_interval, health_timeout, queue_timeout)
+        # a model's slots add up over the nodes that can serve it
+        self.scheduler = FairScheduler(
+            max_concurrent * len(self.nodes.nodes), max_waiting,
+            max_running_per_user, max_queued_per_user, queue_timeout,
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.nodes.nodes), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # httpx pools are bound to the event loop that created them.
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def enqueue(self, model, user):
+        """A scheduler Ticket for one generation; see scheduler.py."""
+        return self.scheduler.enqueue(model, user)
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def next_node(self, model, tried, error):
+        """Mark the last node as failed; the node to retry on, or None
+        once every node has been tried."""
+        node = tried[-1]
+        self.nodes.failed(node, model, error)
+        retry = self.nodes.acquire(model, tried)
+        if retry is not None:
+            failovers.inc(node.base)
+        return retry
+
+    async def anext_node(self, model, tried, error):
+        node = tried[-1]
+        self.nodes.failed(node, model, error)
+        retry = await self.nodes.aacquire(model, tried)
+        if retry is not None:
+            failovers.inc(node.base)
+        return retry
+
+    def stream(self, payload):
+        model = payload["model"]
+        # waits while every node that could serve it is full
+        node = self.nodes.acquire(model)
+        meter = metrics.StreamMeter(model, self.cold_start_seconds)
+        outcome = "error"
+        tried = []
+        try:
+            while True:
+                tried.append(node)
+                response = None
+                try:
+                    response = self.session.post(node.url, json=payload, stream=True, timeout=self.timeout)
+                    # an error body has no "response" lines; without this the
+                    # flight would end "complete" with no text
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+
+                        data = json.loads(line.decode("utf-8"))
+
+                        if data.get("done"):
+                            meter.done(data)
+                        if "response" in data:
+                            if not data.get("done"):
+                                meter.token()
+                            yield data["response"]
+                    self.nodes.succeeded(node, model)
+                    break
+                except (requests.RequestException, ValueError) as e:
+                    retry = None if meter.tokens else self.next_node(model, tried, e)
+                    if retry is None:
+                        raise
+                finally:
+                    if response is not None:
+                        response.close()
+                    self.nodes.release(node, model)
+                node = retry
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        finally:
+            meter.finish(outcome)
+
+    async def astream(self, payload):
+        model = payload["model"]
+        # waits while every node that could serve it is full
+        node = await self.nodes.aacquire(model)
+        meter = metrics.StreamMeter(model, self.cold_start_seconds)
+        outcome = "error"
+        tried = []
+        try:
+            while True:
+                tried.append(node)
+                try:
+                    async with self.async_client().stream("POST", node.url, json=payload) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+
+                            data = json.loads(line)
+
+                            if data.get("done"):
+                                meter.done(data)
+                            if "response" in data:
+                                if not data.get("done"):
+                                    meter.token()
+                                yield data["response"]
+                    self.nodes.succeeded(node, model)
+                    break
+                except (httpx.HTTPError, ValueError) as e:
+                    retry = None if meter.tokens else await self.anext_node(model, tried, e)
+                    if retry is None:
+                        raise
+                finally:
+                    self.nodes.release(node, model)
+                node = retry
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        finally:
+            meter.finish(outcome)
+
+    def stats(self):
+        return self.scheduler.stats()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient(
+                settings.OLLAMA_URLS,
+                pool_size=settings.OLLAMA_POOL_SIZE,
+                max_concurrent=settings.OLLAMA_MAX_CONCURRENT_PER_MODEL,
+                max_waiting=settings.OLLAMA_MAX_QUEUED_PER_MODEL,
+                queue_timeout=settings.OLLAMA_QUEUE_TIMEOUT,
+                timeout=settings.OLLAMA_TIMEOUT,
+                max_running_per_user=settings.OLLAMA_MAX_RUNNING_PER_USER,
+                max_queued_per_user=settings.OLLAMA_MAX_QUEUED_PER_USER,
+                health_interval=settings.OLLAMA_HEALTH_INTERVAL,
+                health_timeout=settings.OLLAMA_HEALTH_TIMEOUT,
+                cold_start_seconds=settings.OLLAMA_COLD_START_SECONDS,
+            )
+            _client.nodes.start()
+        return _client
+
+
+@metrics.collector
+def _gate_metrics():
+    client = _client
+    if client is None:
+        return []
+    samples = []
+    for model, s in client.stats().items():
+        samples.append(("docgen_ollama_active_generations", "Generations holding a model slot.", "gauge", {"model": model}, s["active"]))
+        samples.append(("docgen_ollama_queued_generations", "Generations waiting for a model slot.", "gauge", {"model": model}, s["waiting"]))
+        samples.append(("docgen_scheduler_users_waiting", "Users with a generation queued.", "gauge", {"model": model}, s["users_waiting"]))
+    return samples
+
+
+@metrics.collector
+def _node_metrics():
+    client = _client
+    if client is None:
+        return []
+    samples = []
+    for s in client.nodes.stats():
+        node = {"node": s["url"]}
+        samples.append(("docgen_ollama_node_up", "1 if the node passed its last health check.", "gauge", node, int(s["healthy"])))
+        samples.append(("docgen_ollama_node_active_generations", "Generations running on the node.", "gauge", node, s["active"]))
+        samples.append(("docgen_ollama_node_models_loaded", "Models the node holds in memory.", "gauge", node, len(s["loaded"])))
+        samples.append(("docgen_ollama_node_requests_total", "Generate requests sent to the node.", "counter", node, s["requests"]))
+        samples.append(("docgen_ollama_node_failures_total", "Generate requests the node failed.", "counter", node, s["failures"]))
+    return samples
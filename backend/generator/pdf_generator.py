@@ -5,31 +5,45 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_JUSTIFY
 from reportlab.lib import colors
 import re
+import time
 
+from . import markdown_blocks as md
+from . import metrics
 
-# ---------- INLINE FORMAT ----------
-def md_inline(text):
-
-    text = re.sub(r'\[(.*?)\]\((.*?)\)', r"<link href='\2'><u>\1</u></link>", text)
-
-    text = re.sub(
-        r'`(.*?)`',
-        r"<font face='Courier' backColor='#EEF2F7'>\1</font>",
-        text
-    )
 
-    types = ["long long","size_t","double","float","char","bool","long","int"]
-    for t in types:
-        text = re.sub(
-            rf'\b{re.escape(t)}\b',
-            rf"<font face='Courier' color='#0A58CA'><b>{t}</b></font>",
-            text
-        )
+# ---------- INLINE FORMAT ----------
+# One precompiled scan replaces the old chain of re.sub passes (links,
+# code, C types, bold, italic). Spans are matched left to right and their
+# contents formatted recursively, which gives the same markup the passes
+# produced while never touching link URLs or double-wrapping "long long".
+TYPES = ["long long","size_t","double","float","char","bool","long","int"]
+
+_SPANS = (
+    r"`(?P<code>.*?)`"
+    r"|\*\*(?P<bold>.*?)\*\*"
+    # a single * closes italics unless it starts a **bold** pair
+    r"|\*(?P<italic>(?:\*\*.*?\*\*|[^*])*?)\*(?!\*.*?\*\*)"
+    r"|\b(?P<type>" + "|".join(re.escape(t) for t in TYPES) + r")\b"
+)
+_INLINE = re.compile(r"\[(?P<label>.*?)\]\((?P<url>.*?)\)|" + _SPANS)
+_LABEL = re.compile(_SPANS)
+
+
+def _inline_token(m):
+    kind = m.lastgroup
+    if kind == "url":
+        return f"<link href='{m.group('url')}'><u>{_LABEL.sub(_inline_token, m.group('label'))}</u></link>"
+    if kind == "code":
+        return f"<font face='Courier' backColor='#EEF2F7'>{_INLINE.sub(_inline_token, m.group('code'))}</font>"
+    if kind == "bold":
+        return f"<b>{_INLINE.sub(_inline_token, m.group('bold'))}</b>"
+    if kind == "italic":
+        return f"<i>{_INLINE.sub(_inline_token, m.group('italic'))}</i>"
+    return f"<font face='Courier' color='#0A58CA'><b>{m.group('type')}</b></font>"
 
-    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-    text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text)
 
-    return text
+def md_inline(text):
+    return _INLINE.sub(_inline_token, text)
 
 
 # ---------- CODE WRAP FIX ----------
@@ -77,16 +91,8 @@ def code_block(code):
     return box
 
 
-# ---------- PDF ----------
-def create_pdf(text):
-
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=letter,
-        rightMargin=60,leftMargin=60,
-        topMargin=70,bottomMargin=70
-    )
+# ---------- STORY ----------
+def build_story(text):
 
     styles = getSampleStyleSheet()
 
@@ -127,98 +133,95 @@ def create_pdf(text):
     )
 
     story=[]
-    lines=text.split("\n")
-
-    # remove LLM endings
-    lines = [l for l in lines if l.strip().lower() not in [
-        "end of documentation",
-        "end of document",
-        "documentation ends here",
-        "end."
-    ]]
-
-    bullets=[]
-    table=[]
-    code=[]
-    in_code=False
-
-    for line in lines:
-        stripped=line.rstrip()
-
-        if stripped.strip()=="---":
-            continue
-
-        # code
-        if stripped.strip().startswith("```"):
-            if in_code:
-                story.append(code_block("\n".join(code)))
-                story.append(Spacer(1,8))
-                code=[]
-                in_code=False
-            else:
-                in_code=True
-            continue
-
-        if in_code:
-            code.append(line)
-            continue
-
-        # table
-        if "|" in stripped and stripped.count("|")>=2:
-            table.append(stripped)
-            continue
-        else:
-            if table:
-                data=[]
-                for row in table:
-                    cols=[md_inline(c.strip()) for c in row.strip("|").split("|")]
-                    if all(set(c)<=set("-:") for c in cols):
-                        continue
-                    data.append([Paragraph(c,BODY) for c in cols])
-
-                if data:
-                    tbl=Table(data, repeatRows=1)
-                    tbl.setStyle(TableStyle([
-                        ("GRID",(0,0),(-1,-1),0.4,colors.grey),
-                        ("BACKGROUND",(0,0),(-1,0),colors.HexColor("#F1F3F5")),
-                        ("LEFTPADDING",(0,0),(-1,-1),6),
-                        ("RIGHTPADDING",(0,0),(-1,-1),6),
-                        ("TOPPADDING",(0,0),(-1,-1),4),
-                        ("BOTTOMPADDING",(0,0),(-1,-1),4),
-                    ]))
-                    story.append(tbl)
-                    story.append(Spacer(1,8))
-                table=[]
-
-        # headings
-        if stripped.startswith("# "):
-            story.append(Paragraph(md_inline(stripped[2:]), TITLE))
-            continue
-
-        if stripped.startswith("## "):
-            story.append(Paragraph(md_inline(stripped[3:]), H2))
-            continue
-
-        if stripped.startswith("### "):
-            story.append(Paragraph(md_inline(stripped[4:]), H3))
-            continue
-
-        # bullets
-        if stripped.startswith("- "):
-            bullets.append(ListItem(Paragraph(md_inline(stripped[2:]), BODY)))
-            continue
+
+    for block in md.parse_blocks(text):
+
+        if isinstance(block, md.Heading):
+            style = {1: TITLE, 2: H2, 3: H3}[block.level]
+            story.append(Paragraph(md_inline(block.text), style))
+
+        elif isinstance(block, md.Bullets):
+            items = [ListItem(Paragraph(md_inline(i), BODY)) for i in block.items]
+            story.append(ListFlowable(items, bulletType="bullet", spaceBefore=2, spaceAfter=6))
+
+        elif isinstance(block, md.Table):
+            data = [[Paragraph(md_inline(c), BODY) for c in row] for row in block.rows]
+            tbl = Table(data, repeatRows=1)
+            tbl.setStyle(TableStyle([
+                ("GRID",(0,0),(-1,-1),0.4,colors.grey),
+                ("BACKGROUND",(0,0),(-1,0),colors.HexColor("#F1F3F5")),
+                ("LEFTPADDING",(0,0),(-1,-1),6),
+                ("RIGHTPADDING",(0,0),(-1,-1),6),
+                ("TOPPADDING",(0,0),(-1,-1),4),
+                ("BOTTOMPADDING",(0,0),(-1,-1),4),
+            ]))
+            story.append(tbl)
+            story.append(Spacer(1,8))
+
+        elif isinstance(block, md.Code):
+            story.append(code_block(block.text))
+            story.append(Spacer(1,8))
+
         else:
-            if bullets:
-                story.append(ListFlowable(bullets, bulletType="bullet", spaceBefore=2, spaceAfter=6))
-                bullets=[]
+            story.append(Paragraph(md_inline(block.text), BODY))
+
+    return story
+
+
+# ---------- PDF ----------
+def new_document(buffer):
+    return SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        rightMargin=60,leftMargin=60,
+        topMargin=70,bottomMargin=70
+    )
+
+
+def create_pdf(text, output=None):
+    start = time.perf_counter()
+
+    # any writable binary file; the caller decides where the bytes live
+    buffer = output if output is not None else BytesIO()
+    doc = new_document(buffer)
+
+    doc.build(build_story(text))
+    metrics.record_render("pdf", start, buffer)
+    buffer.seek(0)
+    return buffer
+
+
+# ---------- MERGED PDF ----------
+class Bookmark(Flowable):
+    """Zero-size flowable that adds an outline entry where it lands."""
+
+    def __init__(self, key, title):
+        super().__init__()
+        self.key = key
+        self.title = title
+
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+
+    def draw(self):
+        self.canv.bookmarkPage(self.key)
+        self.canv.addOutlineEntry(self.title, self.key, level=0)
+
+
+def create_merged_pdf(sections, output=None):
+    """One PDF for several documents: `sections` is (title, text) pairs,
+    each starting on a new page with its own bookmark."""
 
-        # paragraph
-        if stripped.strip():
-            story.append(Paragraph(md_inline(stripped), BODY))
+    buffer = output if output is not None else BytesIO()
+    doc = new_document(buffer)
 
-    if bullets:
-        story.append(ListFlowable(bullets, bulletType="bullet", spaceBefore=2, spaceAfter=6))
+    story = []
+    for i, (title, text) in enumerate(sections):
+        if i:
+            story.append(PageBreak())
+        story.append(Bookmark(f"doc{i}", title))
+        story.extend(build_story(text))
 
-    doc.build(story)
+    doc.build(story, onFirstPage=lambda canv, _doc: canv.showOutline())
     buffer.seek(0)
     return buffer
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+
+from . import metrics
+from .pdf_generator import create_pdf
+from .docx_generator import create_docx
+
+
+RENDERERS = {
+    "pdf": create_pdf,
+    "docx": create_docx,
+}
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# =========================================================
+# RENDERED EXPORT CACHE
+# =========================================================
+class RenderCache:
+    """LRU of rendered files keyed by (content hash, format), bounded by
+    the total size of the stored bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RenderCache(settings.RENDER_CACHE_MAX_BYTES)
+        return _cache
+
+
+@metrics.collector
+def _cache_metrics():
+    if _cache is None:
+        return []
+    s = _cache.stats()
+    return [
+        ("docgen_render_cache_entries", "Rendered files held in memory.", "gauge", {}, s["entries"]),
+        ("docgen_render_cache_bytes", "Bytes held by the render cache.", "gauge", {}, s["bytes"]),
+        ("docgen_render_cache_lookups_total", "Render cache lookups.", "counter", {"result": "hit"}, s["hits"]),
+        ("docgen_render_cache_lookups_total", "Render cache lookups.", "counter", {"result": "miss"}, s["misses"]),
+    ]
+
+
+def render_file(text, fmt, digest=None):
+    """Rendered `text` in `fmt` ("pdf" or "docx") as a file positioned at
+    0. Output is spooled: it stays in memory up to EXPORT_SPOOL_MAX_BYTES
+    and spills to a temp file past that. Only results that fit the spool
+    are cached, so a large export is never held whole in memory here."""
+    key = (digest or content_hash(text), fmt)
+    cache = get_cache()
+    data = cache.get(key)
+    if data is not None:
+        return BytesIO(data)
+
+    out = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_BYTES)
+    try:
+        RENDERERS[fmt](text, out)
+    except Exception:
+        out.close()
+        raise
+    if out.seek(0, os.SEEK_END) <= settings.EXPORT_SPOOL_MAX_BYTES:
+        out.seek(0)
+        cache.put(key, out.read())
+    out.seek(0)
+    return out
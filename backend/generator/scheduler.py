@@ -0,0 +1,240 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+
+from . import metrics
+
+
+class OllamaBusy(Exception):
+    """Raised when a request cannot be queued (queue full) or waited too long."""
+
+
+# =========================================================
+# FAIR-SHARE SCHEDULER
+# =========================================================
+# Every model has `limit` slots. Waiting requests are queued per user and
+# slots are handed out round-robin across users (the waiting user served
+# longest ago goes next), so one user's burst waits behind everybody
+# else's next request instead of in front of it.
+# A user has at most `per_user` generations running (over all models)
+# and `max_user_waiting` queued; a model queues at most `max_waiting`.
+wait_seconds = metrics.Histogram(
+    "docgen_scheduler_wait_seconds", "Time from queueing to admission.", ["model"]
+)
+rejected = metrics.Counter(
+    "docgen_scheduler_rejected_total", "Requests refused or dropped by the scheduler.", ["model", "reason"]
+)
+
+WAITING = "waiting"
+ADMITTED = "admitted"
+DONE = "done"
+
+
+class Ticket:
+    """One request's place in line; release() when its generation ends
+    (or to give up waiting)."""
+
+    poll_interval = 0.05
+
+    def __init__(self, scheduler, model, user):
+        self.scheduler = scheduler
+        self.model = model
+        self.user = user
+        self.state = WAITING
+        self.queued_at = time.monotonic()
+
+    @property
+    def admitted(self):
+        return self.state == ADMITTED
+
+    def position(self):
+        return self.scheduler.position(self)
+
+    def wait(self, on_position=None, abandoned=None):
+        """Block until admitted. Reports the 1-based place in line through
+        on_position while waiting, then 0 on admission. Returns False if
+        `abandoned()` turned true; raises OllamaBusy on timeout."""
+        reported = None
+        deadline = self.queued_at + self.scheduler.timeout
+        while True:
+            with self.scheduler._cond:
+                if self.state != WAITING:
+                    break
+                if abandoned and abandoned():
+                    self.scheduler._cancel(self, "abandoned")
+                    return False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.scheduler._cancel(self, "timeout")
+                    raise OllamaBusy()
+                position = self.scheduler._position(self)
+                if not on_position or position == reported:
+                    self.scheduler._cond.wait(min(remaining, 1.0))
+                    continue
+            # outside the lock: the callback takes the flight's lock
+            on_position(position)
+            reported = position
+        if on_position and reported is not None:
+            on_position(0)
+        return True
+
+    async def await_admission(self, on_position=None, abandoned=None):
+        # polls, like the rest of the async paths that share thread state
+        reported = None
+        deadline = self.queued_at + self.scheduler.timeout
+        while True:
+            with self.scheduler._cond:
+                if self.state != WAITING:
+                    break
+                position = self.scheduler._position(self)
+                if abandoned and abandoned():
+                    self.scheduler._cancel(self, "abandoned")
+                    return False
+                if time.monotonic() >= deadline:
+                    self.scheduler._cancel(self, "timeout")
+                    raise OllamaBusy()
+            if on_position and position != reported:
+                on_position(position)
+                reported = position
+            await asyncio.sleep(self.poll_interval)
+        if on_position and reported is not None:
+            on_position(0)
+        return True
+
+    def release(self):
+        self.scheduler.release(self)
+
+
+class ModelQueue:
+
+    def __init__(self):
+        self.active = 0
+        self.waiting = 0
+        # user -> deque of waiting tickets, in arrival order
+        self.users = OrderedDict()
+        # user -> serial of their last admission; the next slot goes to
+        # the waiting user served longest ago (new users first)
+        self.served = {}
+        self.serial = 0
+
+    def turn_order(self):
+        return sorted(self.users, key=lambda u: self.served.get(u, -1))
+
+
+class FairScheduler:
+
+    def __init__(self, limit, max_waiting, per_user, max_user_waiting, timeout):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.per_user = per_user
+        self.max_user_waiting = max_user_waiting
+        self.timeout = timeout
+        self._models = {}
+        self._running = {}   # user -> generations running
+        self._queued = {}    # user -> tickets waiting
+        self._cond = threading.Condition()
+
+    def enqueue(self, model, user):
+        """A Ticket, admitted at once if a slot is free for this user.
+        Raises OllamaBusy when the model's or the user's queue is full."""
+        with self._cond:
+            queue = self._models.setdefault(model, ModelQueue())
+            ticket = Ticket(self, model, user)
+            if queue.waiting >= self.max_waiting:
+                rejected.inc(model, "queue_full")
+                raise OllamaBusy()
+            if self._queued.get(user, 0) >= self.max_user_waiting:
+                rejected.inc(model, "user_queue_full")
+                raise OllamaBusy()
+            queue.users.setdefault(user, deque()).append(ticket)
+            queue.waiting += 1
+            self._queued[user] = self._queued.get(user, 0) + 1
+            self._dispatch(model, queue)
+            return ticket
+
+    def release(self, ticket):
+        with self._cond:
+            if ticket.state == WAITING:
+                self._cancel(ticket, None)
+            elif ticket.state == ADMITTED:
+                ticket.state = DONE
+                self._models[ticket.model].active -= 1
+                self._running[ticket.user] -= 1
+                if not self._running[ticket.user]:
+                    del self._running[ticket.user]
+                # a finished user may unblock their tickets on other models too
+                for model, queue in self._models.items():
+                    self._dispatch(model, queue)
+
+    # ---------- internals, called with self._cond held ----------
+    def _dispatch(self, model, queue):
+        admitted = False
+        while queue.active < self.limit and queue.waiting:
+            user = next(
+                (u for u in queue.turn_order() if self._running.get(u, 0) < self.per_user), None
+            )
+            if user is None:
+                break
+            tickets = queue.users[user]
+            ticket = tickets.popleft()
+            if not tickets:
+                del queue.users[user]
+            queue.serial += 1
+            queue.served[user] = queue.serial
+            self._dequeued(queue, ticket)
+            ticket.state = ADMITTED
+            queue.active += 1
+            self._running[user] = self._running.get(user, 0) + 1
+            wait_seconds.observe(time.monotonic() - ticket.queued_at, model)
+            admitted = True
+        if admitted:
+            self._cond.notify_all()
+
+    def _dequeued(self, queue, ticket):
+        queue.waiting -= 1
+        self._queued[ticket.user] -= 1
+        if not self._queued[ticket.user]:
+            del self._queued[ticket.user]
+
+    def _cancel(self, ticket, reason):
+        queue = self._models[ticket.model]
+        tickets = queue.users.get(ticket.user)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del queue.users[ticket.user]
+            self._dequeued(queue, ticket)
+        ticket.state = DONE
+        if reason:
+            rejected.inc(ticket.model, reason)
+        self._cond.notify_all()
+
+    def _position(self, ticket):
+        """1-based place in line if every user keeps their turn: users
+        ahead in the rotation get one more turn than users behind."""
+        queue = self._models[ticket.model]
+        mine = queue.users.get(ticket.user)
+        if ticket.state != WAITING or not mine:
+            return 0
+        k = mine.index(ticket)
+        ahead = k
+        before_me = True
+        for user in queue.turn_order():
+            if user == ticket.user:
+                before_me = False
+                continue
+            ahead += min(len(queue.users[user]), k + 1 if before_me else k)
+        return ahead + 1
+
+    # ---------- observability ----------
+    def position(self, ticket):
+        with self._cond:
+            return self._position(ticket)
+
+    def stats(self):
+        with self._cond:
+            return {
+                model: {"active": q.active, "waiting": q.waiting, "limit": self.limit, "users_waiting": len(q.users)}
+                for model, q in self._models.items()
+            }
@@ -0,0 +1,109 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import DocHistory
+
+
+# =========================================================
+# HISTORY SEARCH
+# =========================================================
+# SQLite: FTS5 index from migration 0008, ranked with bm25 (topic hits
+# weigh more than body hits) and restricted to the caller through the
+# indexed owner token. Other backends: AND of icontains filters.
+FTS_TABLE = "generator_dochistory_fts"
+SNIPPET_TOKENS = 16
+# the text is Markdown already, so matches are marked with tags
+MARK_OPEN, MARK_CLOSE = "<mark>", "</mark>"
+
+_WORD = re.compile(r"\w+")
+_has_fts = None
+
+
+def has_fts():
+    global _has_fts
+    if _has_fts is None:
+        _has_fts = (
+            connection.vendor == "sqlite"
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _has_fts
+
+
+def search_words(text):
+    return _WORD.findall(text)
+
+
+def fts_query(words, user_id):
+    """Every word must match (stemmed, so "sorting" finds "sorted").
+    Words are \\w+ runs, so quoting them keeps FTS5 syntax out of user
+    input. No prefix terms: without a prefix index they merge the full
+    doclist of every matching term, across all users. The words are
+    scoped to topic and content, so "u<id>" can't match the owner column."""
+    terms = " AND ".join(f'"{w}"' for w in words)
+    return f'owner : "u{user_id}" AND {{topic content}} : ({terms})'
+
+
+def plain_snippet(text, word, width=80):
+    at = text.lower().find(word.lower())
+    if at < 0:
+        return text[:width * 2]
+    start = max(at - width, 0)
+    snippet = text[start:at + len(word) + width]
+    return ("…" if start else "") + snippet
+
+
+def search_history(user, text, limit):
+    words = search_words(text)
+    if not words:
+        return []
+    if has_fts():
+        return _fts_search(user, words, limit)
+    return _fallback_search(user, words, limit)
+
+
+def _fts_search(user, words, limit):
+    rows = DocHistory.objects.raw(
+        f"""
+        SELECT d.id, d.topic, d.status, d.created_at, d.updated_at,
+               snippet({FTS_TABLE}, -1, '{MARK_OPEN}', '{MARK_CLOSE}', '…', {SNIPPET_TOKENS}) AS snippet,
+               bm25({FTS_TABLE}, 10.0, 1.0, 0.0) AS rank
+        FROM {FTS_TABLE}
+        JOIN generator_dochistory d ON d.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s
+        ORDER BY rank
+        LIMIT %s
+        """,
+        [fts_query(words, user.id), limit],
+    )
+    return [
+        {
+            "id": doc.id,
+            "topic": doc.topic,
+            "status": doc.status,
+            "created_at": doc.created_at,
+            "updated_at": doc.updated_at,
+            "snippet": doc.snippet,
+            "rank": doc.rank,
+        }
+        for doc in rows
+    ]
+
+
+def _fallback_search(user, words, limit):
+    rows = DocHistory.objects.filter(user=user).exclude(status=DocHistory.STREAMING)
+    for w in words:
+        rows = rows.filter(Q(topic__icontains=w) | Q(content__icontains=w))
+    return [
+        {
+            "id": doc.id,
+            "topic": doc.topic,
+            "status": doc.status,
+            "created_at": doc.created_at,
+            "updated_at": doc.updated_at,
+            "snippet": plain_snippet(doc.content, words[0]),
+            "rank": None,
+        }
+        for doc in rows.order_by("-created_at", "-id")[:limit]
+    ]
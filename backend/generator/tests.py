@@ -1,3 +1,1620 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.text import slugify
+from docx import Document
+from docx.oxml.ns import qn
+from docx.shared import Pt, RGBColor
+from reportlab.platypus import ListFlowable, Paragraph, Spacer, Table
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import connectivity
+from . import flights
+from . import render_cache
+from . import export_jobs
+from . import generation_cache
+from . import wiki_cache
+from .models import DocHistory, GenerationCache, WikipediaCache
+from . import views
+from .ollama_client import OllamaClient
+from .scheduler import FairScheduler, OllamaBusy
+from . import markdown_blocks as md
+from .pdf_generator import build_story, create_pdf, md_inline
+from .docx_generator import apply_inline_format, build_document, create_docx
+from . import search
+from . import metrics
+from . import timing
+from .nodes import NodePool, failovers
+from . import warmup
+from benchmarks import fake_ollama
+
+
+# ---------------- CONNECTIVITY ----------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ConnectivityProbeTests(SimpleTestCase):
+
+    def test_probe(self):
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen()
+            port = listener.getsockname()[1]
+            self.assertTrue(connectivity.ConnectivityProbe("127.0.0.1", port, 60, 1).probe())
+        self.assertFalse(connectivity.ConnectivityProbe("127.0.0.1", free_port(), 60, 1).probe())
+
+    def slow_probe(self, delay):
+        probe = connectivity.ConnectivityProbe("127.0.0.1", 1, 60, 2)
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(delay)
+            probe.online = True
+            probe._ready.set()
+
+        probe.probe = slow
+        return probe, calls
+
+    def test_result_is_cached(self):
+        probe, calls = self.slow_probe(0)
+        self.assertTrue(probe.is_online())
+        self.assertTrue(probe.is_online())
+        self.assertEqual(len(calls), 1)
+
+    def test_async_first_check_does_not_block_the_loop(self):
+        probe, calls = self.slow_probe(0.3)
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            task = asyncio.create_task(ticker())
+            online = await probe.ais_online()
+            task.cancel()
+            return online
+
+        self.assertTrue(asyncio.run(main()))
+        self.assertGreater(len(ticks), 10)
+
+
+# ---------------- WIKIPEDIA CACHE ----------------
+@override_settings(WIKIPEDIA_CACHE_TTL=3600, WIKIPEDIA_CACHE_NEGATIVE_TTL=60, WIKIPEDIA_CACHE_MAX_ENTRIES=2)
+class WikiCacheTests(TestCase):
+
+    def setUp(self):
+        self.fetched = []
+
+    def fetch(self, query):
+        self.fetched.append(query)
+        return f"article about {query}"
+
+    def lookup(self, query, online=True, fetch=None):
+        return wiki_cache.cached_wikipedia(query, online, fetch or self.fetch)
+
+    def age(self, query, seconds):
+        WikipediaCache.objects.filter(key=wiki_cache.cache_key(query)).update(
+            fetched_at=timezone.now() - timedelta(seconds=seconds)
+        )
+
+    def delta(self, before):
+        after = wiki_cache.stats()
+        return {name: after[name] - before[name] for name in after if after[name] != before[name]}
+
+    def test_hit_until_ttl(self):
+        before = wiki_cache.stats()
+        self.assertEqual(self.lookup("Python"), "article about Python")
+        self.assertEqual(self.lookup("  python "), "article about Python")
+        self.age("python", 3601)
+        self.lookup("python")
+        self.assertEqual(self.fetched, ["Python", "python"])
+        self.assertEqual(self.delta(before), {"misses": 2, "hits": 1})
+
+    def test_stale_entry_served_offline(self):
+        self.lookup("Rust")
+        self.age("rust", 10 ** 6)
+        before = wiki_cache.stats()
+        self.assertEqual(self.lookup("Rust", online=False), "article about Rust")
+        self.assertEqual(self.delta(before), {"stale_hits": 1})
+        self.assertEqual(self.lookup("Go", online=False), "")
+        self.assertEqual(self.fetched, ["Rust"])
+
+    def test_failed_refresh_keeps_stale_content(self):
+        self.lookup("Rust")
+        self.age("rust", 3601)
+        self.assertEqual(self.lookup("Rust", fetch=lambda q: ""), "article about Rust")
+        self.assertEqual(self.lookup("Rust", online=False), "article about Rust")
+
+    def test_lru_eviction(self):
+        before = wiki_cache.stats()
+        self.lookup("a")
+        self.lookup("b")
+        self.lookup("a")  # b is now least recently used
+        self.lookup("c")
+        self.assertEqual(sorted(WikipediaCache.objects.values_list("query", flat=True)), ["a", "c"])
+        self.assertEqual(self.delta(before)["evictions"], 1)
+
+    def test_empty_result_is_cached_briefly(self):
+        def nothing(query):
+            self.fetched.append(query)
+            return ""
+
+        before = wiki_cache.stats()
+        self.assertEqual(self.lookup("no such topic", fetch=nothing), "")
+        self.assertEqual(self.lookup("no such topic", fetch=nothing), "")
+        self.assertEqual(self.fetched, ["no such topic"])
+        self.assertEqual(self.delta(before), {"misses": 1, "hits": 1})
+
+        self.age("no such topic", 61)
+        self.lookup("no such topic", fetch=nothing)
+        self.assertEqual(len(self.fetched), 2)
+
+
+# ---------------- GENERATION VIEWS ----------------
+CODE = """def merge(left, right):
+    out = []
+    while left and right:
+        out.append((left if left[0] <= right[0] else right).pop(0))
+    return out + left + right
+"""
+
+MODEL_ERROR = "\nModel not responding. Ensure Ollama is running."
+
+
+class StubOllama:
+    """Stands in for OllamaClient in the generate views: a real scheduler,
+    canned chunks. The stream waits for `hold` (if set) before its
+    first chunk and raises after the last one if `fail`."""
+
+    def __init__(self, chunks=("Hello ", "world"), limit=4, max_waiting=8, hold=None, fail=False, timeout=5):
+        self.scheduler = FairScheduler(limit, max_waiting, 2, 4, timeout)
+        self.chunks = chunks
+        self.hold = hold
+        self.fail = fail
+        self.calls = 0
+
+    def enqueue(self, model, user):
+        return self.scheduler.enqueue(model, user)
+
+    def stream(self, payload):
+        self.calls += 1
+        if self.hold:
+            self.hold.wait(5)
+        yield from self.chunks
+        if self.fail:
+            raise requests.ConnectionError("dropped")
+
+    async def astream(self, payload):
+        self.calls += 1
+        if self.hold:
+            await asyncio.to_thread(self.hold.wait, 5)
+        for chunk in self.chunks:
+            yield chunk
+        if self.fail:
+            raise requests.ConnectionError("dropped")
+
+
+class GenerationTestCase(TransactionTestCase):
+    """Flight drivers write from their own thread, hence TransactionTestCase."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pw")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+        self.ollama = StubOllama()
+        async def offline():
+            return False
+
+        patches = (("get_client", lambda: self.ollama), ("is_online", lambda: False), ("ais_online", offline))
+        for target, value in patches:
+            patcher = mock.patch.object(views, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def generate(self, code=CODE, **data):
+        return self.client.post("/api/generate/sync/", {"code": code, **data}, content_type="application/json", **self.auth)
+
+    def read(self, resp):
+        return b"".join(resp.streaming_content).decode()
+
+    def wait_for_flights(self):
+        deadline = time.monotonic() + 5
+        while flights._flights and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(flights._flights, {})
+
+    async def agenerate(self, code=CODE, **data):
+        request = AsyncRequestFactory().post(
+            "/api/generate/", {"code": code, **data}, content_type="application/json",
+            headers={"Authorization": self.auth["HTTP_AUTHORIZATION"]},
+        )
+        return await views.generate_documentation_async(request)
+
+    async def aread(self, resp):
+        return "".join([c.decode() if isinstance(c, bytes) else c async for c in resp.streaming_content])
+
+    def arun(self, coro):
+        async def main():
+            result = await asyncio.wait_for(coro, 5)
+            # let flight tasks make their final write before the loop closes
+            await asyncio.gather(*(asyncio.all_tasks() - {asyncio.current_task()}))
+            return result
+        return asyncio.run(main())
+
+    def lines(self, body):
+        """(DocHistory row, protocol lines before the text, the text)"""
+        head, rest = body.split("\n", 1)
+        doc = DocHistory.objects.get(pk=json.loads(head)["id"])
+        queue = []
+        while rest.startswith('{"queue"'):
+            line, rest = rest.split("\n", 1)
+            queue.append(json.loads(line)["queue"])
+        return doc, queue, rest
+
+
+class AsyncGenerateTests(GenerationTestCase):
+
+    async def body(self):
+        return await self.aread(await self.agenerate())
+
+    def test_wire_format(self):
+        doc, queue, text = self.lines(self.arun(self.body()))
+        self.assertEqual((queue, text), ([], "Hello world"))
+        doc.refresh_from_db()
+        self.assertEqual((doc.status, doc.content), (DocHistory.COMPLETE, "Hello world"))
+
+    def test_error_tail(self):
+        self.ollama = StubOllama(fail=True)
+        doc, _, text = self.lines(self.arun(self.body()))
+        self.assertEqual(text, "Hello world" + MODEL_ERROR)
+        doc.refresh_from_db()
+        self.assertEqual((doc.status, doc.content), (DocHistory.FAILED, "Hello world"))
+
+    def test_same_format_as_sync_view(self):
+        self.assertEqual(self.lines(self.read(self.generate()))[2], self.lines(self.arun(self.body()))[2])
+
+    def test_queue_lines(self):
+        self.ollama = StubOllama(limit=1)
+        holder = self.ollama.scheduler.enqueue(settings.OLLAMA_DEFAULT_MODEL, "bob")
+        threading.Timer(0.2, holder.release).start()
+        _, queue, text = self.lines(self.arun(self.body()))
+        self.assertEqual((queue, text), ([1, 0], "Hello world"))
+
+    def test_requires_auth(self):
+        self.auth = {"HTTP_AUTHORIZATION": "Bearer nope"}
+        self.assertEqual(self.arun(self.agenerate()).status_code, 401)
+
+
+class BusyTests(GenerationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # one running, one waiting: the model's queue is full
+        self.ollama = StubOllama(limit=1, max_waiting=1)
+        model = settings.OLLAMA_DEFAULT_MODEL
+        self.tickets = [self.ollama.scheduler.enqueue(model, user) for user in ("bob", "carol")]
+
+    def assertBusy(self, resp):
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp["Retry-After"], "5")
+        self.assertFalse(DocHistory.objects.exists())
+        self.assertEqual(self.ollama.calls, 0)
+
+    def test_sync_view(self):
+        self.assertBusy(self.generate())
+
+    def test_async_view(self):
+        self.assertBusy(self.arun(self.agenerate()))
+
+    def test_admitted_once_the_queue_drains(self):
+        for ticket in self.tickets:
+            ticket.release()
+        _, queue, text = self.lines(self.read(self.generate()))
+        self.wait_for_flights()
+        self.assertEqual((queue, text), ([], "Hello world"))
+
+
+class QueueTimeoutTests(GenerationTestCase):
+
+    def test_row_marked_busy(self):
+        self.ollama = StubOllama(limit=1, timeout=0.2)
+        holder = self.ollama.scheduler.enqueue(settings.OLLAMA_DEFAULT_MODEL, "bob")
+        body = self.read(self.generate())
+        holder.release()
+        self.wait_for_flights()
+
+        head, rest = body.split("\n", 1)
+        self.assertEqual(rest, '{"queue": 1}\n' + views.BUSY_ERROR)
+        doc = DocHistory.objects.get(pk=json.loads(head)["id"])
+        self.assertEqual((doc.status, doc.content), (DocHistory.BUSY, views.BUSY_MESSAGE))
+        self.assertEqual(self.ollama.calls, 0)
+
+
+@override_settings(GENERATION_CACHE_ENABLED=True)
+class GenerationCacheTests(GenerationTestCase):
+
+    def run_generation(self, **data):
+        resp = self.generate(**data)
+        doc, _, text = self.lines(self.read(resp))
+        self.wait_for_flights()
+        doc.refresh_from_db()
+        self.assertEqual(doc.content, text)
+        return resp["X-Generation-Cache"], text
+
+    def test_hit_bypass_refresh(self):
+        self.assertEqual(self.run_generation(), ("miss", "Hello world"))
+        self.assertEqual(self.run_generation(), ("hit", "Hello world"))
+        self.assertEqual(self.ollama.calls, 1)
+
+        self.ollama.chunks = ("Fresh ", "text")
+        self.assertEqual(self.run_generation(cache="bypass"), ("bypass", "Fresh text"))
+        self.assertEqual(self.run_generation(), ("hit", "Hello world"))
+        self.assertEqual(self.run_generation(cache="refresh"), ("refresh", "Fresh text"))
+        self.assertEqual(self.run_generation(), ("hit", "Fresh text"))
+
+        self.assertEqual(self.ollama.calls, 3)
+        # every request keeps its own history row, hits included
+        self.assertEqual(DocHistory.objects.filter(user=self.user).count(), 6)
+        self.assertEqual(GenerationCache.objects.get().hits, 3)
+
+    def test_failed_generation_not_stored(self):
+        self.ollama = StubOllama(fail=True)
+        self.read(self.generate())
+        self.wait_for_flights()
+        self.assertFalse(GenerationCache.objects.exists())
+
+    @override_settings(GENERATION_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(self.run_generation(), ("bypass", "Hello world"))
+        self.assertFalse(GenerationCache.objects.exists())
+
+    def test_key_and_replay(self):
+        self.assertNotEqual(generation_cache.generation_key("a", "bc"), generation_cache.generation_key("ab", "c"))
+        text = "one two  three\n\nfour"
+        chunks = list(generation_cache.replay_chunks(text, size=5))
+        self.assertEqual("".join(chunks), text)
+        self.assertTrue(all(c[-1].strip() for c in chunks))
+
+
+class CoalescingTests(GenerationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # holds the upstream stream until both requests are in
+        self.hold = threading.Event()
+        self.ollama = StubOllama(hold=self.hold)
+
+    def assertShared(self, bodies):
+        docs = [self.lines(body)[0] for body in bodies]
+        self.assertEqual(self.ollama.calls, 1)
+        self.assertEqual(len({doc.pk for doc in docs}), 2)
+        for doc in docs:
+            doc.refresh_from_db()
+            self.assertEqual((doc.status, doc.content), (DocHistory.COMPLETE, "Hello world"))
+
+    def test_sync(self):
+        first, second = self.generate(), self.generate()
+        self.assertEqual(second["X-Generation-Cache"], "coalesced")
+        self.hold.set()
+        bodies = [self.read(first), self.read(second)]
+        self.wait_for_flights()
+        self.assertShared(bodies)
+
+    def test_async(self):
+        async def both():
+            first, second = await self.agenerate(), await self.agenerate()
+            self.assertEqual(second["X-Generation-Cache"], "coalesced")
+            self.hold.set()
+            return await asyncio.gather(self.aread(first), self.aread(second))
+
+        self.assertShared(self.arun(both()))
+
+    def test_different_prompts_do_not_share(self):
+        first, second = self.generate(), self.generate("print('other')\n" + CODE)
+        self.assertNotEqual(second["X-Generation-Cache"], "coalesced")
+        self.hold.set()
+        self.read(first), self.read(second)
+        self.wait_for_flights()
+        self.assertEqual(self.ollama.calls, 2)
+
+    def test_failed_launch_retires_flight(self):
+        with mock.patch.object(flights, "start_flight_task", side_effect=RuntimeError("no loop")):
+            with self.assertRaises(RuntimeError):
+                asyncio.run(self.agenerate())
+        self.assertEqual(flights._flights, {})
+        self.assertEqual(self.ollama.scheduler.stats()["qwen2.5-coder:3b"]["active"], 0)
+
+        # the next identical request starts its own flight instead of hanging
+        async def retry():
+            return await self.aread(await self.agenerate())
+
+        self.hold.set()
+        self.assertTrue(self.arun(retry()).endswith("Hello world"))
+
+
+@override_settings(STREAM_CHECKPOINT_CHARS=10, STREAM_CHECKPOINT_SECONDS=3600)
+class CheckpointTests(GenerationTestCase):
+
+    def run_flight(self, chunks):
+        writes = []
+        ticket = FairScheduler(1, 1, 1, 1, 5).enqueue("m", "a")
+        flight = flights.Flight("checkpoint-test")
+        flight.attach(1)
+        flights.run_flight(flight, chunks, lambda ids, text, status: writes.append((status, text)), ticket)
+        return writes
+
+    def test_every_n_chars(self):
+        writes = self.run_flight(iter(["abcdef"] * 5))
+        self.assertEqual(
+            [(status, len(text)) for status, text in writes],
+            [("streaming", 12), ("streaming", 24), ("complete", 30)],
+        )
+
+    @override_settings(STREAM_CHECKPOINT_SECONDS=0)
+    def test_every_n_seconds(self):
+        writes = self.run_flight(iter(["a", "b"]))
+        self.assertEqual(writes, [("streaming", "a"), ("streaming", "ab"), ("complete", "ab")])
+
+    def test_failure_keeps_partial_text(self):
+        def chunks():
+            yield "x" * 12
+            raise requests.ConnectionError("dropped")
+
+        self.assertEqual(self.run_flight(chunks()), [("streaming", "x" * 12), ("failed", "x" * 12)])
+
+    def test_cancelled_task_fails_flight(self):
+        writes = []
+        ticket = FairScheduler(1, 1, 1, 1, 5).enqueue("m", "a")
+        flight, _ = flights.get_or_create_flight("checkpoint-cancel-test")
+        flight.attach(1)
+
+        async def chunks():
+            yield "partial"
+            await asyncio.sleep(10)
+
+        async def main():
+            persist = lambda ids, text, status: writes.append((status, text))
+            task = flights.start_flight_task(flight, chunks(), persist, ticket)
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        self.assertEqual(writes, [("failed", "partial")])
+        self.assertTrue(flight.done and flight.failed)
+        self.assertEqual(flights._flights, {})
+
+    def test_row_status(self):
+        hold = threading.Event()
+        self.ollama = StubOllama(chunks=("Hello world, ", "again"), hold=hold)
+        resp = self.generate()
+        doc = DocHistory.objects.get()
+        self.assertEqual((doc.status, doc.content), (DocHistory.STREAMING, ""))
+        hold.set()
+        self.read(resp)
+        self.wait_for_flights()
+        doc.refresh_from_db()
+        self.assertEqual((doc.status, doc.content), (DocHistory.COMPLETE, "Hello world, again"))
+
+
+class ResumeTests(GenerationTestCase):
+
+    def resume(self, doc_id, offset, **auth):
+        return self.client.get(f"/api/generate/{doc_id}/resume/?offset={offset}", **(auth or self.auth))
+
+    async def aresume(self, doc_id, offset):
+        request = AsyncRequestFactory().get(
+            f"/api/generate/{doc_id}/resume/?offset={offset}",
+            headers={"Authorization": self.auth["HTTP_AUTHORIZATION"]},
+        )
+        return await views.resume_generation_async(request, doc_id)
+
+    def split(self, body):
+        head, text = body.split("\n", 1)
+        return json.loads(head), text
+
+    def test_live_then_finished(self):
+        hold = threading.Event()
+        self.ollama = StubOllama(chunks=("Héllo ", "world"), hold=hold)
+        first = self.generate()
+        doc = DocHistory.objects.get()
+
+        # "H" + two bytes of "é": the resumed text starts at "llo"
+        live = self.resume(doc.pk, 3)
+        hold.set()
+        head, text = self.split(self.read(live))
+        self.assertEqual((head["status"], head["offset"], text), ("streaming", 3, "llo world"))
+        self.read(first)
+        self.wait_for_flights()
+
+        head, text = self.split(self.read(self.resume(doc.pk, 7)))
+        self.assertEqual((head["status"], text), ("complete", "world"))
+        async def resume_whole():
+            return await self.aread(await self.aresume(doc.pk, "junk"))
+
+        head, text = self.split(self.arun(resume_whole()))
+        self.assertEqual((head["offset"], text), (0, "Héllo world"))
+
+    def test_async_live(self):
+        hold = threading.Event()
+        self.ollama = StubOllama(hold=hold)
+
+        async def live():
+            first = await self.agenerate()
+            head = json.loads((await anext(aiter(first.streaming_content))).strip())
+            resumed = await self.aresume(head["id"], 6)
+            hold.set()
+            return (await asyncio.gather(self.aread(resumed), self.aread(first)))[0]
+
+        head, text = self.split(self.arun(live()))
+        self.assertEqual((head["status"], text), ("streaming", "world"))
+
+    def test_other_users_rows(self):
+        doc = DocHistory.objects.create(user=self.user, topic="t", content="secret")
+        bob = User.objects.create_user("bob", password="pw")
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(bob).access_token}"}
+        self.assertEqual(self.resume(doc.pk, 0, **auth).status_code, 404)
+
+
+# ---------------- RENDER CACHE ----------------
+DOC = """# Merge sort
+
+Splits the list in **two** halves and merges them.
+
+- stable
+- O(n log n)
+"""
+
+
+class RenderCacheTests(TestCase):
+
+    def test_lru_eviction_by_size(self):
+        cache = render_cache.RenderCache(max_bytes=10)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        cache.get("a")
+        cache.put("c", b"1234")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (b"1234", b"1234"))
+        cache.put("big", b"x" * 11)
+        self.assertIsNone(cache.get("big"))
+        self.assertEqual(cache.stats(), {"entries": 2, "bytes": 8, "hits": 3, "misses": 2})
+
+    def test_etag_not_modified(self):
+        user = User.objects.create_user("alice", password="pw")
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(user).access_token}"}
+        doc = DocHistory.objects.create(user=user, topic="Doc", content=DOC)
+        url = f"/api/history/{doc.pk}/pdf/"
+
+        first = self.client.get(url, **auth)
+        self.assertEqual(first.status_code, 200)
+        etag = first["ETag"]
+        with mock.patch.dict(render_cache.RENDERERS, pdf=mock.Mock(side_effect=AssertionError)):
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **auth)
+        self.assertEqual((again.status_code, again["ETag"]), (304, etag))
+
+        # new content, new tag: the old one no longer matches
+        DocHistory.objects.filter(pk=doc.pk).update(content=DOC + "\nMore.")
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **auth)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertNotEqual(self.client.get(f"/api/history/{doc.pk}/docx/", **auth)["ETag"], etag)
+
+
+# ---------------- MARKDOWN CORPUS ----------------
+CORPUS = {
+    "overview": """# Binary Search
+
+## Overview
+Binary search finds a target in a **sorted** array in `O(log n)` time.
+
+## Steps
+- Set `lo = 0` and `hi = n - 1`
+- Compare the *middle* element with the target
+- Discard the half that cannot contain it
+
+### Example
+```cpp
+int search(vector<int>& a, int x) {
+    int lo = 0, hi = a.size() - 1;
+    return -1;
+}
+```
+
+| Case | Time |
+|------|------|
+| Best | O(1) |
+| Worst | O(log n) |
+
+End of documentation
+""",
+    "bullets_then_heading": """- first
+- second
+## Next section
+Text after the heading.
+- third
+| a | b |
+|---|---|
+| 1 | 2 |
+""",
+    "ragged_table_at_eof": """Intro paragraph.
+
+| Name | Type | Notes |
+|---|---|---|
+| id | int |
+| name | char* | owned by [caller](https://example.com) |""",
+    "unclosed_fence": """# Snippet
+---
+```python
+def f():
+    ---
+    return 1""",
+    "plain": """Just a paragraph with no structure at all.
+
+Another one, with a trailing rule.
+---
+end.
+""",
+}
+
+
+# ---------------- STRUCTURE EXTRACTORS ----------------
+def ir_structure(blocks):
+    out = []
+    for b in blocks:
+        if isinstance(b, md.Heading):
+            out.append(("heading", b.level))
+        elif isinstance(b, md.Bullets):
+            out.append(("bullets", len(b.items)))
+        elif isinstance(b, md.Table):
+            out.append(("table", len(b.rows), len(b.rows[0])))
+        elif isinstance(b, md.Code):
+            out.append(("code",))
+        else:
+            out.append(("paragraph",))
+    return out
+
+
+def pdf_structure(story):
+    out = []
+    for f in story:
+        if isinstance(f, Spacer):
+            continue
+        if isinstance(f, ListFlowable):
+            out.append(("bullets", len(f._flowables)))
+        elif isinstance(f, Table):
+            rows = f._cellvalues
+            if len(rows) == 1 and len(rows[0]) == 1 and not isinstance(rows[0][0], Paragraph):
+                out.append(("code",))
+            else:
+                out.append(("table", len(rows), len(rows[0])))
+        elif f.style.name in ("TITLE", "H2", "H3"):
+            out.append(("heading", ("TITLE", "H2", "H3").index(f.style.name) + 1))
+        else:
+            out.append(("paragraph",))
+    return out
+
+
+def docx_structure(doc):
+    out = []
+    prev_bullet = False
+    for el in doc.element.body.iterchildren():
+        if el.tag == qn("w:tbl"):
+            rows = el.findall(qn("w:tr"))
+            cols = rows[0].findall(qn("w:tc"))
+            if len(rows) == 1 and len(cols) == 1 and cols[0].find(qn("w:tcPr")).find(qn("w:shd")) is not None:
+                out.append(("code",))
+            else:
+                out.append(("table", len(rows), len(cols)))
+        elif el.tag == qn("w:p"):
+            style = el.style or ""
+            if style.startswith("Heading"):
+                out.append(("heading", int(style[-1])))
+            elif style == "ListBullet":
+                if out and out[-1][0] == "bullets" and prev_bullet:
+                    out[-1] = ("bullets", out[-1][1] + 1)
+                else:
+                    out.append(("bullets", 1))
+            else:
+                out.append(("paragraph",))
+            prev_bullet = style == "ListBullet"
+            continue
+        prev_bullet = False
+    return out
+
+
+class MarkdownBlocksTests(SimpleTestCase):
+
+    def test_overview_blocks(self):
+        blocks = md.parse_blocks(CORPUS["overview"])
+        self.assertEqual(ir_structure(blocks), [
+            ("heading", 1), ("heading", 2), ("paragraph",), ("heading", 2),
+            ("bullets", 3), ("heading", 3), ("code",), ("table", 3, 2),
+        ])
+        self.assertEqual(blocks[-1].rows[0], ("Case", "Time"))
+
+    def test_bullets_flush_before_heading_and_table(self):
+        blocks = md.parse_blocks(CORPUS["bullets_then_heading"])
+        self.assertEqual(ir_structure(blocks), [
+            ("bullets", 2), ("heading", 2), ("paragraph",), ("bullets", 1), ("table", 2, 2),
+        ])
+
+    def test_ragged_table_at_end_is_kept_and_padded(self):
+        table = md.parse_blocks(CORPUS["ragged_table_at_eof"])[-1]
+        self.assertEqual(len(table.rows), 3)
+        self.assertEqual(table.rows[1], ("id", "int", ""))
+
+    def test_rules_inside_code_survive_and_unclosed_fence_is_kept(self):
+        blocks = md.parse_blocks(CORPUS["unclosed_fence"])
+        self.assertEqual(ir_structure(blocks), [("heading", 1), ("code",)])
+        self.assertIn("    ---", blocks[1].text)
+
+    def test_end_markers_dropped(self):
+        blocks = md.parse_blocks(CORPUS["plain"])
+        self.assertEqual([b.text for b in blocks], [
+            "Just a paragraph with no structure at all.",
+            "Another one, with a trailing rule.",
+        ])
+
+    def test_parse_is_cached_per_document(self):
+        text = CORPUS["overview"]
+        self.assertIs(md.parse_blocks(text), md.parse_blocks("".join(list(text))))
+
+    def test_pdf_and_docx_see_identical_structure(self):
+        for name, text in CORPUS.items():
+            with self.subTest(name):
+                expected = ir_structure(md.parse_blocks(text))
+                self.assertEqual(pdf_structure(build_story(text)), expected)
+                self.assertEqual(docx_structure(build_document(text)), expected)
+
+    def test_renderers_produce_files(self):
+        for text in CORPUS.values():
+            self.assertTrue(create_pdf(text).getvalue().startswith(b"%PDF"))
+            self.assertTrue(create_docx(text).getvalue().startswith(b"PK"))
+
+
+# ---------------- INLINE FORMAT ----------------
+def legacy_md_inline(text):
+    """The multi-pass md_inline this module used to ship; kept as the
+    golden reference for the single-pass formatter."""
+    text = re.sub(r'\[(.*?)\]\((.*?)\)', r"<link href='\2'><u>\1</u></link>", text)
+    text = re.sub(r'`(.*?)`', r"<font face='Courier' backColor='#EEF2F7'>\1</font>", text)
+    for t in ["long long", "size_t", "double", "float", "char", "bool", "long", "int"]:
+        text = re.sub(
+            rf'\b{re.escape(t)}\b',
+            rf"<font face='Courier' color='#0A58CA'><b>{t}</b></font>",
+            text
+        )
+    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
+    text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text)
+    return text
+
+
+INLINE_CORPUS = [
+    "Plain sentence without markup.",
+    "Binary search finds a target in a **sorted** array in `O(log n)` time.",
+    "Compare the *middle* element with the target",
+    "Returns an `int` index, or -1 when the value is missing.",
+    "Takes a `const char*` and a size_t length; returns bool.",
+    "**Note:** the *input* must be a `vector<int>` sorted in **ascending** order.",
+    "See the [reference](https://en.cppreference.com/w/cpp/algorithm) for details.",
+    "Use [**std::sort**](https://example.com/sort) before calling *search*.",
+    "`double` and float both work, but *char* keys need a comparator.",
+    "A **bold *and italic* phrase** and *an italic **bold** phrase*.",
+    "Stray * asterisks * around **text** and an unmatched ` backtick.",
+    "integer, printf and boolean are not type names, int is.",
+    "| `int` | **O(1)** | [docs](https://example.com) |",
+    "",
+]
+
+
+class InlineFormatTests(SimpleTestCase):
+
+    def test_matches_legacy_output(self):
+        for line in INLINE_CORPUS + [b.text for t in CORPUS.values() for b in md.parse_blocks(t)
+                                     if isinstance(b, (md.Heading, md.Paragraph))]:
+            with self.subTest(line):
+                self.assertEqual(md_inline(line), legacy_md_inline(line))
+
+    def test_long_long_wrapped_once(self):
+        self.assertEqual(
+            md_inline("a long long value"),
+            "a <font face='Courier' color='#0A58CA'><b>long long</b></font> value",
+        )
+
+    def test_link_url_left_alone(self):
+        self.assertEqual(
+            md_inline("[sizes](https://example.com/int/char)"),
+            "<link href='https://example.com/int/char'><u>sizes</u></link>",
+        )
+
+    def test_asterisk_inside_code_does_not_open_italics(self):
+        # the old passes emitted <i> inside the font tag and </i> after it
+        self.assertEqual(
+            md_inline("Multiply `a * b` then add *c*."),
+            "Multiply <font face='Courier' backColor='#EEF2F7'>a * b</font> then add <i>c</i>.",
+        )
+
+
+# ---------------- DOCX RUNS ----------------
+def legacy_apply_inline_format(paragraph, text):
+    """The one-run-per-plain-character engine docx_generator used to
+    ship; kept as the golden reference for run coalescing."""
+    text = text.replace("** ", "**").replace(" **", "**")
+    if text.count("**") % 2 != 0:
+        text = text.replace("**", "")
+    if text.count("*") % 2 != 0:
+        text = text.replace("*", "")
+    i = 0
+    n = len(text)
+    while i < n:
+        if text[i:i+2] == "**":
+            end = text.find("**", i+2)
+            if end != -1:
+                run = paragraph.add_run(text[i+2:end])
+                run.bold = True
+                i = end + 2
+                continue
+        if text[i] == "*" and (i+1 < n and text[i+1] != "*"):
+            end = text.find("*", i+1)
+            if end != -1:
+                run = paragraph.add_run(text[i+1:end])
+                run.italic = True
+                i = end + 1
+                continue
+        if text[i] == "`":
+            end = text.find("`", i+1)
+            if end != -1:
+                run = paragraph.add_run(text[i+1:end])
+                run.font.name = "Consolas"
+                run.font.size = Pt(10)
+                run.font.color.rgb = RGBColor(180, 0, 0)
+                i = end + 1
+                continue
+        if text[i] == "[":
+            close = text.find("]", i)
+            if close != -1 and text[close+1:close+2] == "(":
+                end = text.find(")", close)
+                if end != -1:
+                    run = paragraph.add_run(text[i+1:close])
+                    run.font.color.rgb = RGBColor(0, 102, 204)
+                    run.font.underline = True
+                    i = end + 1
+                    continue
+        paragraph.add_run(text[i])
+        i += 1
+
+
+def run_spans(fn, text):
+    """(style, text) spans a formatter produces, with adjacent plain runs
+    merged so both engines can be compared."""
+    paragraph = Document().add_paragraph()
+    fn(paragraph, text)
+    spans = []
+    for run in paragraph.runs:
+        color = run.font.color.rgb if run.font.color.type else None
+        style = (run.bold, run.italic, run.font.name, run.font.size, color, run.font.underline)
+        if spans and not any(style) and not any(spans[-1][0]):
+            spans[-1] = (style, spans[-1][1] + run.text)
+        else:
+            spans.append((style, run.text))
+    return spans
+
+
+class DocxRunTests(SimpleTestCase):
+
+    def test_spans_match_legacy_engine(self):
+        for line in INLINE_CORPUS + ["Multiply `a * b` then add *c*.", "[unclosed (link", "a [b] (c)"]:
+            with self.subTest(line):
+                self.assertEqual(run_spans(apply_inline_format, line), run_spans(legacy_apply_inline_format, line))
+
+    def test_one_run_per_span(self):
+        paragraph = Document().add_paragraph()
+        apply_inline_format(paragraph, "x" * 500 + " **bold** " + "y" * 500)
+        self.assertEqual([len(r.text) for r in paragraph.runs], [500, 4, 500])
+
+
+# ---------------- EXPORT JOBS ----------------
+@override_settings(EXPORT_SYNC_MAX_CHARS=200)
+class ExportJobTests(SimpleTestCase):
+
+    def wait_for(self, job_id):
+        for _ in range(300):
+            job = self.client.get(f"/api/exports/{job_id}/").json()
+            if job["status"] not in ("queued", "running"):
+                return job
+            time.sleep(0.05)
+        self.fail("export job did not finish")
+
+    def test_small_documents_render_inline(self):
+        resp = self.client.post("/api/pdf/", {"docs": CORPUS["plain"]}, content_type="application/json")
+        self.assertEqual(resp.status_code, 200)
+
+    def test_large_document_becomes_job(self):
+        resp = self.client.post("/api/docx/", {"docs": CORPUS["overview"]}, content_type="application/json")
+        self.assertEqual(resp.status_code, 202)
+        job = self.wait_for(resp.json()["id"])
+        self.assertEqual(job["status"], "done")
+
+        resp = self.client.get(f"/api/exports/{job['id']}/download/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(b"".join(resp.streaming_content).startswith(b"PK"))
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get("/api/exports/missing/").status_code, 404)
+
+    def test_broken_pool_is_replaced(self):
+        pool = export_jobs.get_pool()
+        with self.assertRaises(BrokenProcessPool):
+            export_jobs.run(os._exit, 1).result()
+        deadline = time.monotonic() + 5
+        while export_jobs.get_pool() is pool and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(export_jobs.run(pow, 2, 10).result(), 1024)
+
+
+# ---------------- SPOOLED EXPORTS ----------------
+class SpooledExportTests(SimpleTestCase):
+
+    @override_settings(EXPORT_SPOOL_MAX_BYTES=512)
+    def test_large_output_spills_and_is_not_cached(self):
+        text = CORPUS["overview"] + "\nspill"
+        before = render_cache.get_cache().stats()["entries"]
+        f = render_cache.render_file(text, "pdf")
+        self.assertTrue(f._rolled)
+        self.assertTrue(f.read(5).startswith(b"%PDF"))
+        self.assertEqual(render_cache.get_cache().stats()["entries"], before)
+
+    def test_download_is_chunked_with_length(self):
+        resp = self.client.post("/api/docx/", {"docs": CORPUS["plain"]}, content_type="application/json")
+        body = b"".join(resp.streaming_content)
+        self.assertEqual(int(resp["Content-Length"]), len(body))
+        self.assertTrue(body.startswith(b"PK"))
+
+    @override_settings(ASYNC_GENERATION=True)
+    def test_asgi_delivery_reads_block_by_block(self):
+        f = tempfile.TemporaryFile()
+        f.write(os.urandom(views.EXPORT_BLOCK_SIZE * 3 + 10))
+        f.seek(0)
+        resp = views.export_response(f, "pdf")
+        self.assertTrue(resp.is_async)
+        self.assertEqual(resp["Content-Length"], str(views.EXPORT_BLOCK_SIZE * 3 + 10))
+
+        async def consume():
+            sizes = []
+            async for block in resp.streaming_content:
+                # nothing is read ahead of what was sent
+                self.assertEqual(f.tell(), sum(sizes) + len(block))
+                sizes.append(len(block))
+            return sizes
+
+        self.assertEqual(asyncio.run(consume()), [views.EXPORT_BLOCK_SIZE] * 3 + [10])
+        resp.close()
+        self.assertTrue(f.closed)
+
+    @override_settings(ASYNC_GENERATION=True)
+    async def test_asgi_download(self):
+        resp = await self.async_client.post("/api/docx/", {"docs": CORPUS["plain"]}, content_type="application/json")
+        self.assertTrue(resp.is_async)
+        body = b"".join([block async for block in resp.streaming_content])
+        self.assertEqual(int(resp["Content-Length"]), len(body))
+        self.assertTrue(body.startswith(b"PK"))
+
+# ---------------- BULK EXPORT ----------------
+class BulkExportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pw")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+        self.docs = [
+            DocHistory.objects.create(user=self.user, topic=f"Doc {name}", content=text)
+            for name, text in CORPUS.items()
+        ]
+
+    def export(self, **body):
+        return self.client.post("/api/history/export/", body, content_type="application/json", **self.auth)
+
+    def test_zip_of_selected_ids(self):
+        resp = self.export(ids=[self.docs[0].id, self.docs[2].id], format="docx")
+        self.assertEqual(resp["Content-Type"], "application/zip")
+        with zipfile.ZipFile(io.BytesIO(b"".join(resp.streaming_content))) as zf:
+            self.assertEqual(zf.namelist(), ["001-doc-overview.docx", "002-doc-ragged_table_at_eof.docx"])
+            self.assertTrue(zf.read(zf.namelist()[0]).startswith(b"PK"))
+
+    def test_merged_pdf_has_bookmark_per_document(self):
+        resp = self.export(archive="pdf")
+        data = b"".join(resp.streaming_content)
+        self.assertTrue(data.startswith(b"%PDF"))
+        for doc in self.docs:
+            self.assertIn(doc.topic.encode(), data)
+
+    def test_date_range_and_ownership(self):
+        other = User.objects.create_user("bob", password="pw")
+        DocHistory.objects.create(user=other, topic="Not mine", content="x")
+        DocHistory.objects.filter(pk=self.docs[0].pk).update(created_at="2020-01-01T12:00:00Z")
+
+        resp = self.export(**{"from": "2020-01-01", "to": "2020-01-01"})
+        with zipfile.ZipFile(io.BytesIO(b"".join(resp.streaming_content))) as zf:
+            self.assertEqual(zf.namelist(), ["001-doc-overview.pdf"])
+
+        self.assertEqual(self.export(**{"from": "2019-01-01", "to": "2019-12-31"}).status_code, 404)
+        self.assertEqual(self.export(**{"from": "yesterday"}).status_code, 400)
+
+    @override_settings(BULK_EXPORT_MAX_DOCS=2)
+    def test_whole_history_zip_is_read_in_batches(self):
+        # ties on created_at must not drop or repeat a document between batches
+        DocHistory.objects.filter(user=self.user).update(created_at=self.docs[0].created_at)
+        resp = self.export(format="docx")
+        with zipfile.ZipFile(io.BytesIO(b"".join(resp.streaming_content))) as zf:
+            names = zf.namelist()
+        self.assertEqual(len(names), len(self.docs))
+        self.assertEqual(names[-1], f"{len(self.docs):03d}-{slugify(self.docs[-1].topic)}.docx")
+        self.assertEqual(self.export(archive="pdf").status_code, 400)
+
+    @override_settings(EXPORT_MAX_PENDING=1)
+    def test_full_export_pool_is_busy(self):
+        blocker = export_jobs.run(time.sleep, 0.5)
+        for archive in ("zip", "pdf"):
+            resp = self.export(archive=archive)
+            self.assertEqual((resp.status_code, resp["Retry-After"]), (503, "5"))
+        blocker.result()
+
+    @override_settings(BULK_EXPORT_MAX_DOCS=3)
+    def test_invalid_ids(self):
+        for ids in ("1,2", 5, [], ["1"], [1, None], [True], [1, 2, 3, 4], {"a": 1}):
+            with self.subTest(ids=ids):
+                self.assertEqual(self.export(ids=ids).status_code, 400)
+
+# ---------------- HISTORY LIST ----------------
+class HistoryListTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pw")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+        self.docs = [
+            DocHistory.objects.create(user=self.user, topic=f"Doc {i}", content=f"{i} " + "x" * 1000)
+            for i in range(7)
+        ]
+        # ties on created_at must still page by id
+        DocHistory.objects.filter(pk__in=[d.pk for d in self.docs[2:5]]).update(created_at=self.docs[2].created_at)
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        seen = []
+        url = "/api/history/?limit=3"
+        while url:
+            page = self.client.get(url, **self.auth).json()
+            seen += [row["id"] for row in page["results"]]
+            url = page["next"] and f"/api/history/?limit=3&cursor={page['next']}"
+        expected = sorted(self.docs, key=lambda d: (DocHistory.objects.get(pk=d.pk).created_at, d.pk), reverse=True)
+        self.assertEqual(seen, [d.pk for d in expected])
+
+    def test_list_rows_carry_preview_not_content(self):
+        row = self.client.get("/api/history/", **self.auth).json()["results"][0]
+        self.assertNotIn("content", row)
+        self.assertEqual(len(row["preview"]), 160)
+
+    def test_detail_returns_content(self):
+        doc = self.docs[0]
+        data = self.client.get(f"/api/history/{doc.pk}/", **self.auth).json()
+        self.assertEqual(data["content"], doc.content)
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get("/api/history/?cursor=nope", **self.auth).status_code, 400)
+
+
+# ---------------- HISTORY SEARCH ----------------
+class HistorySearchTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pw")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+        self.binary = DocHistory.objects.create(user=self.user, topic="Binary search", content=CORPUS["overview"])
+        self.other = DocHistory.objects.create(user=self.user, topic="Notes", content="Searching before lunch.")
+
+    def search(self, q):
+        return self.client.get("/api/history/search/", {"q": q}, **self.auth).json()["results"]
+
+    def test_ranked_snippets(self):
+        results = self.search("search")
+        self.assertEqual([r["id"] for r in results], [self.binary.id, self.other.id])
+        self.assertIn("<mark>", results[0]["snippet"])
+
+    def test_stemmed_and_all_words(self):
+        self.assertEqual([r["id"] for r in self.search("searches lunch")], [self.other.id])
+        self.assertEqual(self.search("binary lunch"), [])
+
+    def test_other_users_and_streaming_rows_are_hidden(self):
+        bob = User.objects.create_user("bob", password="pw")
+        DocHistory.objects.create(user=bob, topic="Binary search", content="bob's copy")
+        streaming = DocHistory.objects.create(user=self.user, topic="Binary heap", content="", status=DocHistory.STREAMING)
+        self.assertEqual([r["id"] for r in self.search("binary")], [self.binary.id])
+
+        streaming.content = "done"
+        streaming.status = DocHistory.COMPLETE
+        streaming.save()
+        self.assertEqual(len(self.search("binary")), 2)
+
+    def test_index_follows_edits_and_deletes(self):
+        self.other.content = "Heaps and priority queues."
+        self.other.save()
+        self.assertEqual(self.search("lunch"), [])
+        self.assertEqual([r["id"] for r in self.search("heaps")], [self.other.id])
+        self.other.delete()
+        self.assertEqual(self.search("heaps"), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('" OR owner:* NEAR('), [])
+
+    def test_words_do_not_match_the_owner_column(self):
+        self.assertEqual(self.search(f"u{self.user.id}"), [])
+        self.assertEqual([r["id"] for r in self.search(f"u{self.user.id} lunch")], [])
+
+    def test_fallback_matches(self):
+        results = search._fallback_search(self.user, ["binary"], 10)
+        self.assertEqual([r["id"] for r in results], [self.binary.id])
+
+
+# ---------------- CONCURRENT WRITES ----------------
+class ConcurrentHistoryWriteTests(TransactionTestCase):
+    WRITERS = 8
+    ROUNDS = 15
+
+    def test_journal_mode(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+
+    def test_parallel_writers(self):
+        users = [User.objects.create_user(f"writer{n}") for n in range(self.WRITERS)]
+        barrier = threading.Barrier(self.WRITERS)
+        errors = []
+
+        def writer(user):
+            try:
+                barrier.wait()
+                for n in range(self.ROUNDS):
+                    # a generation: the row, a checkpoint, then the final
+                    # save in a read-then-write transaction
+                    doc = DocHistory.objects.create(user=user, topic=f"Doc {n}", content="", status=DocHistory.STREAMING)
+                    DocHistory.objects.filter(pk=doc.pk).update(content="x" * 4096)
+                    with transaction.atomic():
+                        DocHistory.objects.filter(user=user).count()
+                        DocHistory.objects.filter(pk=doc.pk).update(content="x" * 8192, status=DocHistory.COMPLETE)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(u,)) for u in users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            DocHistory.objects.filter(status=DocHistory.COMPLETE).count(),
+            self.WRITERS * self.ROUNDS,
+        )
+
+
+# ---------------- METRICS ----------------
+class FakeOllamaResponse:
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+    def close(self):
+        pass
+
+
+class MetricsTests(SimpleTestCase):
+
+    def test_histogram_buckets_are_cumulative(self):
+        h = metrics.Histogram("docgen_test_seconds", "Test.", ["view"], buckets=(0.1, 1))
+        metrics._registry.remove(h)
+        for value in (0.05, 0.5, 0.5, 5):
+            h.observe(value, "a")
+        lines = h.render()
+        self.assertIn('docgen_test_seconds_bucket{view="a",le="0.1"} 1', lines)
+        self.assertIn('docgen_test_seconds_bucket{view="a",le="1"} 3', lines)
+        self.assertIn('docgen_test_seconds_bucket{view="a",le="+Inf"} 4', lines)
+        self.assertIn('docgen_test_seconds_count{view="a"} 4', lines)
+
+    def test_render_time_and_size(self):
+        before = metrics.RENDER_BYTES.count("docx")
+        create_docx(CORPUS["plain"])
+        self.assertEqual(metrics.RENDER_BYTES.count("docx"), before + 1)
+
+    def test_ollama_stream_meter(self):
+        client = OllamaClient(["http://ollama.invalid/api/generate"])
+        lines = [json.dumps({"response": f"tok{i} "}).encode() for i in range(5)]
+        lines.append(json.dumps({"response": "", "done": True}).encode())
+        client.session.post = lambda *args, **kwargs: FakeOllamaResponse(lines)
+
+        tokens = metrics.OLLAMA_TOKENS.value("metrics-test")
+        text = "".join(client.stream({"model": "metrics-test", "prompt": "x"}))
+        self.assertEqual(text, "tok0 tok1 tok2 tok3 tok4 ")
+        self.assertEqual(metrics.OLLAMA_TOKENS.value("metrics-test"), tokens + 5)
+        self.assertEqual(metrics.OLLAMA_TTFT.count("metrics-test"), metrics.OLLAMA_REQUESTS.value("metrics-test", "ok"))
+
+        stream = client.stream({"model": "metrics-test", "prompt": "x"})
+        next(stream)
+        stream.close()
+        self.assertEqual(metrics.OLLAMA_REQUESTS.value("metrics-test", "cancelled"), 1)
+
+    def test_endpoint(self):
+        resp = self.client.get("/api/metrics/")
+        self.assertEqual(resp.status_code, 200)
+        body = resp.content.decode()
+        self.assertIn("# TYPE docgen_ollama_time_to_first_token_seconds histogram", body)
+        self.assertIn("docgen_active_streams 0", body)
+        self.assertIn("docgen_active_flights 0", body)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_endpoint_token(self):
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 401)
+        resp = self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(resp.status_code, 200)
+
+
+# ---------------- SERVER-TIMING / PROFILES ----------------
+class ServerTimingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pw")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+
+    def phases(self, resp):
+        return dict(part.split(";dur=") for part in resp["Server-Timing"].split(", "))
+
+    def test_export_phases(self):
+        doc = DocHistory.objects.create(user=self.user, topic="Doc", content=CORPUS["plain"])
+        resp = self.client.get(f"/api/history/{doc.pk}/pdf/", **self.auth)
+        self.assertEqual(resp.status_code, 200)
+        phases = self.phases(resp)
+        self.assertEqual(list(phases), ["db", "render", "total"])
+        self.assertGreaterEqual(float(phases["total"]), float(phases["render"]))
+
+    def test_span_outside_request_is_ignored(self):
+        with timing.span("idle"):
+            pass
+        self.assertIsNone(timing._spans.get())
+
+    @override_settings(SERVER_TIMING=False)
+    def test_disabled(self):
+        self.assertNotIn("Server-Timing", self.client.get("/api/status/"))
+
+    def test_exposed_to_the_frontend(self):
+        resp = self.client.get("/api/status/", HTTP_ORIGIN="http://localhost:3000")
+        exposed = resp["Access-Control-Expose-Headers"].split(", ")
+        self.assertIn("Server-Timing", exposed)
+        self.assertIn("X-Profile-Id", exposed)
+
+
+class ProfileTests(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        override = override_settings(PROFILE_DIR=self.dir.name, PROFILE_KEEP=2)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def auth(self, user):
+        return {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+    def test_staff_capture_and_download(self):
+        staff = self.auth(User.objects.create_user("admin", password="pw", is_staff=True))
+        resp = self.client.get("/api/history/?profile=1", **staff)
+        self.assertEqual(resp.status_code, 200)
+        profile_id = resp["X-Profile-Id"]
+
+        text = self.client.get(f"/api/profiles/{profile_id}/?output=text", **staff)
+        self.assertIn("function calls", text.content.decode())
+        raw = self.client.get(f"/api/profiles/{profile_id}/", **staff)
+        self.assertEqual(raw.status_code, 200)
+
+        for _ in range(3):
+            self.client.get("/api/history/", HTTP_X_PROFILE="1", **staff)
+        self.assertEqual(len(os.listdir(self.dir.name)), 2)
+
+    def test_other_users_are_not_profiled(self):
+        user = self.auth(User.objects.create_user("bob", password="pw"))
+        resp = self.client.get("/api/history/?profile=1", **user)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("X-Profile-Id", resp)
+        self.assertEqual(self.client.get(f"/api/profiles/{'0' * 32}/", **user).status_code, 403)
+
+
+# ---------------- FAIR-SHARE SCHEDULER ----------------
+class FairSchedulerTests(SimpleTestCase):
+
+    def test_round_robin_across_users(self):
+        scheduler = FairScheduler(limit=1, max_waiting=10, per_user=1, max_user_waiting=10, timeout=5)
+        a = [scheduler.enqueue("m", "a") for _ in range(3)]
+        b = scheduler.enqueue("m", "b")
+        c = scheduler.enqueue("m", "c")
+        self.assertTrue(a[0].admitted)
+        self.assertEqual([t.position() for t in (b, c, a[1], a[2])], [1, 2, 3, 4])
+
+        order = []
+        running = a[0]
+        for _ in range(4):
+            running.release()
+            running = next(t for t in (b, c, a[1], a[2]) if t.admitted)
+            order.append(running)
+        self.assertEqual(order, [b, c, a[1], a[2]])
+
+    def test_per_user_running_limit(self):
+        scheduler = FairScheduler(limit=3, max_waiting=10, per_user=2, max_user_waiting=10, timeout=5)
+        a = [scheduler.enqueue("m", "a") for _ in range(3)]
+        self.assertEqual([t.admitted for t in a], [True, True, False])
+        self.assertTrue(scheduler.enqueue("m", "b").admitted)
+        a[0].release()
+        self.assertTrue(a[2].admitted)
+
+    def test_queue_limits(self):
+        scheduler = FairScheduler(limit=1, max_waiting=3, per_user=1, max_user_waiting=2, timeout=5)
+        scheduler.enqueue("m", "a")
+        scheduler.enqueue("m", "a")
+        scheduler.enqueue("m", "a")
+        with self.assertRaises(OllamaBusy):
+            scheduler.enqueue("m", "a")
+        scheduler.enqueue("m", "b")
+        with self.assertRaises(OllamaBusy):
+            scheduler.enqueue("m", "c")
+        self.assertEqual(scheduler.stats()["m"]["waiting"], 3)
+
+    def run_queued_flight(self, scheduler, key):
+        holder = scheduler.enqueue("m", "a")
+        ticket = scheduler.enqueue("m", "b")
+        flight, _ = flights.get_or_create_flight(key)
+        flight.attach()
+        flights.start_flight_thread(flight, iter(["hello"]), lambda *args: None, ticket)
+        return holder, flights.FlightStream(flight, "head\n", "ERR", busy_message="BUSY")
+
+    def test_stream_reports_queue_position(self):
+        scheduler = FairScheduler(limit=1, max_waiting=10, per_user=1, max_user_waiting=10, timeout=5)
+        holder, stream = self.run_queued_flight(scheduler, "scheduler-test-position")
+        threading.Timer(0.2, holder.release).start()
+        self.assertEqual(list(stream), ["head\n", '{"queue": 1}\n', '{"queue": 0}\n', "hello"])
+
+    def test_queue_timeout_ends_stream_busy(self):
+        scheduler = FairScheduler(limit=1, max_waiting=10, per_user=1, max_user_waiting=10, timeout=0.2)
+        holder, stream = self.run_queued_flight(scheduler, "scheduler-test-timeout")
+        self.assertEqual(list(stream), ["head\n", '{"queue": 1}\n', "BUSY"])
+        holder.release()
+        self.assertEqual(scheduler.stats()["m"], {"active": 0, "waiting": 0, "limit": 1, "users_waiting": 0})
+
+
+# ---------------- OLLAMA NODES ----------------
+class FakeOllamaTestCase(SimpleTestCase):
+    """Runs a fake_ollama server per SERVERS entry (name -> options);
+    self.urls maps the names, plus "dead" (nothing listening), to URLs."""
+    SERVERS = {}
+    MODEL = "qwen2.5-coder:3b"
+    PAYLOAD = {"model": MODEL, "prompt": "x", "options": {"num_predict": 3}}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servers = {name: fake_ollama.make_server(port=0, **options) for name, options in cls.SERVERS.items()}
+        cls.urls = {}
+        for name, server in cls.servers.items():
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            cls.urls[name] = "http://127.0.0.1:%d" % server.server_address[1]
+        cls.urls["dead"] = "http://127.0.0.1:%d/api/generate" % free_port()
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers.values():
+            server.shutdown()
+            server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        for server in self.servers.values():
+            server.loaded.clear()
+
+
+class NodePoolTests(FakeOllamaTestCase):
+    SERVERS = {
+        "a": {"latency": 0, "rate": 1000},
+        "b": {"latency": 0, "rate": 1000},
+        "phi3": {"latency": 0, "rate": 1000, "models": ["phi3:latest"]},
+        "failing": {"error_rate": 1},
+    }
+
+    def pool(self, *names):
+        return NodePool([self.urls[n] for n in names], per_node=2, timeout=1)
+
+    def test_health_check(self):
+        self.servers["b"].loaded[self.MODEL] = time.time() + 60
+        pool = self.pool("dead", "b")
+        pool.check_all()
+        dead, b = pool.stats()
+        self.assertFalse(dead["healthy"])
+        self.assertTrue(b["healthy"])
+        self.assertEqual(b["loaded"], [self.MODEL])
+        self.assertEqual(b["pulled"], fake_ollama.MODELS)
+
+    def test_prefers_loaded_model_then_least_loaded(self):
+        self.servers["b"].loaded[self.MODEL] = time.time() + 60
+        pool = self.pool("dead", "a", "b")
+        pool.check_all()
+        dead, a, b = pool.nodes
+        self.assertIs(pool.acquire(self.MODEL), b)
+        self.assertIs(pool.acquire(self.MODEL), b)
+        # b is at per_node: spill over to the idle node
+        self.assertIs(pool.acquire(self.MODEL), a)
+        self.assertIs(pool.acquire("phi3:latest"), a)
+        pool.release(b, self.MODEL)
+        self.assertIs(pool.acquire("phi3:latest"), b)
+
+    def test_full_nodes_wait_for_a_slot(self):
+        pool = NodePool([self.urls["a"]], per_node=1, wait_timeout=0.2)
+        node = pool.acquire(self.MODEL)
+        with self.assertRaises(OllamaBusy):
+            pool.acquire(self.MODEL)
+        with self.assertRaises(OllamaBusy):
+            asyncio.run(pool.aacquire(self.MODEL))
+        self.assertFalse(pool.hold(node, self.MODEL))
+        # the limit is per model
+        self.assertIs(pool.acquire("phi3:latest"), node)
+
+        pool.wait_timeout = 5
+        threading.Timer(0.1, pool.release, args=(node, self.MODEL)).start()
+        self.assertIs(pool.acquire(self.MODEL), node)
+        self.assertEqual(node.running, {self.MODEL: 1, "phi3:latest": 1})
+
+    def test_skips_node_without_model(self):
+        pool = self.pool("phi3", "a")
+        pool.check_all()
+        self.assertIs(pool.acquire(self.MODEL), pool.nodes[1])
+        self.assertIs(pool.acquire("phi3:latest"), pool.nodes[0])
+
+    def test_failover_before_first_token(self):
+        client = OllamaClient([self.urls[n] for n in ("dead", "failing", "a")])
+        before = failovers.value(client.nodes.nodes[0].base)
+        self.assertEqual("".join(client.stream(self.PAYLOAD)), "tok0 tok1 tok2 ")
+        dead, failing, a = client.nodes.stats()
+        self.assertEqual([dead["failures"], failing["failures"], a["failures"]], [1, 1, 0])
+        self.assertFalse(dead["healthy"] or failing["healthy"])
+        self.assertEqual(a["loaded"], [self.MODEL])
+        self.assertEqual([n["active"] for n in (dead, failing, a)], [0, 0, 0])
+        self.assertEqual(failovers.value(client.nodes.nodes[0].base), before + 1)
+
+    def test_async_failover(self):
+        client = OllamaClient([self.urls[n] for n in ("dead", "b")])
+
+        async def collect():
+            return "".join([chunk async for chunk in client.astream(self.PAYLOAD)])
+
+        self.assertEqual(asyncio.run(collect()), "tok0 tok1 tok2 ")
+        self.assertEqual([n["failures"] for n in client.nodes.stats()], [1, 0])
+
+    def test_no_failover_after_first_token(self):
+        client = OllamaClient(["http://one.invalid", "http://two.invalid"])
+        calls = []
+
+        def lines():
+            yield json.dumps({"response": "tok0 "}).encode()
+            raise requests.ConnectionError("dropped")
+
+        def post(url, **kwargs):
+            calls.append(url)
+            response = FakeOllamaResponse([])
+            response.iter_lines = lines
+            return response
+
+        client.session.post = post
+        stream = client.stream(self.PAYLOAD)
+        self.assertEqual(next(stream), "tok0 ")
+        with self.assertRaises(requests.ConnectionError):
+            next(stream)
+        self.assertEqual(calls, ["http://one.invalid/api/generate"])
+
+
+# ---------------- MODEL WARM-UP ----------------
+class WarmupTests(FakeOllamaTestCase):
+    SERVERS = {"slow": {"latency": 0, "rate": 1000, "load_time": 0.3}}
+
+    def ollama(self):
+        return OllamaClient([self.urls["slow"], self.urls["dead"]], cold_start_seconds=0.2)
+
+    @override_settings(OLLAMA_KEEP_ALIVE="30m", OLLAMA_KEEP_ALIVE_PER_MODEL={"phi3:latest": "-1"})
+    def test_keep_alive(self):
+        self.assertEqual(warmup.keep_alive(self.MODEL), "30m")
+        self.assertEqual(warmup.keep_alive("phi3:latest"), -1)
+
+    def test_hours(self):
+        self.assertIsNone(warmup.parse_hours(""))
+        day, night = warmup.parse_hours("8-20"), warmup.parse_hours("22-6")
+        self.assertEqual([warmup.in_hours(day, h) for h in (7, 8, 19, 20)], [False, True, True, False])
+        self.assertEqual([warmup.in_hours(night, h) for h in (21, 22, 3, 6)], [False, True, True, False])
+        self.assertTrue(warmup.in_hours(None, 3))
+
+    @override_settings(OLLAMA_WARMUP_MODELS=[], OLLAMA_DEFAULT_MODEL="qwen2.5-coder:3b")
+    def test_warms_only_the_default_model_unless_told(self):
+        with mock.patch.object(warmup, "_warmer", None), mock.patch.object(warmup, "get_client"):
+            self.assertEqual(warmup.get_warmer().models, ["qwen2.5-coder:3b"])
+
+    def test_warm_up_loads_each_model_once(self):
+        client = self.ollama()
+        client.nodes.check_all()
+        warmer = warmup.Warmer(client, [self.MODEL, "phi3:latest"], interval=0)
+        warmer.warm_all()
+        self.assertEqual(sorted(self.servers["slow"].loaded), ["phi3:latest", self.MODEL])
+        self.assertEqual([s["load"] for s in warmer.stats()], [0.3, 0.3])
+        self.assertEqual(warmer.stats()[0]["node"], self.urls["slow"])
+
+        # already loaded: returns at once, only refreshes keep_alive
+        warmer.warm_all()
+        self.assertEqual([s["load"] for s in warmer.stats()], [0.0, 0.0])
+        self.assertIn(self.MODEL, client.nodes.stats()[0]["loaded"])
+
+    def test_warm_up_goes_through_the_pool(self):
+        client = self.ollama()
+        slow, dead = client.nodes.nodes
+        warmer = warmup.Warmer(client, [self.MODEL], interval=0)
+        loading = threading.Thread(target=warmer.warm, args=(slow, self.MODEL))
+        loading.start()
+        time.sleep(0.1)
+        # the node is loading: a generation goes elsewhere
+        self.assertEqual(slow.active, 1)
+        self.assertIs(client.nodes.acquire(self.MODEL), dead)
+        client.nodes.release(dead, self.MODEL)
+        loading.join()
+        self.assertEqual(slow.active, 0)
+
+        self.assertIsNone(warmer.warm(dead, self.MODEL))
+        self.assertEqual((dead.active, dead.failures, dead.healthy), (0, 1, False))
+
+    def test_records_cold_and_warm_starts(self):
+        client = self.ollama()
+        cold = metrics.OLLAMA_COLD_STARTS.value(self.MODEL)
+        warm = metrics.OLLAMA_TTFT_BY_START.count(self.MODEL, "warm")
+        "".join(client.stream(self.PAYLOAD))
+        self.assertEqual(metrics.OLLAMA_COLD_STARTS.value(self.MODEL), cold + 1)
+        "".join(client.stream(self.PAYLOAD))
+        self.assertEqual(metrics.OLLAMA_COLD_STARTS.value(self.MODEL), cold + 1)
+        self.assertEqual(metrics.OLLAMA_TTFT_BY_START.count(self.MODEL, "warm"), warm + 1)
+
+    def test_keep_alive_zero_unloads(self):
+        client = self.ollama()
+        "".join(client.stream(dict(self.PAYLOAD, keep_alive=0)))
+        cold = metrics.OLLAMA_COLD_STARTS.value(self.MODEL)
+        "".join(client.stream(self.PAYLOAD))
+        self.assertEqual(metrics.OLLAMA_COLD_STARTS.value(self.MODEL), cold + 1)
@@ -0,0 +1,177 @@
+import contextvars
+import cProfile
+import os
+import re
+import threading
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+# =========================================================
+# SERVER-TIMING SPANS
+# =========================================================
+# `with span("wikipedia"):` adds the block's duration to the current
+# request's Server-Timing header. Outside a request (flight threads,
+# export workers, tests) it only reads the clock. Streamed bodies run
+# after the header is sent, so model time is not in it; see the
+# docgen_ollama_* metrics for that.
+_spans = contextvars.ContextVar("docgen_spans", default=None)
+
+
+class Span:
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((self.name, time.perf_counter() - self.start))
+
+
+def span(name):
+    return Span(name)
+
+
+def header_value(spans, total):
+    # repeated phases (two DB writes) are summed, in first-seen order
+    merged = {}
+    for name, seconds in spans:
+        merged[name] = merged.get(name, 0.0) + seconds
+    merged["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in merged.items())
+
+
+def _begin():
+    spans = []
+    return spans, _spans.set(spans), time.perf_counter()
+
+
+def _end(response, spans, token, start):
+    _spans.reset(token)
+    response["Server-Timing"] = header_value(spans, time.perf_counter() - start)
+    return response
+
+
+@sync_and_async_middleware
+def server_timing_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not settings.SERVER_TIMING:
+                return await get_response(request)
+            spans, token, start = _begin()
+            return _end(await get_response(request), spans, token, start)
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            if not settings.SERVER_TIMING:
+                return get_response(request)
+            spans, token, start = _begin()
+            return _end(get_response(request), spans, token, start)
+    return middleware
+
+
+# =========================================================
+# PROFILES (staff only)
+# =========================================================
+# A staff user adds ?profile=1 (or "X-Profile: 1") to any request and the
+# view runs under cProfile. The stats are saved in PROFILE_DIR and the
+# response names them in X-Profile-Id; fetch them from
+# /api/profiles/<id>/ (pstats file, or ?output=text). One profile runs at
+# a time; a second request is served unprofiled with "X-Profile: busy".
+# A streamed body is not included, and an async view's profile shows
+# whatever else ran on the event loop meanwhile.
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+_profile_lock = threading.Lock()
+
+
+def wants_profile(request):
+    return request.GET.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+
+
+def is_staff(request):
+    # JWT is otherwise only checked by the views, after this middleware
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except Exception:
+            return False
+        user = result[0] if result else None
+    return bool(user and user.is_staff)
+
+
+def profile_path(profile_id):
+    return os.path.join(settings.PROFILE_DIR, f"{profile_id}.prof")
+
+
+def save_profile(profiler):
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profile_id = uuid.uuid4().hex
+    profiler.dump_stats(profile_path(profile_id))
+
+    # keep the newest PROFILE_KEEP
+    names = [n for n in os.listdir(settings.PROFILE_DIR) if n.endswith(".prof")]
+    paths = sorted((os.path.join(settings.PROFILE_DIR, n) for n in names), key=os.path.getmtime)
+    for path in paths[:-settings.PROFILE_KEEP]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return profile_id
+
+
+def _attach(response, profile_id):
+    response["X-Profile-Id"] = profile_id
+    return response
+
+
+@sync_and_async_middleware
+def profile_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not wants_profile(request) or not await sync_to_async(is_staff)(request):
+                return await get_response(request)
+            if not _profile_lock.acquire(blocking=False):
+                response = await get_response(request)
+                response["X-Profile"] = "busy"
+                return response
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                try:
+                    response = await get_response(request)
+                finally:
+                    profiler.disable()
+            finally:
+                _profile_lock.release()
+            return _attach(response, await sync_to_async(save_profile)(profiler))
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            if not wants_profile(request) or not is_staff(request):
+                return get_response(request)
+            if not _profile_lock.acquire(blocking=False):
+                response = get_response(request)
+                response["X-Profile"] = "busy"
+                return response
+            profiler = cProfile.Profile()
+            try:
+                response = profiler.runcall(get_response, request)
+            finally:
+                _profile_lock.release()
+            return _attach(response, save_profile(profiler))
+    return middleware
+
@@ -1,14 +1,28 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
     register_user, 
     get_user_info, 
     connection_status,
+    metrics_endpoint,
+    download_profile,
+    ollama_nodes,
     generate_documentation, 
+    generate_documentation_async,
+    resume_generation,
+    resume_generation_async,
     get_history, 
+    get_history_detail,
+    search_history_view,
     delete_history, 
     download_pdf, 
-    download_docx
+    download_docx,
+    export_history,
+    create_export,
+    export_status,
+    export_download,
+    bulk_export_history,
 )
 
 urlpatterns = [
@@ -19,13 +33,26 @@ urlpatterns = [
     
     # System
     path("status/", connection_status),
+    path("metrics/", metrics_endpoint),
+    path("profiles/<str:profile_id>/", download_profile),
+    path("ollama/nodes/", ollama_nodes),
     
     # Core
-    path("generate/", generate_documentation),
+    path("generate/", generate_documentation_async if settings.ASYNC_GENERATION else generate_documentation),
+    path("generate/sync/", generate_documentation),
+    path("generate/<int:pk>/resume/", resume_generation_async if settings.ASYNC_GENERATION else resume_generation),
     path("history/", get_history),
+    path("history/<int:pk>/", get_history_detail),
+    path("history/search/", search_history_view),
     path("history/<int:pk>/delete/", delete_history),
+    path("history/export/", bulk_export_history),
     
     # Downloads
     path("pdf/", download_pdf),
     path("docx/", download_docx),
+    path("history/<int:pk>/pdf/", export_history, {"fmt": "pdf"}),
+    path("history/<int:pk>/docx/", export_history, {"fmt": "docx"}),
+    path("exports/", create_export),
+    path("exports/<str:job_id>/", export_status),
+    path("exports/<str:job_id>/download/", export_download),
 ]
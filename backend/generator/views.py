@@ -1,30 +1,69 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
-from django.http import StreamingHttpResponse, FileResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from django.http import StreamingHttpResponse, FileResponse, HttpResponse, JsonResponse, HttpResponseNotModified
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
-import requests
+from django.db import close_old_connections
+from django.db.models import Q
+from django.db.models.functions import Substr
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from django.utils import timezone
+from django.utils.http import parse_etags
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+from functools import partial
+from django.conf import settings
+from asgiref.sync import sync_to_async
+import base64
+import hmac
+import io
 import json
-import socket
+import os
+import pstats
 import wikipedia
 
 from .models import DocHistory
-from .pdf_generator import create_pdf
-from .docx_generator import create_docx
-
-OLLAMA_URL = "http://localhost:11434/api/generate"
+from . import render_cache
+from .connectivity import ais_online, is_online
+from .wiki_cache import cached_wikipedia
+from . import generation_cache
+from .ollama_client import get_client, OllamaBusy
+from . import flights
+from . import export_jobs
+from .export_jobs import ExportBusy
+from . import bulk_export
+from . import metrics
+from . import timing
+from .timing import span
+from .search import search_history
+from . import warmup
+from .warmup import keep_alive
+
+BUSY_MESSAGE = "Model is busy, please try again shortly."
+EXPORT_BUSY_MESSAGE = "Too many exports in progress, please try again shortly."
+MODEL_ERROR = "\nModel not responding. Ensure Ollama is running."
+# ends a stream that waited in the scheduler queue past OLLAMA_QUEUE_TIMEOUT
+BUSY_ERROR = "\n" + BUSY_MESSAGE
+PROFILE_TEXT_ROWS = 60
 
 
 # =========================================================
 # INTERNET CHECK
 # =========================================================
 def internet_available():
-    try:
-        socket.create_connection(("8.8.8.8", 53), timeout=2)
-        return True
-    except:
-        return False
+    # cached state from the background prober, see connectivity.py
+    online = is_online()
+    metrics.INTERNET_CHECKS.inc("online" if online else "offline")
+    return online
+
+
+async def ainternet_available():
+    online = await ais_online()
+    metrics.INTERNET_CHECKS.inc("online" if online else "offline")
+    return online
 
 
 # =========================================================
@@ -74,23 +113,72 @@ def detect_input_type(text: str):
 # WIKIPEDIA FETCH
 # =========================================================
 def fetch_wikipedia(query):
-    try:
-        wikipedia.set_lang("en")
-        results = wikipedia.search(query)
-        if not results:
-            return ""
-
-        page = wikipedia.page(results[0], auto_suggest=False)
-        return page.content[:6000]
-
-    except wikipedia.exceptions.DisambiguationError as e:
+    with metrics.WIKIPEDIA_SECONDS.time():
         try:
-            page = wikipedia.page(e.options[0])
+            wikipedia.set_lang("en")
+            with span("wiki-search"):
+                results = wikipedia.search(query)
+            if not results:
+                return ""
+
+            with span("wiki-page"):
+                page = wikipedia.page(results[0], auto_suggest=False)
             return page.content[:6000]
+
+        except wikipedia.exceptions.DisambiguationError as e:
+            try:
+                with span("wiki-page"):
+                    page = wikipedia.page(e.options[0])
+                return page.content[:6000]
+            except:
+                metrics.WIKIPEDIA_FAILURES.inc()
+                return ""
         except:
+            metrics.WIKIPEDIA_FAILURES.inc()
             return ""
-    except:
-        return ""
+
+
+# =========================================================
+# PROMPT / MODEL HELPERS
+# =========================================================
+def make_title(user_input):
+    return " ".join(user_input.split()[:5])[:30] or "New Doc"
+
+
+def build_prompt(user_input, web_context):
+    if web_context:
+        prompt = f"""
+You are a documentation formatter AI.
+
+IMPORTANT RULE:
+You are NOT allowed to change ANY factual values.
+Do NOT calculate. Do NOT estimate. Do NOT rephrase numbers.
+You must copy all numbers EXACTLY.
+
+VERIFIED DATA:
+{web_context}
+
+TASK:
+Convert into structured documentation using headings and bullet points.
+"""
+        warning = "online"
+    else:
+        prompt = f"""
+You are a professional documentation writer.
+
+Explain the topic in structured documentation style.
+Use headings, sections, examples and detailed explanation.
+
+Topic: {user_input}
+"""
+        warning = "offline"
+    return prompt, warning
+
+
+def select_model(user_model):
+    if user_model not in settings.OLLAMA_ALLOWED_MODELS:
+        return settings.OLLAMA_DEFAULT_MODEL
+    return user_model
 
 
 # =========================================================
@@ -115,11 +203,77 @@ def get_user_info(request):
     return Response({"username": request.user.username})
 
 
+# The sidebar list is paged newest first by (created_at, id) and carries
+# only a short preview; content comes from history/<id>/.
+HISTORY_LIST_FIELDS = ("id", "topic", "status", "created_at", "updated_at", "preview")
+
+
+def encode_cursor(row):
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    parsed = parse_datetime(created_at)
+    if parsed is None:
+        raise ValueError(cursor)
+    return parsed, int(pk)
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_history(request):
-    data = DocHistory.objects.filter(user=request.user).order_by('-created_at').values()
-    return Response(list(data))
+    try:
+        limit = min(int(request.GET.get("limit", settings.HISTORY_PAGE_SIZE)), settings.HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({"error": "Invalid limit."}, status=400)
+    limit = max(limit, 1)
+
+    rows = DocHistory.objects.filter(user=request.user)
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            created_at, pk = decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return Response({"error": "Invalid cursor."}, status=400)
+        rows = rows.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    with metrics.HISTORY_QUERY_SECONDS.time("list"):
+        rows = list(
+            rows.annotate(preview=Substr("content", 1, settings.HISTORY_PREVIEW_CHARS))
+            .order_by("-created_at", "-id")
+            .values(*HISTORY_LIST_FIELDS)[:limit + 1]
+        )
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return Response({"results": rows[:limit], "next": next_cursor})
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def search_history_view(request):
+    try:
+        limit = min(int(request.GET.get("limit", 20)), settings.HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({"error": "Invalid limit."}, status=400)
+    with metrics.HISTORY_QUERY_SECONDS.time("search"):
+        results = search_history(request.user, request.GET.get("q", ""), max(limit, 1))
+    return Response({"results": results})
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_history_detail(request, pk):
+    with metrics.HISTORY_QUERY_SECONDS.time("detail"):
+        doc_entry = get_object_or_404(DocHistory, pk=pk, user=request.user)
+    return Response({
+        "id": doc_entry.id,
+        "topic": doc_entry.topic,
+        "content": doc_entry.content,
+        "status": doc_entry.status,
+        "created_at": doc_entry.created_at,
+        "updated_at": doc_entry.updated_at,
+    })
 
 
 @api_view(["DELETE"])
@@ -135,9 +289,105 @@ def connection_status(request):
     return Response({"online": internet_available()})
 
 
+# Prometheus text; open unless METRICS_TOKEN is set, then it wants
+# "Authorization: Bearer <token>" (what a scrape config can send).
+@require_GET
+def metrics_endpoint(request):
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+# cProfile captures from ?profile=1 requests (see timing.py): the pstats
+# file for snakeviz / pstats, or ?output=text for the top functions
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def download_profile(request, profile_id):
+    path = timing.profile_path(profile_id)
+    if not timing.PROFILE_ID.match(profile_id) or not os.path.exists(path):
+        return Response({"error": "Unknown profile."}, status=404)
+    if request.GET.get("output") == "text":
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(PROFILE_TEXT_ROWS)
+        return HttpResponse(out.getvalue(), content_type="text/plain; charset=utf-8")
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=f"{profile_id}.prof")
+
+
+# per-node routing state of the Ollama pool (see nodes.py), the
+# scheduler's per-model queues and the last warm-up of each model
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def ollama_nodes(request):
+    client = get_client()
+    return Response({"nodes": client.nodes.stats(), "models": client.stats(), "warmup": warmup.stats()})
+
+
 # =========================================================
 # MAIN GENERATION
 # =========================================================
+def generation_response(body, warning=None, cache_status=None):
+    resp = StreamingHttpResponse(body, content_type="text/plain")
+    if warning:
+        resp["X-AI-Warning"] = warning
+    if cache_status:
+        resp["X-Generation-Cache"] = cache_status
+    resp["Cache-Control"] = "no-cache"
+    return resp
+
+
+def replay_stream(doc_id, text):
+    yield json.dumps({"id": doc_id}) + "\n"
+    yield from generation_cache.replay_chunks(text)
+
+
+async def areplay_stream(doc_id, text):
+    for chunk in replay_stream(doc_id, text):
+        yield chunk
+
+
+def finished_flight_result(flight):
+    """(content, status) of a finished flight, as its final write saves them."""
+    status = flights.final_status(flight)
+    return (BUSY_MESSAGE if status == DocHistory.BUSY else flight.text()), status
+
+
+def join_flight(flight, doc_entry):
+    # lost the race with the end of the flight: save our own copy
+    if not flight.attach(doc_entry.id):
+        doc_entry.content, doc_entry.status = finished_flight_result(flight)
+        doc_entry.save()
+
+
+def launch_flight(flight, doc_entry, ticket, start_driver):
+    """Subscribe the creator of a new flight and start its driver, with
+    nothing in between that can block or be cancelled. If that fails the
+    flight is retired, or identical requests would join a flight nobody
+    drives, and the model slot is given back."""
+    try:
+        # a flight without a driver can't have finished: no DB write here
+        flight.attach(doc_entry.id)
+        start_driver()
+    except BaseException:
+        flights.abort_flight(flight)
+        ticket.release()
+        raise
+
+
+def persist_generation(doc_ids, text, status, user_model, cache_key, cache_mode):
+    # runs on flight threads, outside the request cycle that normally
+    # retires persistent connections
+    close_old_connections()
+    if status == DocHistory.BUSY:
+        # never admitted, so there is no text: say why the row is empty
+        text = BUSY_MESSAGE
+    DocHistory.objects.filter(id__in=doc_ids).update(
+        content=text, status=status, updated_at=timezone.now()
+    )
+    if status == DocHistory.COMPLETE and text and cache_mode != "bypass":
+        generation_cache.store(cache_key, user_model, text)
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def generate_documentation(request):
@@ -146,109 +396,523 @@ def generate_documentation(request):
     if not user_input:
         return StreamingHttpResponse("Please enter a topic.", content_type="text/plain")
     
-    # Create DB Entry
-    title = " ".join(user_input.split()[:5])[:30] or "New Doc"
-    doc_entry = DocHistory.objects.create(user=request.user, topic=title, content="")
-
-    online = internet_available()
+    with span("connectivity"):
+        online = internet_available()
     web_context = ""
 
-    if online and (needs_real_data(user_input) or len(user_input) < 150):
-        web_context = fetch_wikipedia(user_input)
+    if needs_real_data(user_input) or len(user_input) < 150:
+        with span("wikipedia"):
+            web_context = cached_wikipedia(user_input, online, fetch_wikipedia)
 
     # ================= PROMPT =================
-    if web_context:
-        prompt = f"""
-You are a documentation formatter AI.
+    with span("prompt"):
+        prompt, warning = build_prompt(user_input, web_context)
 
-IMPORTANT RULE:
-You are NOT allowed to change ANY factual values.
-Do NOT calculate. Do NOT estimate. Do NOT rephrase numbers.
-You must copy all numbers EXACTLY.
+    # ================= MODEL SELECTION =================
+    user_model = select_model(request.data.get("model", settings.OLLAMA_DEFAULT_MODEL))
 
-VERIFIED DATA:
-{web_context}
+    payload = {
+        "model": user_model,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": keep_alive(user_model),
+    }
 
-TASK:
-Convert into structured documentation using headings and bullet points.
-"""
-        warning = "online"
+    # ================= CACHE =================
+    cache_mode = generation_cache.request_mode(request.data.get("cache"))
+    cache_key = generation_cache.generation_key(user_model, prompt)
+    with span("cache"):
+        cached = generation_cache.lookup(cache_key) if cache_mode == "use" else None
+
+    if cached is not None:
+        with span("db"):
+            doc_entry = DocHistory.objects.create(user=request.user, topic=make_title(user_input), content=cached)
+        return generation_response(replay_stream(doc_entry.id, cached), warning, "hit")
+
+    # Create DB Entry
+    with span("db"):
+        doc_entry = DocHistory.objects.create(
+            user=request.user, topic=make_title(user_input), content="", status=DocHistory.STREAMING
+        )
+
+    # ================= SINGLE FLIGHT =================
+    # identical in-flight requests follow the one already talking to Ollama;
+    # a new one takes a place in the fair-share queue and the flight waits
+    # for its slot, so the response (and its queue lines) starts right away
+    client = get_client()
+    flight = flights.get_flight(cache_key)
+    created = False
+
+    if flight is None:
+        try:
+            ticket = client.enqueue(user_model, request.user.id)
+        except OllamaBusy:
+            doc_entry.delete()
+            return Response({"error": BUSY_MESSAGE}, status=503, headers={"Retry-After": "5"})
+
+        flight, created = flights.get_or_create_flight(cache_key)
+        if not created:
+            ticket.release()
+
+    # ================= STREAM =================
+    if created:
+        def persist(doc_ids, text, status):
+            persist_generation(doc_ids, text, status, user_model, cache_key, cache_mode)
+
+        launch_flight(
+            flight, doc_entry, ticket,
+            lambda: flights.start_flight_thread(flight, client.stream(payload), persist, ticket),
+        )
     else:
-        prompt = f"""
-You are a professional documentation writer.
+        join_flight(flight, doc_entry)
 
-Explain the topic in structured documentation style.
-Use headings, sections, examples and detailed explanation.
+    body = flights.FlightStream(flight, json.dumps({"id": doc_entry.id}) + "\n", MODEL_ERROR, busy_message=BUSY_ERROR)
+    cache_status = "miss" if cache_mode == "use" else cache_mode
+    return generation_response(body, warning, cache_status if created else "coalesced")
 
-Topic: {user_input}
-"""
-        warning = "offline"
 
-    # ================= MODEL SELECTION =================
-    user_model = request.data.get("model", "qwen2.5-coder:3b")
+# =========================================================
+# ASYNC GENERATION (ASGI)
+# =========================================================
+# Same wire format as generate_documentation (id line, then raw chunks),
+# but the Ollama stream is read with httpx on the event loop so an open
+# generation does not hold a worker thread. Served on /generate/ when the
+# app runs under backend/asgi.py; the sync view stays on /generate/sync/.
+async def authenticate_jwt(request):
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except Exception:
+        return None
+    return result[0] if result else None
 
-    ALLOWED_MODELS = [
-        "phi3:latest",
-        "qwen2.5-coder:3b",
-        "qwen2.5-coder:7b"
-    ]
 
-    if user_model not in ALLOWED_MODELS:
-        user_model = "qwen2.5-coder:3b"
+def read_json_body(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        data = request.POST
+    return data if hasattr(data, "get") else {}
+
+
+@csrf_exempt
+async def generate_documentation_async(request):
+    if request.method != "POST":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    user = await authenticate_jwt(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    data = read_json_body(request)
+    user_input = str(data.get("code", "")).strip()
+
+    if not user_input:
+        return StreamingHttpResponse("Please enter a topic.", content_type="text/plain")
+
+    with span("connectivity"):
+        online = await ainternet_available()
+    web_context = ""
+
+    if needs_real_data(user_input) or len(user_input) < 150:
+        with span("wikipedia"):
+            web_context = await sync_to_async(cached_wikipedia)(user_input, online, fetch_wikipedia)
+
+    with span("prompt"):
+        prompt, warning = build_prompt(user_input, web_context)
+    user_model = select_model(data.get("model", settings.OLLAMA_DEFAULT_MODEL))
 
     payload = {
         "model": user_model,
         "prompt": prompt,
-        "stream": True
+        "stream": True,
+        "keep_alive": keep_alive(user_model),
     }
 
-    # ================= STREAM =================
-    def stream():
-        yield json.dumps({"id": doc_entry.id}) + "\n"
+    cache_mode = generation_cache.request_mode(data.get("cache"))
+    cache_key = generation_cache.generation_key(user_model, prompt)
+    cached = None
+    if cache_mode == "use":
+        with span("cache"):
+            cached = await sync_to_async(generation_cache.lookup)(cache_key)
 
-        full_text = ""
+    if cached is not None:
+        with span("db"):
+            doc_entry = await DocHistory.objects.acreate(user=user, topic=make_title(user_input), content=cached)
+        return generation_response(areplay_stream(doc_entry.id, cached), warning, "hit")
+
+    with span("db"):
+        doc_entry = await DocHistory.objects.acreate(
+            user=user, topic=make_title(user_input), content="", status=DocHistory.STREAMING
+        )
+
+    client = get_client()
+    flight = flights.get_flight(cache_key)
+    created = False
+
+    if flight is None:
         try:
-            response = requests.post(OLLAMA_URL, json=payload, stream=True, timeout=600)
+            ticket = client.enqueue(user_model, user.id)
+        except OllamaBusy:
+            await doc_entry.adelete()
+            resp = JsonResponse({"error": BUSY_MESSAGE}, status=503)
+            resp["Retry-After"] = "5"
+            return resp
+
+        flight, created = flights.get_or_create_flight(cache_key)
+        if not created:
+            ticket.release()
+
+    # no await until the driver runs: a request cancelled in between would
+    # leave a flight that identical requests join and wait on forever
+    if created:
+        def persist(doc_ids, text, status):
+            persist_generation(doc_ids, text, status, user_model, cache_key, cache_mode)
+
+        launch_flight(
+            flight, doc_entry, ticket,
+            lambda: flights.start_flight_task(flight, client.astream(payload), persist, ticket),
+        )
+    else:
+        await sync_to_async(join_flight)(flight, doc_entry)
 
-            for line in response.iter_lines():
-                if not line:
-                    continue
+    body = flights.AsyncFlightStream(flight, json.dumps({"id": doc_entry.id}) + "\n", MODEL_ERROR, busy_message=BUSY_ERROR)
+    cache_status = "miss" if cache_mode == "use" else cache_mode
+    return generation_response(body, warning, cache_status if created else "coalesced")
 
-                data = json.loads(line.decode("utf-8"))
 
-                if "response" in data:
-                    chunk = data["response"]
-                    full_text += chunk
-                    yield chunk
-            
-            if full_text:
-                doc_entry.content = full_text
-                doc_entry.save()
+# =========================================================
+# RESUME
+# =========================================================
+# Re-attach to a generation by DocHistory id. `offset` counts UTF-8 bytes
+# of document text the client already has (everything after the id line).
+# While the generation is live in this process the stream continues with
+# the live tail; otherwise the last checkpoint from the DB is returned.
+def parse_offset(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
 
-        except Exception as e:
-            yield "\nModel not responding. Ensure Ollama is running."
 
-    resp = StreamingHttpResponse(stream(), content_type="text/plain")
-    resp["X-AI-Warning"] = warning
-    resp["Cache-Control"] = "no-cache"
-    return resp
+def resume_head(doc_entry, offset, status):
+    return json.dumps({"id": doc_entry.id, "offset": offset, "status": status}) + "\n"
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def resume_generation(request, pk):
+    doc_entry = get_object_or_404(DocHistory, pk=pk, user=request.user)
+    offset = parse_offset(request.query_params.get("offset"))
+    flight = flights.flight_for_doc(doc_entry.id)
+
+    if flight is not None and flight.attach():
+        head = resume_head(doc_entry, offset, DocHistory.STREAMING)
+        return generation_response(flights.FlightStream(flight, head, MODEL_ERROR, offset, BUSY_ERROR))
+
+    if flight is not None:
+        # finished a moment ago, its final write may still be in progress
+        text, status = finished_flight_result(flight)
+    else:
+        doc_entry.refresh_from_db()
+        text, status = doc_entry.content, doc_entry.status
+    head = resume_head(doc_entry, offset, status)
+    return generation_response([head, text.encode("utf-8")[offset:]])
+
+
+@csrf_exempt
+async def resume_generation_async(request, pk):
+    if request.method != "GET":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    user = await authenticate_jwt(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    doc_entry = await DocHistory.objects.filter(pk=pk, user=user).afirst()
+    if doc_entry is None:
+        return JsonResponse({"detail": "No DocHistory matches the given query."}, status=404)
+
+    offset = parse_offset(request.GET.get("offset"))
+    flight = flights.flight_for_doc(doc_entry.id)
+
+    if flight is not None and flight.attach():
+        head = resume_head(doc_entry, offset, DocHistory.STREAMING)
+        return generation_response(flights.AsyncFlightStream(flight, head, MODEL_ERROR, offset, BUSY_ERROR))
+
+    if flight is not None:
+        text, status = finished_flight_result(flight)
+    else:
+        await doc_entry.arefresh_from_db()
+        text, status = doc_entry.content, doc_entry.status
+    head = resume_head(doc_entry, offset, status)
+    return generation_response(areplay_bytes(head, text.encode("utf-8")[offset:]))
+
+
+async def areplay_bytes(head, data):
+    yield head
+    yield data
+
 
 # =========================================================
 # DOWNLOADS
 # =========================================================
+EXPORT_FILES = {
+    "pdf": ("Doc.pdf", "application/pdf"),
+    "docx": ("Doc.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+}
+
+
+# exports go out in blocks of this size instead of FileResponse's 4 KB
+EXPORT_BLOCK_SIZE = 64 * 1024
+
+
+async def aiter_blocking(iterator):
+    """Serve a blocking iterator under ASGI chunk by chunk; Django would
+    otherwise consume the whole sync iterator before sending anything."""
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            chunk = await next_chunk(iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close:
+            await sync_to_async(close, thread_sensitive=False)()
+
+
+def export_response(f, fmt):
+    filename, content_type = EXPORT_FILES[fmt]
+    resp = FileResponse(f, as_attachment=True, filename=filename, content_type=content_type)
+    resp.block_size = EXPORT_BLOCK_SIZE
+    if settings.ASYNC_GENERATION:
+        # FileResponse's file iterator is sync, which ASGI would read into
+        # memory in one go; the headers set from `f` stay, and the
+        # response still closes it
+        resp.streaming_content = aiter_blocking(iter(partial(f.read, EXPORT_BLOCK_SIZE), b""))
+    return resp
+
+
+def renders_inline(text):
+    # small documents render inside the request, large ones become jobs
+    return len(text) <= settings.EXPORT_SYNC_MAX_CHARS
+
+
 @api_view(["POST"])
 def download_pdf(request):
     docs = request.data.get("docs", "")
     if not docs.strip():
         return Response({"error": "No documentation provided."})
 
-    pdf_buffer = create_pdf(docs)
-    pdf_buffer.seek(0)
-
-    return FileResponse(pdf_buffer, as_attachment=True, filename="Doc.pdf", content_type="application/pdf")
+    if not renders_inline(docs):
+        return start_export(request, docs, "pdf")
+    with span("render"):
+        f = render_cache.render_file(docs, "pdf")
+    return export_response(f, "pdf")
 
 
 @api_view(["POST"])
 def download_docx(request):
     docs = request.data.get("docs", "")
-    return FileResponse(create_docx(docs), as_attachment=True, filename="Doc.docx")
\ No newline at end of file
+    if not renders_inline(docs):
+        return start_export(request, docs, "docx")
+    with span("render"):
+        f = render_cache.render_file(docs, "docx")
+    return export_response(f, "docx")
+
+
+# Saved documents can be exported by id; the ETag is derived from the
+# content, so a repeat download with If-None-Match costs one DB read.
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def export_history(request, pk, fmt):
+    with span("db"):
+        doc_entry = get_object_or_404(DocHistory, pk=pk, user=request.user)
+    digest = render_cache.content_hash(doc_entry.content)
+    etag = f'"{fmt}-{digest}"'
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        resp = HttpResponseNotModified()
+    elif not renders_inline(doc_entry.content):
+        return start_export(request, doc_entry.content, fmt)
+    else:
+        with span("render"):
+            f = render_cache.render_file(doc_entry.content, fmt, digest)
+        resp = export_response(f, fmt)
+
+    resp["ETag"] = etag
+    resp["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+# =========================================================
+# EXPORT JOBS
+# =========================================================
+# POST exports/ {"docs" or "id", "format"} -> 202 + job
+# GET  exports/<id>/                        -> job status
+# GET  exports/<id>/download/               -> the file once "done"
+def export_owner(request):
+    return request.user.id if request.user.is_authenticated else None
+
+
+def start_export(request, text, fmt):
+    try:
+        job = export_jobs.submit(text, fmt, export_owner(request))
+    except ExportBusy:
+        resp = Response({"error": EXPORT_BUSY_MESSAGE}, status=503)
+        resp["Retry-After"] = "5"
+        return resp
+    return Response(job.as_dict(), status=202)
+
+
+@api_view(["POST"])
+def create_export(request):
+    fmt = request.data.get("format", "pdf")
+    if fmt not in EXPORT_FILES:
+        return Response({"error": "Unknown format."}, status=400)
+
+    pk = request.data.get("id")
+    if pk is not None:
+        if not request.user.is_authenticated:
+            return Response({"error": "Login required to export saved documents."}, status=401)
+        docs = get_object_or_404(DocHistory, pk=pk, user=request.user).content
+    else:
+        docs = request.data.get("docs", "")
+    if not docs.strip():
+        return Response({"error": "No documentation provided."}, status=400)
+
+    return start_export(request, docs, fmt)
+
+
+def owned_job(request, job_id):
+    job = export_jobs.get_job(job_id, export_owner(request))
+    if job is None:
+        return None, Response({"error": "Export not found or expired."}, status=404)
+    return job, None
+
+
+@api_view(["GET"])
+def export_status(request, job_id):
+    job, error = owned_job(request, job_id)
+    if error:
+        return error
+    return Response(job.as_dict())
+
+
+@api_view(["GET"])
+def export_download(request, job_id):
+    job, error = owned_job(request, job_id)
+    if error:
+        return error
+    if job.status != export_jobs.DONE:
+        return Response(job.as_dict(), status=409)
+
+    try:
+        f = open(job.path, "rb")
+    except OSError:
+        return Response({"error": "Export not found or expired."}, status=404)
+    return export_response(f, job.fmt)
+
+
+# =========================================================
+# BULK EXPORT
+# =========================================================
+# POST history/export/
+#   {"ids": [1, 2]} or {"from": "2026-01-01", "to": "2026-01-31"}
+#   "archive": "zip" (default) with "format": "pdf" | "docx" per file,
+#              or "pdf" for one merged PDF with a bookmark per document
+# A ZIP reads its selection in batches, so "everything" is a valid
+# selection; a merged PDF is one build and stays capped.
+BULK_ARCHIVES = {
+    "zip": ("DocGen-history.zip", "application/zip"),
+    "pdf": ("DocGen-history.pdf", "application/pdf"),
+}
+
+
+def parse_bound(value, end=False):
+    """ISO date or datetime; a bare "to" date covers that whole day."""
+    day = parse_date(value)
+    if day is not None:
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def iter_batches(docs, size):
+    """Rows of a (created_at, id)-ordered queryset, `size` at a time."""
+    rows = list(docs[:size])
+    while rows:
+        yield from rows
+        if len(rows) < size:
+            return
+        last = rows[-1]
+        rows = list(docs.filter(
+            Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, id__gt=last.id)
+        )[:size])
+
+
+def valid_ids(ids):
+    return (
+        isinstance(ids, list)
+        and 0 < len(ids) <= settings.BULK_EXPORT_MAX_DOCS
+        and all(isinstance(i, int) and not isinstance(i, bool) for i in ids)
+    )
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def bulk_export_history(request):
+    archive = request.data.get("archive", "zip")
+    fmt = request.data.get("format", "pdf")
+    if archive not in BULK_ARCHIVES or fmt not in EXPORT_FILES:
+        return Response({"error": "Unknown archive or format."}, status=400)
+
+    docs = DocHistory.objects.filter(user=request.user)
+    ids = request.data.get("ids")
+    if ids is not None:
+        if not valid_ids(ids):
+            return Response(
+                {"error": f"ids must be a list of 1 to {settings.BULK_EXPORT_MAX_DOCS} document ids."}, status=400
+            )
+        docs = docs.filter(id__in=ids)
+    try:
+        if request.data.get("from"):
+            docs = docs.filter(created_at__gte=parse_bound(request.data["from"]))
+        if request.data.get("to"):
+            docs = docs.filter(created_at__lt=parse_bound(request.data["to"], end=True))
+    except ValueError:
+        return Response({"error": "Dates must be ISO 8601."}, status=400)
+
+    docs = docs.order_by("created_at", "id")
+    if archive == "zip":
+        if not docs.exists():
+            return Response({"error": "No documents match."}, status=404)
+        body = bulk_export.iter_zip(iter_batches(docs, settings.BULK_EXPORT_MAX_DOCS), fmt)
+    else:
+        docs = list(docs[:settings.BULK_EXPORT_MAX_DOCS + 1])
+        if not docs:
+            return Response({"error": "No documents match."}, status=404)
+        if len(docs) > settings.BULK_EXPORT_MAX_DOCS:
+            return Response(
+                {"error": f"At most {settings.BULK_EXPORT_MAX_DOCS} documents per merged PDF."}, status=400
+            )
+        body = bulk_export.iter_merged_pdf(docs)
+    try:
+        body = bulk_export.started(body)
+    except ExportBusy:
+        resp = Response({"error": EXPORT_BUSY_MESSAGE}, status=503)
+        resp["Retry-After"] = "5"
+        return resp
+    if settings.ASYNC_GENERATION:
+        body = aiter_blocking(body)
+
+    filename, content_type = BULK_ARCHIVES[archive]
+    resp = StreamingHttpResponse(body, content_type=content_type)
+    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return resp
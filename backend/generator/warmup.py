@@ -0,0 +1,138 @@
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+from . import metrics
+from .ollama_client import get_client
+
+
+# =========================================================
+# MODEL WARM-UP
+# =========================================================
+# A generate request without a prompt makes Ollama load the model and
+# keep it for `keep_alive`; once loaded it returns at once. The warmer
+# sends one per model and node at startup, then every `interval` seconds
+# within the configured hours, so a model stays loaded during working
+# hours even with no traffic. Loads are recorded as
+# docgen_ollama_load_seconds{source="warmup"} next to the generations'
+# own (source="generate"), which should then stay near zero.
+def keep_alive(model):
+    """The keep_alive to send for `model`: an Ollama duration string, or
+    whole seconds as a number ("-1" keeps it loaded for good)."""
+    value = settings.OLLAMA_KEEP_ALIVE_PER_MODEL.get(model, settings.OLLAMA_KEEP_ALIVE)
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+def parse_hours(spec):
+    """Local hours as (start, end) from "8-20"; None (all day) for ""."""
+    if not spec:
+        return None
+    start, end = (int(h) for h in spec.split("-"))
+    return start, end
+
+
+def in_hours(hours, hour):
+    if hours is None:
+        return True
+    start, end = hours
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end  # wraps past midnight, e.g. 22-6
+
+
+class Warmer:
+
+    def __init__(self, client, models, interval, hours=None):
+        self.client = client
+        self.models = list(models)
+        self.interval = interval
+        self.hours = hours
+        self.last = {}   # (node, model) -> {"at", "load", "error"}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def warm(self, node, model):
+        """Load `model` on `node`; the load time in seconds, None on error
+        or if the node is full."""
+        payload = {"model": model, "keep_alive": keep_alive(model), "stream": False}
+        pool = self.client.nodes
+        # a load keeps the node busy: routing should see it like a generation
+        if not pool.hold(node, model):
+            # serving at capacity; the next round tries again
+            return None
+        try:
+            response = self.client.session.post(node.url, json=payload, timeout=self.client.timeout)
+            response.raise_for_status()
+            load = response.json().get("load_duration", 0) / 1e9
+        except (requests.RequestException, ValueError) as e:
+            pool.failed(node, model, e)
+            metrics.OLLAMA_WARMUPS.inc(model, "error")
+            self.last[node.base, model] = {"at": time.time(), "load": None, "error": str(e)}
+            return None
+        finally:
+            pool.release(node, model)
+        metrics.OLLAMA_WARMUPS.inc(model, "ok")
+        metrics.OLLAMA_LOAD_SECONDS.observe(load, model, "warmup")
+        pool.succeeded(node, model)
+        self.last[node.base, model] = {"at": time.time(), "load": load, "error": None}
+        return load
+
+    def warm_all(self):
+        for node in self.client.nodes.nodes:
+            if not node.healthy:
+                continue
+            for model in self.models:
+                # don't make a node pull a model it doesn't have
+                if node.pulled is None or model in node.pulled:
+                    self.warm(node, model)
+
+    def _run(self):
+        # know which nodes are up and what they have before the first round
+        self.client.nodes.check_all()
+        self.warm_all()
+        while self.interval > 0:
+            time.sleep(self.interval)
+            if in_hours(self.hours, time.localtime().tm_hour):
+                self.warm_all()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ollama-warmup", daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        return [
+            {"node": node, "model": model, **state}
+            for (node, model), state in sorted(self.last.items())
+        ]
+
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def get_warmer():
+    global _warmer
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = Warmer(
+                get_client(),
+                settings.OLLAMA_WARMUP_MODELS or [settings.OLLAMA_DEFAULT_MODEL],
+                settings.OLLAMA_WARMUP_INTERVAL,
+                parse_hours(settings.OLLAMA_WARMUP_HOURS),
+            )
+        return _warmer
+
+
+def stats():
+    return _warmer.stats() if _warmer is not None else []
+
+
+def start():
+    """Called by the WSGI/ASGI entry points, so management commands and
+    tests don't load models."""
+    if settings.OLLAMA_WARMUP:
+        get_warmer().start()
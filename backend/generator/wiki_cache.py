@@ -0,0 +1,95 @@
+import hashlib
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics
+from .models import WikipediaCache
+
+
+# =========================================================
+# WIKIPEDIA LOOKUP CACHE
+# =========================================================
+_stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+@metrics.collector
+def _cache_metrics():
+    return [
+        ("docgen_wikipedia_cache_events_total", "Wikipedia cache hits, stale hits, misses and evictions.",
+         "counter", {"event": name}, n)
+        for name, n in stats().items()
+    ]
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def cache_key(query):
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def _evict():
+    limit = settings.WIKIPEDIA_CACHE_MAX_ENTRIES
+    stale_ids = list(
+        WikipediaCache.objects.order_by("-last_used").values_list("id", flat=True)[limit:]
+    )
+    if stale_ids:
+        WikipediaCache.objects.filter(id__in=stale_ids).delete()
+        _count("evictions", len(stale_ids))
+
+
+def ttl(content):
+    # "no article" is stored too, but rechecked sooner
+    return settings.WIKIPEDIA_CACHE_TTL if content else settings.WIKIPEDIA_CACHE_NEGATIVE_TTL
+
+
+def cached_wikipedia(query, online, fetch):
+    """Return page content for `query`, calling `fetch(query)` only when
+    there is no fresh entry. Offline, any stored entry is served as-is.
+    Empty results are cached for WIKIPEDIA_CACHE_NEGATIVE_TTL."""
+    key = cache_key(query)
+    now = timezone.now()
+    entry = WikipediaCache.objects.filter(key=key).first()
+
+    if entry:
+        fresh = entry.fetched_at >= now - timedelta(seconds=ttl(entry.content))
+        if fresh or not online:
+            WikipediaCache.objects.filter(pk=entry.pk).update(last_used=now)
+            _count("hits" if fresh else "stale_hits")
+            return entry.content
+
+    _count("misses")
+    if not online:
+        return ""
+
+    content = fetch(query)
+    if not content and entry and entry.content:
+        # lookup failed: an expired entry is still better than nothing
+        return entry.content
+
+    WikipediaCache.objects.update_or_create(
+        key=key,
+        defaults={
+            "query": normalize_query(query),
+            "content": content,
+            "fetched_at": now,
+            "last_used": now,
+        },
+    )
+    _evict()
+    return content
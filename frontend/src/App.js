@@ -40,6 +40,7 @@ export default function App() {
   const [code, setCode] = useState("");
   const [docs, setDocs] = useState("");
   const [history, setHistory] = useState([]);
+  const [historyNext, setHistoryNext] = useState(null);
   const [currentDocId, setCurrentDocId] = useState(null);
   
   // --- UPDATED DEFAULT TO BALANCED ---
@@ -96,6 +97,7 @@ export default function App() {
     localStorage.removeItem("token");
     setToken(null);
     setHistory([]);
+    setHistoryNext(null);
     setView("home");
   };
 
@@ -117,9 +119,20 @@ export default function App() {
         signal: controller.signal
       });
 
+      if (!response.ok) {
+        const err = await response.json().catch(() => ({}));
+        setDocs(err.error || "Generation failed. Please try again.");
+        setLoading(false);
+        return;
+      }
+
       const reader = response.body.getReader();
       const decoder = new TextDecoder("utf-8");
-      let isFirstChunk = true;
+      // the stream opens with an {"id": n} line, then {"queue": n} lines
+      // while the request waits for a model slot, then the document
+      let header = "";
+      let inHeader = true;
+      let queued = false;
 
       while (true) {
         const { value, done } = await reader.read();
@@ -127,15 +140,26 @@ export default function App() {
         
         let chunk = decoder.decode(value, {stream: true});
         
-        if (isFirstChunk) {
-          const match = chunk.match(/^\{"id":\s*(\d+)\}\n/);
-          if (match) {
-            const newId = parseInt(match[1]);
-            setCurrentDocId(newId);
-            chunk = chunk.replace(match[0], "");
-            fetchHistory();
+        if (inHeader) {
+          header += chunk;
+          chunk = "";
+          let match;
+          while ((match = header.match(/^\{"(id|queue)":\s*(\d+)\}\n/))) {
+            const n = parseInt(match[2]);
+            if (match[1] === "id") {
+              setCurrentDocId(n);
+              fetchHistory();
+            } else {
+              queued = n > 0;
+              setDocs(queued ? `Waiting for the model… position ${n} in queue` : "");
+            }
+            header = header.slice(match[0].length);
           }
-          isFirstChunk = false;
+          // nothing yet, or a control line cut in half: read on
+          if (/^(\{("([iq].*)?)?)?$/.test(header)) continue;
+          inHeader = false;
+          if (queued) setDocs("");
+          chunk = header;
         }
         
         // --- SCROLL FIX START ---
@@ -170,11 +194,15 @@ export default function App() {
     setLoading(false);
   };
 
-  const loadDoc = (doc) => {
+  const loadDoc = async (doc) => {
       if (loading) return; 
-      setCurrentDocId(doc.id);
-      setDocs(doc.content);
-      setView("home");
+      // the history list only carries a preview; fetch the full text
+      try {
+        const res = await API.get(`history/${doc.id}/`);
+        setCurrentDocId(doc.id);
+        setDocs(res.data.content);
+        setView("home");
+      } catch { alert("Could not load document."); }
   };
 
   const deleteDoc = async (id, e) => {
@@ -199,12 +227,30 @@ export default function App() {
 
   // --- API ---
   const fetchUser = async () => { try { const res = await API.get("user/"); setUserData(res.data); } catch {} };
-  const fetchHistory = async () => { try { const res = await API.get("history/"); setHistory(res.data); } catch {} };
+  const fetchHistory = async () => { try { const res = await API.get("history/"); setHistory(res.data.results); setHistoryNext(res.data.next); } catch {} };
+  const loadMoreHistory = async () => {
+    if (!historyNext) return;
+    try {
+      const res = await API.get("history/", { params: { cursor: historyNext } });
+      setHistory((prev) => [...prev, ...res.data.results]);
+      setHistoryNext(res.data.next);
+    } catch {}
+  };
   const checkConnection = async () => { try { await fetch(`${API_BASE}status/`); setConnection("online"); } catch { setConnection("offline"); } };
   const downloadFile = async (type) => {
     if(!docs) return;
     try {
-      const res = await API.post(type === 'pdf' ? "pdf/" : "docx/", { docs }, { responseType: "blob" });
+      let res = await API.post(type === 'pdf' ? "pdf/" : "docx/", { docs }, { responseType: "blob" });
+      if (res.status === 202) {
+        // large document: rendered by an export job, poll until it is ready
+        let job = JSON.parse(await res.data.text());
+        while (job.status === "queued" || job.status === "running") {
+          await new Promise((r) => setTimeout(r, 1000));
+          job = (await API.get(`exports/${job.id}/`)).data;
+        }
+        if (job.status !== "done") throw new Error(job.error);
+        res = await API.get(`exports/${job.id}/download/`, { responseType: "blob" });
+      }
       const url = window.URL.createObjectURL(new Blob([res.data]));
       const link = document.createElement("a");
       link.href = url;
@@ -213,6 +259,17 @@ export default function App() {
     } catch { alert("Download failed."); }
   };
 
+  const exportHistory = async () => {
+    try {
+      const res = await API.post("history/export/", { archive: "zip", format: "pdf" }, { responseType: "blob" });
+      const url = window.URL.createObjectURL(new Blob([res.data]));
+      const link = document.createElement("a");
+      link.href = url;
+      link.download = "DocGen-history.zip";
+      link.click();
+    } catch { alert("Export failed."); }
+  };
+
   // --- COLORS ---
   const isDark = theme === "dark";
   const bgMain = isDark ? "bg-[#18181b]" : "bg-[#e5e7eb]"; 
@@ -275,6 +332,11 @@ export default function App() {
                 >
                     <PlusCircle size={18}/> New Document
                 </button>
+                {history.length > 0 && (
+                    <button onClick={exportHistory} className={`w-full mt-2 text-xs font-bold flex items-center justify-center gap-1 ${textSub} hover:text-blue-500`}>
+                        <Download size={14}/> Export all (ZIP)
+                    </button>
+                )}
             </div>
 
             {/* History List */}
@@ -294,6 +356,11 @@ export default function App() {
                         </div>
                     </div>
                 ))}
+                {historyNext && (
+                    <button onClick={loadMoreHistory} className={`w-full py-2 text-xs font-bold ${textSub} hover:text-blue-500`}>
+                        Load more
+                    </button>
+                )}
             </div>
 
             {/* User Profile */}